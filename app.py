@@ -5,7 +5,9 @@ import gi
 gi.require_versions({'Gtk': '3.0', 'GLib': '2.0', 'Gio': '2.0'})
 from gi.repository import GLib, Gio, Gtk
 
-from widgets import ParserWindow, SaveDialog, ErrorDialog, ExceptionDialog
+from widgets import (
+    ParserWindow, SaveDialog, ErrorDialog, InfoDialog, ExceptionDialog
+)
 
 import os
 import datetime
@@ -14,15 +16,22 @@ from threading import Thread
 # VHI stuff
 from vhi import (
     Parser, WeekRecord,
-    MeanFrame, PareaFrame, Plotter,
+    MeanFrame, Plotter,
+    DroughtEngine,
     Storage,
     SavingError,
+    StorageDbError,
+    ParsingError,
+    NetworkError,
     mktree,
     gtk_rgb_to_hex
 )
 
 
 class ParserApp(ParserWindow):
+    # Delay of speculative prefetch after the last change of settings
+    PREFETCH_DELAY_MS = 300
+
     def __init__(self):
         ParserWindow.__init__(self)
 
@@ -31,6 +40,13 @@ class ParserApp(ParserWindow):
         self.storage = Storage(self.parser)
         self.plt = Plotter()
 
+        # Drought classification, memoized per province and years
+        self.drought = DroughtEngine()
+
+        # Pending prefetch timeout and futures of the last prefetch
+        self._prefetch_source = None
+        self._prefetch_futures = []
+
         # Connect extra signals
         self.connect("show", self._on_window_show)
 
@@ -38,6 +54,15 @@ class ParserApp(ParserWindow):
                                            self._on_use_dark_theme_state_set)
 
         self.plot_btn.connect("clicked", self._on_plot_btn_clicked)
+
+        # Speculative prefetch of records for selected settings
+        for widget in (self.province_combo, self.year1_combo,
+                       self.year2_combo):
+            widget.connect("changed", self._on_selection_changed)
+        self.show_drought_years_chkbtn.connect("toggled",
+                                               self._on_selection_changed)
+        self.compare_provinces_chkbtn.connect("toggled",
+                                              self._on_compare_toggled)
         self.save_btn.connect("clicked", self._on_save_btn_clicked)
         self.clear_canvas_btn.connect("clicked",
                                       self._on_clear_canvas_btn_clicked)
@@ -65,17 +90,88 @@ class ParserApp(ParserWindow):
 
     def _on_window_show(self, win):
         def init_job(self):
-            self.listbox1.set_sensitive(False)
-            self._fill_combos()
-            self.listbox1.set_sensitive(True)
+            # Get available provinces and years, widgets are filled by main
+            # loop, since Gtk is not thread-safe
+            self.parser.parse_selectors()
+            GLib.idle_add(self._fill_combos)
 
+        self.listbox1.set_sensitive(False)
         Thread(target=init_job, args=(self, )).start()
 
-    def _on_plot_btn_clicked(self, btn):
-        # Taking settings from GUI
+    def _get_selection(self):
         province = self.province_combo.get_active_text()
-        years = (int(self.year1_combo.get_active_text()),
-                 int(self.year2_combo.get_active_text()))
+        year1 = self.year1_combo.get_active_text()
+        year2 = self.year2_combo.get_active_text()
+
+        if not (province and year1 and year2):
+            return None
+        return (province, (int(year1), int(year2)))
+
+    def _get_types(self):
+        if self.show_drought_years_chkbtn.get_active():
+            return (Parser.TYPE_MEAN, Parser.TYPE_PAREA)
+        return (Parser.TYPE_MEAN, )
+
+    def _on_selection_changed(self, widget):
+        # Prefetch starts when settings stop changing, so scrolling through
+        # combos does not queue requests for every passed item
+        if self._prefetch_source is not None:
+            GLib.source_remove(self._prefetch_source)
+        self._prefetch_source = GLib.timeout_add(self.PREFETCH_DELAY_MS,
+                                                 self._prefetch)
+
+    def _prefetch(self):
+        # Start fetching before plot button is clicked, plot handler joins
+        # the same fetches. Errors are reported by plot handler
+        self._prefetch_source = None
+
+        # Fetches for previous settings, which have not started yet,
+        # would only delay the current ones
+        for fut in self._prefetch_futures:
+            fut.cancel()
+        self._prefetch_futures = []
+
+        # Comparison fetches many provinces at once, speculative fetches
+        # of them would occupy rate-limited pool for nothing
+        if self.compare_provinces_chkbtn.get_active():
+            return False
+
+        selection = self._get_selection()
+        if not selection or selection[1][0] > selection[1][1]:
+            return False
+
+        self._prefetch_futures.extend(self.parser.prefetch(
+            *selection, self._get_types()).values())
+
+        # Run once
+        return False
+
+    def _on_compare_toggled(self, chkbtn):
+        compare = chkbtn.get_active()
+
+        # Extremums and droughts are plotted for one province only
+        self.show_extremums_chkbtn.set_sensitive(not compare)
+        self.show_drought_years_chkbtn.set_sensitive(not compare)
+        self.province_combo.set_sensitive(not compare)
+
+        self.compare_provinces_row.set_visible(compare)
+
+        self._on_selection_changed(chkbtn)
+
+    def _get_compare_provinces(self):
+        # Selected provinces in list order, all provinces if none selected
+        rows = sorted(self.compare_provinces_listbox.get_selected_rows(),
+                      key=lambda row: row.get_index())
+        if not rows:
+            return list(self.parser.provinces)
+        return [row.get_child().get_text() for row in rows]
+
+    def _on_plot_btn_clicked(self, btn):
+        # Taking settings from GUI, nothing to plot until combos are filled
+        selection = self._get_selection()
+        if selection is None:
+            return
+        province, years = selection
 
         # Get CheckButtons state
         show_extremums = self.show_extremums_chkbtn.get_active()
@@ -88,46 +184,80 @@ class ParserApp(ParserWindow):
         self.plt.ax.set_xlim(datetime.date.fromisocalendar(years[0]-1, 1, 1),
                              datetime.date.fromisocalendar(years[1]+1, 1, 1))
 
-        # Get VHI Mean/Parea data
-        self.mean_records = self.parser.parse_mean(province, years)
+        if self.compare_provinces_chkbtn.get_active():
+            self._plot_comparison(years, show_ranges)
+            return
+
+        # Get VHI Mean/Parea data, both types are fetched concurrently
+        futures = self.parser.prefetch(province, years, self._get_types())
+        try:
+            self.mean_records = futures[Parser.TYPE_MEAN].result()
+            if show_drought_years:
+                self.parea_records = futures[Parser.TYPE_PAREA].result()
+        except (ParsingError, NetworkError) as e:
+            ExceptionDialog(self, e)
+            return
 
         # Plot Mean data
         mdf = MeanFrame(self.mean_records)
-        self.plt.plot(mdf["Mean"], show_ranges=show_ranges, label=province)
+        self.plt.plot(MeanFrame.vhi(mdf), show_ranges=show_ranges,
+                      label=province, draw=False)
 
         if show_extremums:
-            extr = MeanFrame.get_extremums(mdf)
-            self.plt.plot(extr[0], marker='o', show_ranges=show_ranges)
-            self.plt.plot(extr[1], marker='o', show_ranges=show_ranges)
+            extr = self.parser.extremum_index(province).extremums(years)
+            self.plt.plot(extr[0], marker='o', show_ranges=show_ranges,
+                          draw=False)
+            self.plt.plot(extr[1], marker='o', show_ranges=show_ranges,
+                          draw=False)
 
         if show_drought_years:
-            self.parea_records = self.parser.parse_parea(province, years)
-
-            # For calculating drought years
-            pdf = PareaFrame(self.parea_records)
+            drought = self.drought.analyze(self.parea_records, years)
+            vhi = MeanFrame.vhi(mdf)
 
             # Plot drought years
-            drought = PareaFrame.get_drought_years(pdf, mdf)
-            self.plt.plot(drought["Mean"], show_ranges=show_ranges,
+            self.plt.plot(vhi[vhi.index.isin(drought.moderate_dates)],
+                          show_ranges=show_ranges,
                           label=province + ": Помірні посухи",
-                          color="orange")
+                          color="orange", draw=False)
 
             # Plot extreme drought years
-            extreme_drought = PareaFrame.get_extreme_drought_years(pdf, mdf)
-            self.plt.plot(extreme_drought["Mean"], show_ranges=show_ranges,
+            self.plt.plot(vhi[vhi.index.isin(drought.extreme_dates)],
+                          show_ranges=show_ranges,
                           label=province + ": Екстримальні посухи",
-                          color="red")
+                          color="red", draw=False)
+
+        # All series are drawn at once
+        self.plt.refresh()
+
+    def _plot_comparison(self, years, show_ranges: bool):
+        # VHI of selected provinces, fetched concurrently, plotted by one
+        # draw
+        try:
+            records = self.parser.parse_many(self._get_compare_provinces(),
+                                             years)
+        except (ParsingError, NetworkError) as e:
+            ExceptionDialog(self, e)
+            return
+
+        self.plt.plot_frame(MeanFrame.compare(records),
+                            show_ranges=show_ranges)
 
     def _on_save_btn_clicked(self, btn):
         fp, append = SaveDialog(self).select()
         if not fp:
             ErrorDialog(self, "Failed to save data",
                         "Output file was not selected")
+            return
 
         try:
-            self.storage.save_to(fp, append)
-        except SavingError as e:
+            paths = self.storage.save_to(fp, append)
+        except (SavingError, StorageDbError) as e:
             ExceptionDialog(self, e)
+            return
+
+        # Records of csv are saved to file per type
+        if paths != [fp]:
+            InfoDialog(self, "Data saved", "\n".join(paths))
 
     def _on_clear_canvas_btn_clicked(self, btn):
         self.plt.clear()
@@ -153,14 +283,14 @@ class ParserApp(ParserWindow):
     def _fill_combos(self):
         r"""
         Fills Comboboxes with data such as Province and available years range
+        parsed by init job, runs in main loop
         """
 
-        # Get available provinces and years
-        self.parser.parse_selectors()
-
-        # Fill Province selection Combo
+        # Fill Province selection Combo and list of compared provinces
         for prov in self.parser.provinces:
             self.province_combo.append_text(prov)
+            self.compare_provinces_listbox.add(
+                Gtk.Label(label=prov, xalign=0, visible=True))
         self.province_combo.set_active(0)
 
         # Fill years range combos
@@ -172,6 +302,11 @@ class ParserApp(ParserWindow):
         self.year1_combo.set_active(0)
         self.year2_combo.set_active(len(self.parser.years) - 1)
 
+        self.listbox1.set_sensitive(True)
+
+        # Called once by GLib.idle_add()
+        return False
+
     def run(self):
         self.show()
         Gtk.main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vhi import Parser, Storage, WeekRecordBatch  # noqa: E402
+
+
+def make_batch(province, years, vhi_type=Parser.TYPE_MEAN, width=5,
+               weeks=52, offset=0.0):
+    r"""
+    Batch with every week of years of one province, values are derived
+    from year and week, so they could be checked after round trips
+    """
+
+    year = np.repeat(np.arange(years[0], years[1] + 1), weeks)
+    week = np.tile(np.arange(1, weeks + 1), years[1] - years[0] + 1)
+    data = (year[:, None] % 100 + week[:, None] / 100.0 + offset +
+            np.arange(width)[None, :]).astype(np.float32)
+
+    return WeekRecordBatch(np.full(len(year), province), year, week, data,
+                           vhi_type)
+
+
+class NoaaStub:
+    r"""
+    Local HTTP server answering like NOAA endpoints used by Parser
+
+    Mean rows have VHI derived from year and week, VHI of week 5 of every
+    third year is -1. Statuses in failures are answered first, one per
+    request, with Retry-After of 0 seconds. Data of fail_provinces is
+    answered with 503
+    """
+
+    PROVINCES = 3
+    YEARS = (1995, 2005)
+
+    def __init__(self):
+        self.requests = []
+        self.failures = []
+        self.fail_provinces = set()
+        self.truncate = False
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _NoaaHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05, ), daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def vhi(year, week):
+        return -1.0 if week == 5 and year % 3 == 0 else \
+            round(year % 100 + week / 100.0, 2)
+
+    @classmethod
+    def rows(cls, province, years, vhi_type):
+        rows = []
+        for year in range(years[0], years[1] + 1):
+            for week in range(1, 53):
+                if vhi_type == Parser.TYPE_MEAN:
+                    values = [0.05, 260.0 + province, 40.0, 30.0,
+                              cls.vhi(year, week)]
+                else:
+                    values = [-1.0 if week == 7 else 0.0] + \
+                        [round(i * 5 + week / 100.0, 2) for i in range(20)]
+                rows.append("%d,%3d," % (year, week) +
+                            ", ".join("%.2f" % v for v in values) + ",")
+        return "\n".join(rows)
+
+    def body(self, path, query):
+        if "browse" in path:
+            return ("<select id='Province'>" + "".join(
+                "<option>%d: Province %d</option>" % (i, i)
+                for i in range(1, self.PROVINCES + 1)) +
+                "</select><select id='Year1'><option>Year</option>" +
+                "".join("<option>%d</option>" % y for y in
+                        range(self.YEARS[0], self.YEARS[1] + 1)) +
+                "</select>")
+
+        body = "<html><body><tt><pre>" + self.rows(
+            int(query["provinceID"][0]),
+            (int(query["year1"][0]), int(query["year2"][0])),
+            query["type"][0]) + "\n</pre></tt></body></html>"
+        return body[:len(body) // 2] if self.truncate else body
+
+
+class _NoaaHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.requests.append(self.path)
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        failed = "provinceID" in query and \
+            int(query["provinceID"][0]) in stub.fail_provinces
+        if stub.failures or failed:
+            self.send_response(stub.failures.pop(0) if stub.failures
+                               else 503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = stub.body(url.path, query).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def noaa():
+    stub = NoaaStub()
+    yield stub
+    stub.close()
+
+
+def stub_parser(noaa, **kwargs):
+    r"""
+    Parser, which requests stub instead of NOAA, without disk cache
+    unless cache_dir is passed
+    """
+
+    kwargs.setdefault("cache_dir", "")
+    parser = Parser(**kwargs)
+    parser.BROWSER_URN = noaa.url + "/browse.php"
+    parser.RAW_DATA_URN = noaa.url + "/get_TS_admin.php"
+    return parser
+
+
+@pytest.fixture
+def parser(noaa):
+    parser = stub_parser(noaa)
+    yield parser
+    parser.close()
+
+
+@pytest.fixture
+def storage():
+    parser = Parser(cache_dir="")
+    yield Storage(parser)
+    parser.close()
@@ -0,0 +1,178 @@
+import os
+import time
+import numpy as np
+import pytest
+
+from vhi import RangeCache, ResponseCache, Parser
+from vhi.util import missing_intervals, merge_intervals
+
+from conftest import make_batch, stub_parser
+
+
+KEY = (Parser.TYPE_MEAN, 5)
+
+
+def test_missing_intervals():
+    assert missing_intervals([], (2000, 2010)) == [(2000, 2010)]
+    assert missing_intervals([(2000, 2010)], (2003, 2005)) == []
+    assert missing_intervals([(2003, 2004), (2007, 2008)], (2000, 2010)) \
+        == [(2000, 2002), (2005, 2006), (2009, 2010)]
+
+
+def test_merge_intervals_joins_adjacent_years():
+    assert merge_intervals([(2005, 2010), (2000, 2004), (2012, 2013)]) \
+        == [(2000, 2010), (2012, 2013)]
+
+
+def test_range_cache_fetches_only_gaps():
+    cache = RangeCache()
+    assert cache.missing(KEY, (2000, 2005)) == [(2000, 2005)]
+
+    cache.add(KEY, (2000, 2005), make_batch(5, (2000, 2005)))
+    assert cache.missing(KEY, (2002, 2004)) == []
+    assert cache.missing(KEY, (1998, 2008)) == [(1998, 1999), (2006, 2008)]
+
+    cache.add(KEY, (2006, 2008), make_batch(5, (2006, 2008)))
+    assert cache.coverage(KEY) == [(2000, 2008)]
+
+
+def test_range_cache_slice_is_sorted_and_bounded():
+    cache = RangeCache()
+    cache.add(KEY, (2006, 2008), make_batch(5, (2006, 2008)))
+    cache.add(KEY, (2000, 2005), make_batch(5, (2000, 2005)))
+
+    batch = cache.slice(KEY, (2004, 2007))
+    assert batch.year.min() == 2004 and batch.year.max() == 2007
+    assert np.all(np.diff(batch.keys()) > 0)
+    assert len(batch) == 4 * 52
+
+
+def test_range_cache_overlapping_add_replaces_weeks():
+    cache = RangeCache()
+    cache.add(KEY, (2000, 2002), make_batch(5, (2000, 2002)))
+    cache.add(KEY, (2002, 2003), make_batch(5, (2002, 2003), offset=0.5))
+
+    batch = cache.slice(KEY, (2000, 2003))
+    assert len(batch) == 4 * 52
+    np.testing.assert_allclose(batch.between(2002, 2003).data,
+                               make_batch(5, (2002, 2003), offset=0.5).data)
+
+
+def test_range_cache_invalidate():
+    cache = RangeCache()
+    cache.add(KEY, (2000, 2001), make_batch(5, (2000, 2001)))
+    cache.add((Parser.TYPE_MEAN, 6), (2000, 2001),
+              make_batch(6, (2000, 2001)))
+
+    cache.invalidate(lambda key: key[1] == 5)
+    assert cache.missing(KEY, (2000, 2001)) == [(2000, 2001)]
+    with pytest.raises(KeyError):
+        cache.slice(KEY, (2000, 2001))
+    assert list(cache.keys()) == [(Parser.TYPE_MEAN, 6)]
+
+
+def test_range_cache_evicts_least_recently_used():
+    cache = RangeCache(max_entries=2)
+    for province in (1, 2, 3):
+        cache.add((Parser.TYPE_MEAN, province), (2000, 2001),
+                  make_batch(province, (2000, 2001)))
+
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.missing((Parser.TYPE_MEAN, 1), (2000, 2001)) \
+        == [(2000, 2001)]
+    assert cache.missing((Parser.TYPE_MEAN, 3), (2000, 2001)) == []
+
+
+def test_range_cache_keeps_pinned_keys():
+    cache = RangeCache(max_entries=1)
+
+    with cache.pinned(KEY):
+        cache.add(KEY, (2000, 2001), make_batch(5, (2000, 2001)))
+        for province in (1, 2, 3):
+            cache.add((Parser.TYPE_MEAN, province), (2000, 2001),
+                      make_batch(province, (2000, 2001)))
+
+        assert len(cache.slice(KEY, (2000, 2001))) == 2 * 52
+
+    # Limits are restored once key is unpinned, sliced key is the newest
+    assert len(cache) == 1 and cache.coverage(KEY) == [(2000, 2001)]
+
+    cache.add((Parser.TYPE_MEAN, 1), (2000, 2001),
+              make_batch(1, (2000, 2001)))
+    with pytest.raises(KeyError):
+        cache.slice(KEY, (2000, 2001))
+
+
+def test_parse_under_eviction_pressure(noaa, monkeypatch):
+    slice_ = RangeCache.slice
+
+    def slow_slice(self, key, years):
+        # Let other threads add records between fetch and slice
+        time.sleep(0.005)
+        return slice_(self, key, years)
+
+    monkeypatch.setattr(RangeCache, "slice", slow_slice)
+
+    parser = stub_parser(noaa, memo_max_entries=2, rate_limit=None)
+    provinces = ["%d: Province %d" % (i, i) for i in range(1, 13)]
+    try:
+        results = list(parser.fetch_many(provinces, (2000, 2001)))
+    finally:
+        parser.close()
+
+    assert len(results) == 2 * len(provinces)
+    for (_, vhi_type), batch in results:
+        assert len(batch) == (2 * 52 - 1 if vhi_type == Parser.TYPE_MEAN
+                              else 2 * 51)
+
+
+def test_range_cache_size_limit():
+    batch = make_batch(1, (2000, 2001))
+    cache = RangeCache(max_size=batch.nbytes * 2)
+    for province in (1, 2, 3, 4):
+        cache.add((Parser.TYPE_MEAN, province), (2000, 2001),
+                  make_batch(province, (2000, 2001)))
+
+    assert len(cache) == 2
+
+
+def test_parser_reads_ranges_cached_on_disk(tmp_path, noaa):
+    province = "1: Province 1"
+
+    parser = stub_parser(noaa, cache_dir=str(tmp_path))
+    try:
+        parser.parse_mean(province, (2000, 2001))
+        parser.parse_mean(province, (2002, 2003))
+    finally:
+        parser.close()
+    assert len(noaa.requests) == 2
+
+    # Range fetched in pieces before restart is not requested again
+    parser = stub_parser(noaa, cache_dir=str(tmp_path))
+    try:
+        batch = parser.parse_mean(province, (2000, 2003))
+    finally:
+        parser.close()
+
+    assert len(noaa.requests) == 2
+    assert len(batch) == 4 * 52 - 1
+
+
+def test_response_cache_mismatch_is_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = ("UKR", 1, 2000, 2001, Parser.TYPE_MEAN)
+
+    cache.put(key, "old body")
+    body_fp, meta_fp = cache._paths(key)
+
+    # Concurrent put() has replaced body, but not metadata yet
+    with open(body_fp, "w") as f:
+        f.write("new body")
+
+    assert cache.get(key) is None
+    assert os.path.exists(body_fp) and os.path.exists(meta_fp)
+
+    cache.put(key, "new body", etag="x")
+    entry = cache.get(key)
+    assert entry.body == "new body" and entry.etag == "x"
+    assert cache.keys() == [key]
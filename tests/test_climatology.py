@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from vhi import Parser, WeekRecordBatch
+from vhi.climatology import Climatology
+from vhi.error import SavingError
+
+from conftest import make_batch
+
+
+def random_batch(province, years, seed):
+    batch = make_batch(province, years)
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0, 100, batch.data.shape).astype(np.float32)
+
+    return WeekRecordBatch(batch.province, batch.year, batch.week, data,
+                           batch.vhi_type)
+
+
+def expected_normal(batches):
+    frame = pd.concat([pd.DataFrame({
+        "province": b.province, "week": b.week,
+        "value": b.column("VHI").astype(np.float64)}) for b in batches])
+    return frame.groupby(["province", "week"])["value"].agg(["mean", "std"])
+
+
+@pytest.fixture
+def batches():
+    return [random_batch(1, (2000, 2009), 1), random_batch(7, (2003, 2012), 2)]
+
+
+def test_normal_matches_groupby(batches):
+    clim = Climatology.from_batches(batches)
+    expected = expected_normal(batches)
+
+    for province in (1, 7):
+        normal = clim.normal(province)
+        exp = expected.loc[province]
+
+        assert (normal["count"].iloc[:52] == 10).all()
+        assert normal["count"].iloc[52] == 0
+        np.testing.assert_allclose(normal["mean"].iloc[:52], exp["mean"],
+                                   rtol=1e-5)
+        np.testing.assert_allclose(normal["std"].iloc[:52], exp["std"],
+                                   rtol=1e-5)
+
+
+def test_anomaly_and_zscore(batches):
+    clim = Climatology.from_batches(batches)
+    expected = expected_normal(batches)
+
+    records = batches[1].between(2010, 2010)
+    exp = expected.loc[7]
+    deviation = records.column("VHI") - exp["mean"].to_numpy()
+
+    np.testing.assert_allclose(clim.anomaly(records), deviation, rtol=1e-5,
+                               atol=1e-4)
+    np.testing.assert_allclose(clim.anomaly(records, zscore=True),
+                               deviation / exp["std"].to_numpy(),
+                               rtol=1e-5, atol=1e-5)
+
+    series = clim.anomaly_series(records)
+    assert len(series) == len(records) and series.name == "VHI"
+
+
+def test_unknown_province_is_nan(batches):
+    clim = Climatology.from_batches(batches)
+
+    assert np.isnan(clim.anomaly(random_batch(4, (2000, 2000), 3))).all()
+    assert np.isnan(clim.anomaly(random_batch(9, (2000, 2000), 3))).all()
+    with pytest.raises(KeyError):
+        clim.normal(4)
+
+
+def test_parea_records_are_skipped(batches):
+    parea = make_batch(3, (2000, 2001), Parser.TYPE_PAREA, width=21)
+    clim = Climatology.from_batches(batches + [parea])
+
+    assert clim.provinces.tolist() == [1, 7]
+
+
+def test_incremental_update_equals_rebuild(batches):
+    extra = [random_batch(1, (1995, 1999), 4),
+             random_batch(3, (2000, 2004), 5),
+             random_batch(7, (2010, 2011), 6)]
+
+    clim = Climatology.from_batches(batches)
+    clim.update(extra)
+    # Replaced weeks of 2010-2011 of province 7 are counted once
+    full = Climatology.from_batches([
+        batches[0], batches[1].between(2003, 2009),
+        batches[1].between(2012, 2012)] + extra)
+
+    assert clim.provinces.tolist() == full.provinces.tolist()
+    assert clim.first_year == full.first_year
+    for attr in ("values", "mean", "std", "count", "percentiles"):
+        np.testing.assert_allclose(getattr(clim, attr), getattr(full, attr),
+                                   rtol=1e-6, equal_nan=True)
+
+
+def test_save_load_round_trip(tmp_path, batches):
+    fp = str(tmp_path / "clim.npz")
+    clim = Climatology.from_batches(batches)
+    clim.save(fp)
+
+    loaded = Climatology.open(fp)
+    assert loaded.label == clim.label and loaded.first_year == clim.first_year
+    np.testing.assert_array_equal(loaded.provinces, clim.provinces)
+    for attr in ("mean", "std", "count", "percentiles"):
+        np.testing.assert_array_equal(getattr(loaded, attr),
+                                      getattr(clim, attr))
+
+    assert not len(Climatology.open(str(tmp_path / "missing.npz")).provinces)
+
+
+@pytest.mark.parametrize("ext", [".csv", ".csv.gz"])
+def test_storage_bootstrap_csv_equals_sqlite(tmp_path, storage, batches, ext):
+    parea = make_batch(1, (2000, 2001), Parser.TYPE_PAREA, width=21)
+    new = [random_batch(1, (2010, 2010), 8)]
+
+    clims = []
+    for name in ("vhi.sqlite", "vhi" + ext):
+        fp = str(tmp_path / name)
+        storage.save_to(fp, False, batches + [parea])
+        clims.append(storage.update_climatology(fp, new))
+
+    db, csv = clims
+    assert csv.provinces.tolist() == db.provinces.tolist() == [1, 7]
+    np.testing.assert_array_equal(csv.count, db.count)
+    assert (db.count[0, :52] == 11).all()
+    for attr in ("mean", "std", "percentiles"):
+        np.testing.assert_allclose(getattr(csv, attr), getattr(db, attr),
+                                   rtol=1e-4, equal_nan=True)
+
+
+def test_storage_bootstrap_unsupported_format(tmp_path, storage, batches):
+    fp = str(tmp_path / "vhi.cube")
+    storage.save_to(fp, False, batches)
+
+    with pytest.raises(SavingError):
+        storage.update_climatology(fp, [])
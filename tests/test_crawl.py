@@ -0,0 +1,87 @@
+import numpy as np
+
+from vhi import Parser
+from vhi.crawl import Crawler, CrawlUnit, Journal
+
+from conftest import stub_parser
+
+
+YEARS = (2000, 2003)
+
+
+def data_requests(noaa):
+    return [path for path in noaa.requests if "get_TS_admin" in path]
+
+
+def test_journal_reload(tmp_path):
+    fp = str(tmp_path / "vhi.journal")
+
+    journal = Journal(fp)
+    journal.commit(Parser.TYPE_MEAN, 1, (2000, 2001))
+    journal.commit(Parser.TYPE_MEAN, 1, (2002, 2003))
+    journal.commit(Parser.TYPE_PAREA, 1, (2000, 2001))
+
+    # Entry cut by crash is ignored
+    with open(fp, "a") as f:
+        f.write('{"type": "Mean", "province": 2, "ye')
+
+    journal = Journal(fp)
+    assert journal.missing(Parser.TYPE_MEAN, 1, (1999, 2004)) \
+        == [(1999, 1999), (2004, 2004)]
+    assert journal.missing(Parser.TYPE_PAREA, 1, YEARS) == [(2002, 2003)]
+    assert journal.missing(Parser.TYPE_MEAN, 2, YEARS) == [YEARS]
+
+
+def test_units_skip_journaled(tmp_path, parser):
+    crawler = Crawler(str(tmp_path / "vhi.sqlite"), parser=parser,
+                      unit_years=3)
+    crawler.journal.commit(Parser.TYPE_MEAN, 1, (2000, 2001))
+
+    units, skipped = crawler.units(["1: Province 1"], (2000, 2006),
+                                   [Parser.TYPE_MEAN])
+    assert skipped == 0
+    assert units == [CrawlUnit(Parser.TYPE_MEAN, "1: Province 1", years)
+                     for years in ((2002, 2004), (2005, 2006))]
+
+
+def test_resume_after_failures(tmp_path, noaa):
+    fp = str(tmp_path / "vhi.sqlite")
+    noaa.fail_provinces = {2}
+
+    parser = stub_parser(noaa)
+    try:
+        stats = Crawler(fp, parser=parser, unit_years=2, retries=0).run(
+            provinces=[1, 2], years=YEARS)
+    finally:
+        parser.close()
+
+    assert stats.done == 4 and stats.skipped == 0
+    assert sorted(u.years for u in stats.failed) == \
+        [(2000, 2001)] * 2 + [(2002, 2003)] * 2
+    assert {u.province for u in stats.failed} == {"2: Province 2"}
+
+    # Restarted crawl fetches only units failed before
+    noaa.fail_provinces = set()
+    del noaa.requests[:]
+
+    parser = stub_parser(noaa)
+    try:
+        crawler = Crawler(fp, parser=parser, unit_years=2, retries=0)
+        stats = crawler.run(provinces=[1, 2], years=YEARS)
+
+        assert stats == (4, 2, [])
+        assert len(data_requests(noaa)) == 4
+        assert all("provinceID=2" in path for path in data_requests(noaa))
+
+        for province in (1, 2):
+            batch = crawler.storage.load_records(fp, Parser.TYPE_MEAN,
+                                                 provinces=[province])
+            assert len(batch) == 4 * 52 - 1
+            assert np.unique(batch.year).tolist() == list(range(2000, 2004))
+
+        # Completed crawl does nothing
+        del noaa.requests[:]
+        assert crawler.run(provinces=[1, 2], years=YEARS) == (0, 4, [])
+        assert not data_requests(noaa)
+    finally:
+        parser.close()
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from vhi import Parser, VhiCube, WeekRecordBatch
+from vhi.util import iso_week_monday
+
+from conftest import make_batch
+
+
+@pytest.fixture
+def batches():
+    return [make_batch(1, (2000, 2003)),
+            # 2004 has 53 ISO weeks
+            make_batch(1, (2004, 2004), weeks=53),
+            make_batch(4, (2002, 2002)),
+            make_batch(1, (2001, 2002), Parser.TYPE_PAREA, width=21)]
+
+
+def by_key(batches):
+    ret = {}
+    for batch in batches:
+        key = (batch.vhi_type, int(batch.province[0]))
+        ret[key] = ret[key].merge(batch) if key in ret else batch
+    return ret
+
+
+def test_window(tmp_path, batches):
+    fp = str(tmp_path / "vhi.cube")
+    VhiCube.build(fp, batches)
+    cube = VhiCube(fp)
+
+    assert cube.provinces.tolist() == [1, 4]
+
+    window = cube.window(1, (2002, 2003), Parser.TYPE_MEAN)
+    assert window.shape == (2 * 52, 5)
+    np.testing.assert_array_equal(window,
+                                  make_batch(1, (2002, 2003)).data)
+
+    # Weeks without records are NaN
+    window = cube.window(4, (2001, 2002), Parser.TYPE_MEAN)
+    assert np.isnan(window[:52]).all()
+    np.testing.assert_array_equal(window[52:],
+                                  make_batch(4, (2002, 2002)).data)
+
+    window = cube.window(1, (2000, 2001), Parser.TYPE_PAREA)
+    assert window.shape == (2 * 52, 21) and np.isnan(window[:52]).all()
+
+    dates = cube.dates((2004, 2004))
+    assert len(dates) == 53
+    np.testing.assert_array_equal(
+        dates, iso_week_monday(np.full(53, 2004), np.arange(1, 54)))
+
+
+def test_window_outside_cube(tmp_path, batches):
+    fp = str(tmp_path / "vhi.cube")
+    VhiCube.build(fp, batches)
+    cube = VhiCube(fp)
+
+    assert cube.window(1, (1990, 1995), Parser.TYPE_MEAN).shape == (0, 5)
+    with pytest.raises(KeyError):
+        cube.window(2, (2000, 2001), Parser.TYPE_MEAN)
+
+
+def test_round_trip(tmp_path, batches):
+    fp = str(tmp_path / "vhi.cube")
+    VhiCube.build(fp, batches)
+
+    expected = by_key(batches)
+    loaded = by_key(VhiCube(fp).to_batches())
+
+    assert sorted(loaded) == sorted(expected)
+    for key, batch in expected.items():
+        np.testing.assert_array_equal(loaded[key].keys(), batch.keys())
+        np.testing.assert_array_equal(loaded[key].data, batch.data)
+
+
+def test_round_trip_legacy_batch(tmp_path):
+    fp = str(tmp_path / "vhi.cube")
+    # Mean saved by older versions has VHI column only
+    legacy = WeekRecordBatch(np.full(52, 2), np.full(52, 2000),
+                             np.arange(1, 53),
+                             make_batch(2, (2000, 2000)).data[:, -1:],
+                             Parser.TYPE_MEAN)
+    VhiCube.build(fp, [make_batch(1, (2000, 2000)), legacy])
+
+    loaded = by_key(VhiCube(fp).to_batches())[(Parser.TYPE_MEAN, 2)]
+    assert loaded.width == 5 and np.isnan(loaded.data[:, :-1]).all()
+    np.testing.assert_array_equal(loaded.column("VHI"), legacy.data[:, 0])
+
+
+def test_empty_cube(tmp_path):
+    fp = str(tmp_path / "empty.cube")
+    VhiCube.build(fp, [WeekRecordBatch.empty(Parser.TYPE_MEAN)])
+
+    assert VhiCube(fp).to_batches() == []
+
+
+def test_not_a_cube(tmp_path):
+    fp = tmp_path / "vhi.cube"
+    fp.write_bytes(b"not a cube" * 10)
+
+    with pytest.raises(ValueError):
+        VhiCube(str(fp))
+
+
+def test_storage_append(tmp_path, storage, batches):
+    fp = str(tmp_path / "vhi.cube")
+
+    storage.save_to(fp, False, batches[:1])
+    storage.save_to(fp, True, [make_batch(1, (2003, 2005), offset=0.5)])
+
+    loaded = by_key(VhiCube(fp).to_batches())[(Parser.TYPE_MEAN, 1)]
+    np.testing.assert_array_equal(
+        loaded.between(2000, 2002).data, make_batch(1, (2000, 2002)).data)
+    np.testing.assert_array_equal(
+        loaded.between(2003, 2005).data,
+        make_batch(1, (2003, 2005), offset=0.5).data)
@@ -0,0 +1,94 @@
+import math
+import numpy as np
+import pytest
+
+from vhi import ExtremumIndex, MeanFrame, WeekRecordBatch, WeekValue
+
+from conftest import make_batch
+
+
+def random_batch(seed, years=(1990, 2009)):
+    batch = make_batch(3, years)
+    rng = np.random.default_rng(seed)
+
+    # Few distinct values make ties, some weeks are missing
+    data = rng.integers(0, 20, batch.data.shape).astype(np.float32)
+    data[rng.random(len(batch)) < 0.05, -1] = np.nan
+
+    # Records are indexed in any order
+    order = rng.permutation(len(batch))
+    return WeekRecordBatch(batch.province[order], batch.year[order],
+                           batch.week[order], data[order], batch.vhi_type)
+
+
+def brute_force(batch, years):
+    batch = batch.sorted()
+    mask = (batch.year >= years[0]) & (batch.year <= years[1])
+    weeks = [WeekValue(int(y), int(w), float(v)) for y, w, v in zip(
+        batch.year[mask], batch.week[mask], batch.column("VHI")[mask])
+        if not math.isnan(v)]
+
+    by_value = sorted(weeks, key=lambda w: (w.value, w.year, w.week))
+    lowest = by_value[0] if weeks else None
+    highest = min(weeks, key=lambda w: (-w.value, w.year, w.week)) \
+        if weeks else None
+    mean = sum(w.value for w in weeks) / len(weeks) if weeks \
+        else float("nan")
+
+    return lowest, highest, mean, by_value
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_queries_match_brute_force(seed):
+    batch = random_batch(seed)
+    index = ExtremumIndex(batch)
+    rng = np.random.default_rng(seed)
+
+    windows = [(1990, 2009), (1985, 1989), (2009, 2015), (2000, 2000)] + \
+        [tuple(sorted(rng.integers(1985, 2015, 2).tolist()))
+         for _ in range(50)]
+
+    for years in windows:
+        lowest, highest, mean, by_value = brute_force(batch, years)
+
+        assert index.min(years) == lowest
+        assert index.max(years) == highest
+        if math.isnan(mean):
+            assert math.isnan(index.mean(years))
+        else:
+            assert index.mean(years) == pytest.approx(mean)
+        assert index.worst(7, years) == by_value[:7]
+
+
+def test_summary_matches_brute_force():
+    batch = random_batch(1)
+    summary = ExtremumIndex(batch).summary
+
+    assert summary.year.tolist() == list(range(1990, 2010))
+    for i, year in enumerate(summary.year.tolist()):
+        values = batch.column("VHI")[batch.year == year]
+        assert summary.min[i] == np.nanmin(values)
+        assert summary.max[i] == np.nanmax(values)
+        assert summary.mean[i] == pytest.approx(np.nanmean(values))
+
+
+def test_extremums_match_frame():
+    batch = random_batch(2).sorted()
+    index = ExtremumIndex(batch)
+
+    window = batch.between(1995, 1999)
+    expected = MeanFrame.get_extremums(MeanFrame(window))
+
+    for got, exp in zip(index.extremums((1995, 1999)), expected):
+        assert got.index.tolist() == exp.index.tolist()
+        assert got.tolist() == exp.tolist()
+
+
+def test_empty_index():
+    index = ExtremumIndex(WeekRecordBatch.empty(width=5))
+
+    assert len(index) == 0
+    assert index.min() is None and index.max() is None
+    assert math.isnan(index.mean())
+    assert index.worst(3) == []
+    assert all(not len(s) for s in index.extremums())
@@ -0,0 +1,143 @@
+import time
+import threading
+import pytest
+
+from vhi import NetworkError
+from vhi.net import AimdLimiter, RequestScheduler, TokenBucket, make_session
+
+
+@pytest.fixture
+def session():
+    session = make_session(4)
+    yield session
+    session.close()
+
+
+def scheduler(**kwargs):
+    kwargs.setdefault("rate", None)
+    kwargs.setdefault("backoff", 0.0)
+    return RequestScheduler(**kwargs)
+
+
+def test_retry_until_success(noaa, session):
+    noaa.failures = [503, 429, 500]
+    sched = scheduler(retries=3)
+
+    resp = sched.get(session, noaa.url + "/browse.php")
+    assert resp.status_code == 200 and "Province 1" in resp.text
+    assert len(noaa.requests) == 4
+
+
+def test_retries_exhausted(noaa, session):
+    noaa.failures = [503] * 5
+
+    with pytest.raises(NetworkError):
+        scheduler(retries=2).get(session, noaa.url + "/browse.php")
+    assert len(noaa.requests) == 3
+
+
+def test_client_error_is_not_retried(noaa, session):
+    noaa.failures = [404]
+
+    with pytest.raises(NetworkError):
+        scheduler(retries=3).get(session, noaa.url + "/browse.php")
+    assert len(noaa.requests) == 1
+
+
+def test_connection_error_raises_network_error(noaa, session):
+    url = noaa.url + "/browse.php"
+    noaa.close()
+
+    with pytest.raises(NetworkError):
+        scheduler(retries=1).get(session, url)
+
+
+def test_congestion_decreases_limit(noaa, session):
+    url = noaa.url + "/browse.php"
+    sched = scheduler(concurrency=8, retries=3)
+    assert sched.limit(url) == 8
+
+    # Failures of one window decrease limit once
+    noaa.failures = [503, 503]
+    sched.get(session, url)
+    assert sched.limit(url) == pytest.approx(4 + 1 / 4)
+
+
+def test_retry_after_is_respected():
+    sched = RequestScheduler(backoff=100.0, max_backoff=5.0)
+
+    class Response:
+        headers = {"Retry-After": "2"}
+
+    assert sched._delay(0, Response()) == 2.0
+
+    Response.headers = {"Retry-After": "60"}
+    assert sched._delay(0, Response()) == 5.0
+
+    # Jittered exponential backoff is capped too
+    assert 0 <= sched._delay(10, None) <= 5.0
+
+
+def test_aimd_limits():
+    limiter = AimdLimiter(2, min_limit=1, max_limit=3, cooldown=60.0)
+
+    limiter.success()
+    limiter.success()
+    assert limiter.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+
+    limiter.congestion()
+    assert limiter.limit == pytest.approx((2 + 1 / 2 + 1 / 2.5) / 2)
+
+    # Only one decrease per cooldown
+    limiter.congestion()
+    assert limiter.limit == pytest.approx((2 + 1 / 2 + 1 / 2.5) / 2)
+
+    for _ in range(100):
+        limiter.success()
+    assert limiter.limit == 3
+
+    limiter = AimdLimiter(1, min_limit=1, cooldown=0.0)
+    limiter.congestion()
+    assert limiter.limit == 1
+
+
+def test_aimd_bounds_requests_in_flight():
+    limiter = AimdLimiter(2)
+    lock = threading.Lock()
+    state = {"now": 0, "max": 0}
+
+    def work():
+        with limiter:
+            with lock:
+                state["now"] += 1
+                state["max"] = max(state["max"], state["now"])
+            time.sleep(0.02)
+            with lock:
+                state["now"] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state["max"] == 2
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=50.0, burst=2)
+
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+
+    # Two requests pass at once, the rest wait for tokens
+    assert time.monotonic() - start >= 5 / 50.0 * 0.9
+
+
+def test_parser_retries_overloaded_server(noaa, parser):
+    noaa.failures = [503, 429]
+
+    batch = parser.parse_mean("1: Province 1", (2000, 2000))
+    assert len(batch) == 52
+    assert len(noaa.requests) == 3
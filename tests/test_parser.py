@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from vhi import Parser, WeekRecordBatch, ParsingError
+
+from conftest import NoaaStub
+
+
+PROVINCE = "2: Province 2"
+YEARS = (1998, 2003)
+
+
+def expected_vhi(years):
+    return np.array([NoaaStub.vhi(y, w)
+                     for y in range(years[0], years[1] + 1)
+                     for w in range(1, 53)
+                     if NoaaStub.vhi(y, w) != -1.0], dtype=np.float32)
+
+
+def test_parse_mean_skips_negative_vhi(parser):
+    batch = parser.parse_mean(PROVINCE, YEARS)
+
+    assert (batch.province == 2).all()
+    assert len(batch) == 6 * 52 - 2
+    np.testing.assert_allclose(batch.data[:, -1], expected_vhi(YEARS),
+                               rtol=1e-6)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 16 * 1024])
+def test_stream_mean_handles_chunk_splits(parser, noaa, chunk_size):
+    # Small chunks split "<pre>", "</pre>" and rows between chunks
+    batches = list(parser.stream_mean(PROVINCE, YEARS, batch_rows=100,
+                                      chunk_size=chunk_size))
+    streamed = WeekRecordBatch.concat(batches)
+
+    assert all(len(b) for b in batches)
+    if chunk_size < 1024:
+        assert len(batches) > 1 and max(len(b) for b in batches) <= 100
+
+    parsed = parser.parse_mean(PROVINCE, YEARS)
+    np.testing.assert_array_equal(streamed.keys(), parsed.keys())
+    np.testing.assert_array_equal(streamed.data, parsed.data)
+
+
+def test_stream_parea_skips_negative_rows(parser):
+    streamed = WeekRecordBatch.concat(list(parser.stream_parea(
+        PROVINCE, YEARS, batch_rows=50, chunk_size=5)))
+
+    assert len(streamed) == 6 * 51
+    assert not (streamed.week == 7).any()
+    np.testing.assert_array_equal(
+        streamed.data, parser.parse_parea(PROVINCE, YEARS).data)
+
+
+def test_stream_cache_serves_repeated_range(parser, noaa):
+    list(parser.stream_mean(PROVINCE, YEARS, cache=True))
+    count = len(noaa.requests)
+
+    batches = list(parser.stream_mean(PROVINCE, (2000, 2001),
+                                      batch_rows=30))
+    assert len(noaa.requests) == count
+    assert sum(len(b) for b in batches) == 2 * 52 - 1
+    assert max(len(b) for b in batches) == 30
+
+
+def test_stream_truncated_body_raises(parser, noaa):
+    noaa.truncate = True
+
+    with pytest.raises(ParsingError):
+        list(parser.stream_mean(PROVINCE, YEARS, chunk_size=64))
+
+
+def test_parse_selectors(parser):
+    parser.parse_selectors()
+
+    assert parser.provinces == ["%d: Province %d" % (i, i)
+                                for i in range(1, NoaaStub.PROVINCES + 1)]
+    assert parser.years == [str(y) for y in range(NoaaStub.YEARS[0],
+                                                  NoaaStub.YEARS[1] + 1)]
+    assert Parser._get_province_id(parser.provinces[1]) == 2
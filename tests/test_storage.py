@@ -0,0 +1,208 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+from vhi import Parser, Storage
+from vhi.error import SavingError
+from vhi.records import MEAN_LABELS
+
+from conftest import make_batch
+
+
+def read_db(fp):
+    conn = sqlite3.connect(fp)
+    rows = conn.execute('SELECT "province_id", "type", "year", "week", '
+                        '"data" FROM "WeekRecord" ORDER BY 1, 2, 3, 4'
+                        ).fetchall()
+    conn.close()
+    return rows
+
+
+def read_csv(fp):
+    return pd.read_csv(fp, header=0)
+
+
+@pytest.mark.parametrize("ext", [".csv", ".csv.gz"])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_csv_append_skips_written_weeks(tmp_path, storage, ext, workers):
+    fp = str(tmp_path / ("vhi" + ext))
+    mean_fp = Storage.csv_path(fp, Parser.TYPE_MEAN)
+    storage.workers = workers
+
+    storage.save_to(fp, False, [make_batch(1, (2000, 2002)),
+                                make_batch(2, (2000, 2001))])
+    # Overlaps written weeks of both provinces
+    storage.save_to(fp, True, [make_batch(1, (2001, 2004)),
+                               make_batch(2, (2000, 2001)),
+                               make_batch(3, (2000, 2000))])
+
+    df = read_csv(mean_fp)
+    assert list(df.columns[4:]) == MEAN_LABELS
+    assert not df.duplicated(df.columns[:3].tolist()).any()
+    assert len(df) == (5 + 2 + 1) * 52
+
+    # Header is written once, rows appended after it are data
+    assert (df.iloc[:, 3] == "Mean").all()
+
+
+def test_csv_rewrite_drops_old_records(tmp_path, storage):
+    fp = str(tmp_path / "vhi.csv")
+
+    storage.save_to(fp, False, [make_batch(1, (2000, 2005))])
+    storage.save_to(fp, False, [make_batch(2, (2000, 2000))])
+
+    df = read_csv(Storage.csv_path(fp, Parser.TYPE_MEAN))
+    assert len(df) == 52 and (df.iloc[:, 0] == 2).all()
+
+
+def test_csv_file_per_type(tmp_path, storage):
+    fp = str(tmp_path / "vhi.csv")
+
+    paths = storage.save_to(fp, False, [
+        make_batch(1, (2000, 2000)),
+        make_batch(1, (2000, 2000), Parser.TYPE_PAREA, width=21)])
+
+    parea_fp = str(tmp_path / "vhi.Parea.csv")
+    assert paths == [fp, parea_fp]
+
+    mean = read_csv(fp)
+    parea = read_csv(parea_fp)
+    assert mean.shape[1] == 4 + 5 and parea.shape[1] == 4 + 21
+    np.testing.assert_allclose(
+        mean.iloc[:, 4:].to_numpy(dtype=np.float32),
+        make_batch(1, (2000, 2000)).data, atol=1e-3)
+
+
+def test_csv_append_to_legacy_file(tmp_path, storage):
+    fp = str(tmp_path / "vhi.csv")
+
+    # Records of all types in one file with header of Parea columns
+    with open(fp, "w") as f:
+        f.write(",".join(["province", "year", "week", "type"] +
+                         ["%d" % i for i in range(21)]) + "\n")
+        f.write("1,2000,1,Mean,1,2,3,4,5\n")
+    with open(fp + ".idx", "w") as f:
+        f.write('{"Mean:1": [[0, 0]]}')
+
+    with pytest.raises(SavingError):
+        storage.save_to(fp, True, [make_batch(1, (2000, 2000))])
+
+    with open(fp) as f:
+        assert len(f.readlines()) == 2
+
+
+
+V1_SCHEMA = r"""
+CREATE TABLE "Provinces" (
+    "province_id"	INTEGER PRIMARY KEY,
+    "name"	TEXT
+);
+
+CREATE TABLE "WeekRecord" (
+    "province_id"	INTEGER NOT NULL,
+    "type"	TEXT NOT NULL CHECK("type" IN ('Mean', 'Parea')),
+    "year"	INTEGER NOT NULL,
+    "week"	INTEGER NOT NULL,
+    "data"	TEXT NOT NULL,
+    PRIMARY KEY("province_id", "type", "year", "week"),
+    FOREIGN KEY("province_id") REFERENCES "Provinces"("province_id")
+) WITHOUT ROWID;
+"""
+
+
+def test_sqlite_upsert_round_trip(tmp_path, storage):
+    fp = str(tmp_path / "vhi.sqlite")
+
+    storage.save_to(fp, False, [make_batch(1, (2000, 2002)),
+                                make_batch(2, (2000, 2002))])
+    # Rewrites changed weeks of province 1 and adds new years
+    storage.save_to(fp, True, [make_batch(1, (2002, 2003), offset=0.5)])
+
+    loaded = storage.load_records(fp, Parser.TYPE_MEAN, provinces=[1])
+    assert len(loaded) == 4 * 52
+    np.testing.assert_array_equal(loaded.between(2000, 2001).data,
+                                  make_batch(1, (2000, 2001)).data)
+    np.testing.assert_array_equal(
+        loaded.between(2002, 2003).data,
+        make_batch(1, (2002, 2003), offset=0.5).data)
+
+    assert len(storage.load_records(fp, Parser.TYPE_MEAN, provinces=[2],
+                                    years=(2001, 2002))) == 2 * 52
+    assert not len(storage.load_records(fp, Parser.TYPE_PAREA))
+
+    # Saving the same records again changes nothing
+    rows = read_db(fp)
+    storage.save_to(fp, True, [make_batch(2, (2000, 2002))])
+    assert read_db(fp) == rows
+
+
+def make_v1_db(fp, batch, bad_weeks=()):
+    r"""
+    Database of schema version 1 with comma-joined data, data of weeks
+    of bad_weeks is malformed
+    """
+
+    def text(week, row):
+        if week in bad_weeks:
+            return "" if week % 2 else "1.0,x"
+        return ",".join("%.2f" % v for v in row)
+
+    conn = sqlite3.connect(fp)
+    conn.executescript(V1_SCHEMA)
+    conn.executemany(
+        'INSERT INTO "WeekRecord" VALUES (?, ?, ?, ?, ?)',
+        [(4, "Mean", y, w, text(w, row))
+         for y, w, row in zip(batch.year.tolist(), batch.week.tolist(),
+                              batch.data.tolist())])
+    conn.commit()
+    conn.close()
+
+
+def test_sqlite_migrate_text_layout(tmp_path, storage):
+    fp = str(tmp_path / "vhi.sqlite")
+    batch = make_batch(4, (2000, 2001))
+    make_v1_db(fp, batch, bad_weeks=(3, 4))
+
+    assert storage.migrate(fp) == 4
+
+    conn = sqlite3.connect(fp)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == \
+        Storage.SCHEMA_VERSION
+    assert conn.execute('SELECT typeof("data") FROM "WeekRecord" '
+                        'GROUP BY 1').fetchall() == [("blob", )]
+    conn.close()
+
+    valid = batch[~np.isin(batch.week, (3, 4))]
+    loaded = storage.load_records(fp, Parser.TYPE_MEAN)
+    assert loaded.data.dtype == np.float32
+    np.testing.assert_array_equal(loaded.keys(), valid.keys())
+    np.testing.assert_allclose(loaded.data, valid.data, atol=5e-3)
+
+    # Migration of current layout does nothing
+    assert storage.migrate(fp) == 0
+    np.testing.assert_array_equal(
+        storage.load_records(fp, Parser.TYPE_MEAN).data, loaded.data)
+
+
+def test_sqlite_readers_do_not_migrate(tmp_path, storage):
+    fp = str(tmp_path / "vhi.sqlite")
+    batch = make_batch(4, (2000, 2001))
+    make_v1_db(fp, batch, bad_weeks=(5, ))
+
+    with open(fp, "rb") as f:
+        content = f.read()
+
+    loaded = storage.load_records(fp, Parser.TYPE_MEAN, years=(2001, 2001))
+    valid = batch[(batch.year == 2001) & (batch.week != 5)]
+    np.testing.assert_array_equal(loaded.keys(), valid.keys())
+    np.testing.assert_allclose(loaded.data, valid.data, atol=5e-3)
+
+    assert storage.latest(fp) == {("Mean", 4): (2001, 52)}
+
+    with open(fp, "rb") as f:
+        assert f.read() == content
+
+    # Appending migrates database
+    storage.save_to(fp, True, [make_batch(4, (2002, 2002))])
+    assert len(storage.load_records(fp, Parser.TYPE_MEAN)) == 3 * 52 - 2
@@ -1,6 +1,14 @@
 from .plot import Plotter, MeanFrame, PareaFrame
 from .storage import Storage
-from .parser import Parser, WeekRecord
+from .cube import VhiCube
+from .parser import Parser
+from .records import WeekRecord, WeekRecordBatch
+from .async_parser import AsyncParser
+from .crawl import Crawler, CrawlStats
+from .drought import DroughtEngine, DroughtThresholds, DroughtResult
+from .extremum import ExtremumIndex, WeekValue, YearSummary
+from .climatology import Climatology
+from .cache import ResponseCache, MemoCache, RangeCache, CacheStats
 from .error import (
     StorageDbError,
     SavingError,
@@ -23,10 +31,38 @@ __all__ = (
 
     # storage
     'Storage',
+    'VhiCube',
 
     # parser
     'Parser',
+    'AsyncParser',
+
+    # drought
+    'DroughtEngine',
+    'DroughtThresholds',
+    'DroughtResult',
+
+    # extremum
+    'ExtremumIndex',
+    'WeekValue',
+    'YearSummary',
+
+    # climatology
+    'Climatology',
+
+    # crawl
+    'Crawler',
+    'CrawlStats',
+
+    # records
     'WeekRecord',
+    'WeekRecordBatch',
+
+    # cache
+    'ResponseCache',
+    'MemoCache',
+    'RangeCache',
+    'CacheStats',
 
     # error
     'StorageDbError',
@@ -0,0 +1,235 @@
+import asyncio
+
+from typing import (
+    Tuple, List, Dict, Callable, Optional, Iterable, Iterator, AsyncIterator
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .error import ParsingError, NetworkError
+from .parser import Parser
+from .records import WeekRecord, WeekRecordBatch
+from .cache import RangeCache
+
+
+class AsyncParser:
+    r"""
+    asyncio-native parser for VHI Data from star.nesdis.noaa.gov
+
+    Has the same surface as Parser, but methods are coroutines. Requests
+    are scheduled through semaphore, so any count of them could be awaited
+    at once. Requires aiohttp.
+
+    Usage:
+        async with AsyncParser() as parser:
+            await parser.parse_selectors()
+            recs = await parser.parse_mean(parser.provinces[0], (2000, 2020))
+    """
+
+    TYPE_MEAN = Parser.TYPE_MEAN
+    TYPE_PAREA = Parser.TYPE_PAREA
+
+    def __init__(self, base_uri: str = Parser.BASE_URI,
+                 concurrency: int = 32, timeout: float = 60.0):
+        r"""
+        :param base_uri: base URI of NOAA VH pages, could point to
+                         local stand-in server
+        :param concurrency: max count of requests in flight
+        :param timeout: timeout of every request in seconds
+        """
+
+        if aiohttp is None:
+            raise ImportError("AsyncParser requires aiohttp package")
+
+        self.browser_urn = base_uri + "/vh_browseByCountry_province.php"
+        self.raw_data_urn = base_uri + "/get_TS_admin.php"
+
+        self.provinces: List[str] = []
+        self.years: List[str] = []
+
+        self.headers = {
+            # Just for mimic to browser
+            "User-Agent": "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:87.0) "
+            "Gecko/20100101 Firefox/87.0",
+            "Connection": "keep-alive"
+        }
+
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        # Created lazily, semaphore has to be bound to running loop
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+        self.ranges = RangeCache()
+        self._key_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+
+    async def __aenter__(self) -> "AsyncParser":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        r"""
+        Close underlying HTTP session
+        """
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self._session
+
+    async def _get(self, url: str) -> str:
+        session = self._get_session()
+
+        async with self._sem:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(
+                        total=self.timeout)) as resp:
+                    resp.raise_for_status()
+                    return await resp.text()
+            except asyncio.TimeoutError:
+                raise NetworkError("Request timed out: %s" % url)
+            except aiohttp.ClientError as e:
+                raise NetworkError(e)
+
+    def batches(self) -> Iterator[WeekRecordBatch]:
+        r"""
+        Iterate over batches of all parsed records without duplicates
+        """
+
+        return self.ranges.values()
+
+    def records(self) -> Iterator[WeekRecord]:
+        r"""
+        Iterate over all parsed records without duplicates
+        """
+
+        for batch in self.batches():
+            yield from batch
+
+    async def parse_selectors(self) -> None:
+        """
+        Parses province and selectors from web page
+
+        Stores result to provinces and years members
+        """
+
+        html = await self._get(
+            self.browser_urn + f"?country={Parser.COUNTRY_ID}")
+
+        provinces, years = Parser._parse_selectors_html(html)
+
+        self.provinces.extend(provinces)
+        self.years.extend(years)
+
+    async def _get_raw_vhi_data(self, province_id: int,
+                                years: Tuple[int, int],
+                                vhi_type: str) -> Tuple[int, str]:
+
+        query = Parser._raw_data_query(province_id, years, vhi_type)
+        html = await self._get("%s?%s" % (self.raw_data_urn, query))
+
+        return (province_id, Parser._extract_pre(html))
+
+    async def _parse_range(self, province: str, years: Tuple[int, int],
+                           vhi_type: str,
+                           filter: Callable) -> WeekRecordBatch:
+
+        key = (vhi_type, Parser._get_province_id(province))
+
+        lock = self._key_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Cached years are not evicted by other tasks while gaps are
+            # fetched
+            with self.ranges.pinned(key):
+                gaps = self.ranges.missing(key, years)
+
+                # Missing year ranges of one key are fetched concurrently
+                raw = await asyncio.gather(*[
+                    self._get_raw_vhi_data(key[1], gap, vhi_type)
+                    for gap in gaps])
+
+                for gap, vhi_data in zip(gaps, raw):
+                    self.ranges.add(key, gap, Parser._parse_vhi(
+                        vhi_data, filter, vhi_type))
+
+                return self.ranges.slice(key, years)
+
+    async def parse_mean(self, province: str,
+                         years: Tuple[int, int]) -> WeekRecordBatch:
+
+        """
+        Parses Mean records, see Parser.parse_mean()
+        """
+
+        try:
+            return await self._parse_range(province, years, self.TYPE_MEAN,
+                                           Parser._mean_filter)
+        except (NetworkError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            raise ParsingError(e)
+
+    async def parse_parea(self, province: str,
+                          years: Tuple[int, int]) -> WeekRecordBatch:
+
+        """
+        Parses Percentage of Area records, see Parser.parse_parea()
+        """
+
+        try:
+            return await self._parse_range(province, years, self.TYPE_PAREA,
+                                           Parser._parea_filter)
+        except (NetworkError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            raise ParsingError(e)
+
+    async def fetch_many(self, provinces: Iterable[str],
+                         years: Tuple[int, int],
+                         types: Iterable[str] = (TYPE_MEAN, TYPE_PAREA)
+                         ) -> AsyncIterator[Tuple[Tuple[str, str],
+                                                  WeekRecordBatch]]:
+
+        """
+        Fetches records for many provinces concurrently.
+
+        Results are yielded in order of completion. When consumer stops
+        iteration or any fetch fails, pending fetches are cancelled.
+
+        :param provinces: province names, which were parsed from web page
+        :param years: years range (from, to)
+        :param types: types of VHI records (TYPE_MEAN and/or TYPE_PAREA)
+        :returns: async iterator of ((province, type), records) pairs
+        """
+
+        methods = {
+            self.TYPE_MEAN: self.parse_mean,
+            self.TYPE_PAREA: self.parse_parea
+        }
+
+        async def job(prov, vhi_type):
+            return ((prov, vhi_type), await methods[vhi_type](prov, years))
+
+        tasks = [asyncio.ensure_future(job(prov, vhi_type))
+                 for prov in provinces for vhi_type in types]
+
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,654 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+
+from time import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import (
+    Tuple, Optional, NamedTuple, Dict, Any, Callable, Hashable, Iterator,
+    List
+)
+
+from .util import merge_intervals, missing_intervals
+from .records import WeekRecordBatch
+
+
+def default_cache_dir() -> str:
+    r"""
+    Location of on-disk cache, respects XDG_CACHE_HOME
+
+    :returns: path to cache directory
+    :rtype: str
+    """
+
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vhi_parser")
+
+
+class CacheEntry(NamedTuple):
+    """
+    NamedTuple for representation of cached response
+    """
+
+    body: str
+    digest: str
+    stored_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    key: Optional[List[Any]] = None
+
+    def meta(self) -> str:
+        r"""
+        Serialized metadata of entry (everything except body)
+        """
+
+        return json.dumps({k: v for k, v in self._asdict().items()
+                           if k != "body"})
+
+    def validators(self) -> Dict[str, str]:
+        r"""
+        Headers for conditional revalidation of entry
+        """
+
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    r"""
+    Disk-backed cache for raw responses of get_TS_admin.php
+
+    Every entry is stored as pair of files named after hash of the key:
+    "<hash>.pre" with inner text of <pre> tag and "<hash>.json" with
+    metadata (validators, content hash and time of storing). Entries
+    older than ttl are considered stale and have to be revalidated. When
+    total size exceeds max_size, least recently used entries are evicted.
+    """
+
+    BODY_EXT = ".pre"
+    META_EXT = ".json"
+
+    def __init__(self, path: str, ttl: float = 24 * 60 * 60,
+                 max_size: int = 256 * 1024 * 1024):
+        r"""
+        :param path: cache directory
+        :param ttl: seconds while entry considered fresh
+        :param max_size: limit of cache size in bytes
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def _hash(body: str) -> str:
+        return hashlib.sha256(body.encode()).hexdigest()
+
+    def _paths(self, key: Tuple[Any, ...]) -> Tuple[str, str]:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        base = os.path.join(self.path, name)
+
+        return (base + self.BODY_EXT, base + self.META_EXT)
+
+    def _write(self, fp: str, data: str) -> None:
+        # Write to temporary file first, so readers never see partial data
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp, fp)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[CacheEntry]:
+        r"""
+        Get cached entry regardless of its freshness
+
+        :param key: (country, provinceID, year1, year2, type)
+        :returns: CacheEntry or None if key is not cached
+        """
+
+        body_fp, meta_fp = self._paths(key)
+        try:
+            with open(meta_fp) as f:
+                meta = json.load(f)
+            with open(body_fp) as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+
+        # Body is replaced before metadata by concurrent put(), so entry
+        # is not removed, just missed. Corrupted one is rewritten by the
+        # next put()
+        if self._hash(body) != meta.get("digest"):
+            return None
+
+        # Update access time for LRU eviction
+        try:
+            os.utime(meta_fp)
+        except OSError:
+            pass
+
+        return CacheEntry(body, meta["digest"], meta["stored_at"],
+                          meta.get("etag"), meta.get("last_modified"),
+                          meta.get("key"))
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time() - entry.stored_at < self.ttl
+
+    def put(self, key: Tuple[Any, ...], body: str,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> CacheEntry:
+        r"""
+        Store response to cache
+
+        If body has the same content hash as already cached one, only
+        metadata is updated
+        """
+
+        body_fp, meta_fp = self._paths(key)
+        entry = CacheEntry(body, self._hash(body), time(),
+                           etag, last_modified, list(key))
+
+        old = self.get(key)
+        if old is None or old.digest != entry.digest:
+            self._write(body_fp, body)
+
+        self._write(meta_fp, entry.meta())
+        self.evict()
+        return entry
+
+    def touch(self, key: Tuple[Any, ...]) -> Optional[CacheEntry]:
+        r"""
+        Mark entry as fresh after successful revalidation
+        """
+
+        entry = self.get(key)
+        if entry is None:
+            return None
+
+        entry = entry._replace(stored_at=time())
+        self._write(self._paths(key)[1], entry.meta())
+        return entry
+
+    def keys(self) -> List[Tuple[Any, ...]]:
+        r"""
+        Keys of all cached entries, read from metadata. Entries stored
+        by older versions without key in metadata are skipped
+        """
+
+        keys = []
+        with os.scandir(self.path) as it:
+            for ent in it:
+                if not ent.name.endswith(self.META_EXT):
+                    continue
+
+                try:
+                    with open(ent.path) as f:
+                        key = json.load(f).get("key")
+                except (OSError, ValueError):
+                    continue
+
+                if key:
+                    keys.append(tuple(key))
+        return keys
+
+    def remove(self, key: Tuple[Any, ...]) -> None:
+        for fp in self._paths(key):
+            try:
+                os.remove(fp)
+            except OSError:
+                pass
+
+    def size(self) -> int:
+        r"""
+        Total size of cached files in bytes
+        """
+
+        total = 0
+        with os.scandir(self.path) as it:
+            for ent in it:
+                try:
+                    if ent.is_file():
+                        total += ent.stat().st_size
+                except OSError:
+                    # Temporary file renamed by concurrent writer
+                    continue
+        return total
+
+    def evict(self) -> None:
+        r"""
+        Remove least recently used entries until cache fits into max_size
+        """
+
+        entries = []
+        total = 0
+        with os.scandir(self.path) as it:
+            for ent in it:
+                try:
+                    if not ent.is_file():
+                        continue
+                    st = ent.stat()
+                except OSError:
+                    # Temporary file renamed by concurrent writer
+                    continue
+
+                total += st.st_size
+
+                if ent.name.endswith(self.META_EXT):
+                    base = ent.path[:-len(self.META_EXT)]
+                    try:
+                        body_sz = os.path.getsize(base + self.BODY_EXT)
+                    except OSError:
+                        body_sz = 0
+                    entries.append((st.st_mtime, base,
+                                    st.st_size + body_sz))
+
+        if total <= self.max_size:
+            return
+
+        for _, base, sz in sorted(entries):
+            for ext in (self.BODY_EXT, self.META_EXT):
+                try:
+                    os.remove(base + ext)
+                except OSError:
+                    pass
+
+            total -= sz
+            if total <= self.max_size:
+                break
+
+    def clear(self) -> None:
+        r"""
+        Remove all cached entries
+        """
+
+        with os.scandir(self.path) as it:
+            for ent in it:
+                if ent.name.endswith((self.BODY_EXT, self.META_EXT)):
+                    os.remove(ent.path)
+
+
+def approx_sizeof(obj: Any) -> int:
+    r"""
+    Approximate size of object in bytes including nested containers
+
+    :param obj: cached value
+    :returns: size in bytes
+    :rtype: int
+    """
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_sizeof(i) for i in obj)
+    elif isinstance(obj, dict):
+        size += sum(approx_sizeof(k) + approx_sizeof(v)
+                    for k, v in obj.items())
+    return size
+
+
+class CacheStats(NamedTuple):
+    """
+    NamedTuple for representation of MemoCache statistics
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+
+
+class _Flight:
+    r"""
+    Computation in progress, shared by all callers waiting for the same key
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class MemoCache:
+    r"""
+    Thread-safe in-memory LRU cache for parsed records
+
+    Bounded by count of entries and approximate size in bytes. Empty
+    results are cached as well as non-empty ones (negative caching).
+    Concurrent callers of get_or_compute() for the same key share one
+    computation (single-flight), failed computations are not cached.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = 512,
+                 max_size: int = 128 * 1024 * 1024):
+        r"""
+        :param max_entries: limit of cached entries
+        :param max_size: limit of approximate cache size in bytes
+        """
+
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self._data: OrderedDict = OrderedDict()
+        self._size = 0
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, _Flight] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def _lookup(self, key: Hashable) -> Any:
+        # Must be called with lock held
+        item = self._data.get(key, self._MISSING)
+        if item is self._MISSING:
+            return item
+
+        self._data.move_to_end(key)
+        return item[0]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        # Must be called with lock held
+        size = approx_sizeof(value)
+
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._size -= old[1]
+
+        self._data[key] = (value, size)
+        self._size += size
+
+        # Evict least recently used entries, but keep the newest one
+        while len(self._data) > 1 and (len(self._data) > self.max_entries
+                                       or self._size > self.max_size):
+            _, (_, sz) = self._data.popitem(last=False)
+            self._size -= sz
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        r"""
+        Get cached value or compute it with fn
+
+        If another thread is already computing value for this key, waits
+        for its result instead of starting one more computation
+
+        :param key: cache key
+        :param fn: function without arguments to compute value
+        :returns: cached or computed value
+        """
+
+        with self._lock:
+            value = self._lookup(key)
+            if value is not self._MISSING:
+                self.hits += 1
+                return value
+
+            self.misses += 1
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+        return flight.value
+
+    def invalidate(self, pred: Callable[[Hashable], bool]) -> None:
+        r"""
+        Remove entries whose keys satisfy predicate
+        """
+
+        with self._lock:
+            for key in [k for k in self._data if pred(k)]:
+                self._size -= self._data.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def keys(self) -> Iterator[Hashable]:
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def values(self) -> Iterator[Any]:
+        with self._lock:
+            return iter([v for v, _ in self._data.values()])
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        with self._lock:
+            return iter([(k, v) for k, (v, _) in self._data.items()])
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions,
+                              len(self._data), self._size)
+
+
+class RangeCache:
+    r"""
+    Year coverage cache for records of one type and province
+
+    For every key (type, province_id) stores sorted WeekRecordBatch along
+    with covered years as merged intervals. Requested range is answered by
+    slicing cached batch, only uncovered years have to be fetched.
+
+    Bounded like MemoCache: least recently used keys are evicted with
+    their coverage when count of keys or size of batches exceeds limits.
+    Keys are never evicted while pinned, see pinned().
+    """
+
+    def __init__(self, max_entries: int = 512,
+                 max_size: int = 128 * 1024 * 1024):
+        r"""
+        :param max_entries: limit of cached keys
+        :param max_size: limit of size of cached batches in bytes
+        """
+
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+        self._coverage: Dict[Hashable, List[Tuple[int, int]]] = {}
+        self._batches: OrderedDict = OrderedDict()
+        self._size = 0
+
+        # Count of pinned() contexts by key
+        self._pins: Dict[Hashable, int] = {}
+
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def _full(self) -> bool:
+        return len(self._batches) > self.max_entries or \
+            self._size > self.max_size
+
+    def _evict(self) -> None:
+        # Must be called with lock held, the newest and pinned keys are kept
+        if not self._full():
+            return
+
+        for key in list(self._batches)[:-1]:
+            if key in self._pins:
+                continue
+
+            self._size -= approx_sizeof(self._batches.pop(key))
+            del self._coverage[key]
+            self.evictions += 1
+
+            if not self._full():
+                break
+
+    def lock(self, key: Hashable) -> threading.Lock:
+        r"""
+        Lock for serializing fetches of the same key
+        """
+
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def pinned(self, key: Hashable) -> Iterator[None]:
+        r"""
+        Keep records of key from eviction until context exits, so
+        records added within context could be sliced
+
+        Usage:
+            with cache.lock(key), cache.pinned(key):
+                for gap in cache.missing(key, years):
+                    cache.add(key, gap, fetch(gap))
+                batch = cache.slice(key, years)
+        """
+
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+                self._evict()
+
+    def coverage(self, key: Hashable) -> List[Tuple[int, int]]:
+        with self._lock:
+            return list(self._coverage.get(key, []))
+
+    def missing(self, key: Hashable,
+                years: Tuple[int, int]) -> List[Tuple[int, int]]:
+        r"""
+        Get years ranges which are not cached yet
+
+        :param key: (type, province_id)
+        :param years: requested years range (from, to)
+        :returns: list of uncovered years ranges
+        """
+
+        with self._lock:
+            return missing_intervals(self._coverage.get(key, []), years)
+
+    def add(self, key: Hashable, years: Tuple[int, int],
+            batch: WeekRecordBatch) -> None:
+        r"""
+        Merge fetched records for years range into cache
+
+        :param key: (type, province_id)
+        :param years: fetched years range (from, to)
+        :param batch: fetched records
+        """
+
+        with self._lock:
+            old = self._batches.pop(key, None)
+            if old is not None:
+                self._size -= approx_sizeof(old)
+
+            new = old.merge(batch) if old is not None else batch.sorted()
+            self._batches[key] = new
+            self._size += approx_sizeof(new)
+
+            self._coverage[key] = merge_intervals(
+                self._coverage.get(key, []) + [tuple(years)])
+
+            self._evict()
+
+    def slice(self, key: Hashable,
+              years: Tuple[int, int]) -> WeekRecordBatch:
+        r"""
+        Get cached records in years range
+
+        :param key: (type, province_id)
+        :param years: years range (from, to)
+        :returns: batch sorted by (year, week), view of cached one
+        :raises KeyError: key is not cached, e.g. it was evicted before
+                          slicing, so slice within pinned() context
+        """
+
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                raise KeyError(key)
+            self._batches.move_to_end(key)
+
+        return batch.between(*years)
+
+    def invalidate(self, pred: Callable[[Hashable], bool]) -> None:
+        r"""
+        Forget records and coverage of keys satisfying predicate
+        """
+
+        with self._lock:
+            for key in [k for k in self._coverage if pred(k)]:
+                del self._coverage[key]
+                self._size -= approx_sizeof(self._batches.pop(key))
+
+    def keys(self) -> Iterator[Hashable]:
+        with self._lock:
+            return iter(list(self._coverage.keys()))
+
+    def values(self) -> Iterator[WeekRecordBatch]:
+        with self._lock:
+            return iter(list(self._batches.values()))
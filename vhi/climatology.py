@@ -0,0 +1,260 @@
+r"""
+Climatology (long-term normal) of weekly values per province
+
+For every province and ISO week of year keeps values of all years in
+array of shape (provinces, years, 53), so statistics are recomputed
+only for provinces touched by new records. Normal consists of mean,
+standard deviation and PERCENTILES per week, anomaly is deviation of
+value from mean of its week and z-score is anomaly in standard
+deviations.
+
+Usage:
+    clim = Climatology.from_batches(parser.batches())
+    series = clim.anomaly_series(parser.parse_mean(province, years))
+"""
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from typing import Iterable
+
+from .dates import week_dates
+from .records import WeekRecordBatch, TYPE_MEAN
+
+
+# Count of ISO weeks in long year
+WEEKS = 53
+
+
+class Climatology:
+    r"""
+    Per-province, per-week-of-year normal of one Mean index
+    """
+
+    PERCENTILES = (10, 50, 90)
+
+    def __init__(self, label: str = "VHI"):
+        r"""
+        :param label: Mean index, one of MEAN_LABELS
+        """
+
+        self.label = label
+
+        self.provinces = np.empty(0, dtype=np.int32)
+        self.first_year = 0
+        self.values = np.empty((0, 0, WEEKS), dtype=np.float32)
+
+        self.mean = np.empty((0, WEEKS))
+        self.std = np.empty((0, WEEKS))
+        self.count = np.empty((0, WEEKS), dtype=np.int32)
+        self.percentiles = np.empty((len(self.PERCENTILES), 0, WEEKS))
+
+    @classmethod
+    def from_batches(cls, batches: Iterable[WeekRecordBatch],
+                     label: str = "VHI") -> "Climatology":
+        r"""
+        Build climatology from Mean records, other types are skipped
+        """
+
+        clim = cls(label)
+        clim.update(batches)
+        return clim
+
+    def _grow(self, provinces: np.ndarray, first_year: int,
+              last_year: int) -> None:
+        r"""
+        Extend arrays to cover provinces and years, keeping old values
+        and statistics
+        """
+
+        n_years = last_year - first_year + 1
+        if np.array_equal(provinces, self.provinces) and \
+                first_year == self.first_year and \
+                n_years == self.values.shape[1]:
+            return
+
+        rows = np.searchsorted(provinces, self.provinces)
+        offset = self.first_year - first_year
+
+        values = np.full((len(provinces), n_years, WEEKS), np.nan,
+                         dtype=np.float32)
+        values[rows, offset:offset + self.values.shape[1]] = self.values
+
+        def grow_stats(arr, fill):
+            ret = np.full(arr.shape[:-2] + (len(provinces), WEEKS), fill,
+                          dtype=arr.dtype)
+            ret[..., rows, :] = arr
+            return ret
+
+        self.mean = grow_stats(self.mean, np.nan)
+        self.std = grow_stats(self.std, np.nan)
+        self.count = grow_stats(self.count, 0)
+        self.percentiles = grow_stats(self.percentiles, np.nan)
+
+        self.provinces = provinces
+        self.first_year = first_year
+        self.values = values
+
+    def _compute(self, rows: np.ndarray) -> None:
+        values = self.values[rows]
+        count = np.count_nonzero(~np.isnan(values), axis=1)
+
+        # Weeks without values (e.g. 53rd week) are all-NaN slices
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+
+            self.mean[rows] = np.nanmean(values, axis=1)
+            self.std[rows] = np.nanstd(values, axis=1, ddof=1)
+            self.percentiles[:, rows] = np.nanpercentile(
+                values, self.PERCENTILES, axis=1)
+
+        self.count[rows] = count
+
+    def update(self, batches: Iterable[WeekRecordBatch]) -> None:
+        r"""
+        Add or replace values of weeks, statistics are recomputed only
+        for provinces of new records
+
+        :param batches: Mean records, other types are skipped
+        """
+
+        batches = [b for b in batches
+                   if len(b) and b.vhi_type == TYPE_MEAN]
+        if not batches:
+            return
+
+        batch = WeekRecordBatch.concat(batches)
+
+        first_year = int(batch.year.min())
+        last_year = int(batch.year.max())
+        if len(self.provinces):
+            first_year = min(first_year, self.first_year)
+            last_year = max(last_year,
+                            self.first_year + self.values.shape[1] - 1)
+
+        self._grow(np.union1d(self.provinces, batch.province)
+                   .astype(np.int32), first_year, last_year)
+
+        rows = np.searchsorted(self.provinces, batch.province)
+        self.values[rows, batch.year - self.first_year, batch.week - 1] = \
+            batch.column(self.label)
+
+        self._compute(np.unique(rows))
+
+    def _lookup(self, records: WeekRecordBatch, stats: np.ndarray
+                ) -> np.ndarray:
+        r"""
+        Statistics of weeks of records, NaN for unknown provinces
+        """
+
+        ret = np.full(len(records), np.nan)
+        if not len(self.provinces):
+            return ret
+
+        rows = np.searchsorted(self.provinces, records.province)
+        rows = np.minimum(rows, len(self.provinces) - 1)
+
+        known = self.provinces[rows] == records.province
+        ret[known] = stats[rows[known], records.week[known] - 1]
+        return ret
+
+    def anomaly(self, records: WeekRecordBatch,
+                zscore: bool = False) -> np.ndarray:
+        r"""
+        Deviation of values of records from normal of their weeks
+
+        :param records: Mean records of any provinces and years
+        :param zscore: divide deviation by standard deviation
+        :returns: float64 array with value per record, NaN where normal
+                  is unknown
+        """
+
+        ret = records.column(self.label) - self._lookup(records, self.mean)
+
+        if zscore:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                std = self._lookup(records, self.std)
+                ret = np.where(std > 0, ret / std, np.nan)
+        return ret
+
+    def anomaly_series(self, records: WeekRecordBatch,
+                       zscore: bool = False) -> pd.Series:
+        r"""
+        Anomaly of records as series indexed by date, see anomaly()
+        """
+
+        return pd.Series(self.anomaly(records, zscore),
+                         index=week_dates(records), name=self.label)
+
+    def normal(self, province: int) -> pd.DataFrame:
+        r"""
+        Normal of province
+
+        :param province: province id
+        :returns: frame indexed by ISO week with count, mean, std and
+                  percentile columns (e.g. p10)
+        """
+
+        row = int(np.searchsorted(self.provinces, province))
+        if row == len(self.provinces) or self.provinces[row] != province:
+            raise KeyError("Province %d is not in climatology" % province)
+
+        columns = {
+            "count": self.count[row],
+            "mean": self.mean[row],
+            "std": self.std[row]
+        }
+        for q, arr in zip(self.PERCENTILES, self.percentiles[:, row]):
+            columns["p%d" % q] = arr
+
+        return pd.DataFrame(columns, index=pd.RangeIndex(1, WEEKS + 1,
+                                                         name="week"))
+
+    def save(self, fp: str) -> None:
+        r"""
+        Save climatology to .npz file
+        """
+
+        tmp = fp + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, label=self.label, provinces=self.provinces,
+                     first_year=self.first_year, values=self.values,
+                     mean=self.mean, std=self.std, count=self.count,
+                     percentiles=self.percentiles,
+                     quantiles=np.array(self.PERCENTILES))
+        os.replace(tmp, fp)
+
+    @classmethod
+    def load(cls, fp: str) -> "Climatology":
+        r"""
+        Load climatology saved by save()
+        """
+
+        with np.load(fp) as data:
+            clim = cls(str(data["label"]))
+
+            clim.provinces = data["provinces"]
+            clim.first_year = int(data["first_year"])
+            clim.values = data["values"]
+            clim.mean = data["mean"]
+            clim.std = data["std"]
+            clim.count = data["count"]
+            clim.percentiles = data["percentiles"]
+
+            # Statistics are recomputed if percentiles were changed
+            if tuple(data["quantiles"].tolist()) != cls.PERCENTILES:
+                clim.percentiles = np.empty(
+                    (len(cls.PERCENTILES), ) + clim.mean.shape)
+                clim._compute(np.arange(len(clim.provinces)))
+
+        return clim
+
+    @classmethod
+    def open(cls, fp: str, label: str = "VHI") -> "Climatology":
+        r"""
+        Load climatology from fp if it exists, otherwise create empty one
+        """
+
+        return cls.load(fp) if os.path.exists(fp) else cls(label)
@@ -0,0 +1,168 @@
+r"""
+Parquet and Feather (Arrow IPC) datasets of VHI records
+
+Dataset is a directory partitioned by type and province:
+    <fp>/type=Mean/province=5/part-0.parquet
+    <fp>/type=Parea/province=5/part-0.parquet
+
+Every file has year, week and data columns, rows are sorted by year and
+split into row groups of ROW_GROUP_ROWS. Parquet row group statistics
+allow to skip years outside of requested range, Feather (Arrow IPC)
+files have no statistics, so their rows are filtered after reading.
+Both formats prune partition directories by province. Requires pyarrow.
+"""
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from typing import Iterable, Optional, Tuple, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+from .records import WeekRecordBatch, TYPE_MEAN, TYPE_PAREA
+
+
+# Formats by file extension
+FORMATS = {
+    ".parquet": "parquet",
+    ".feather": "feather"
+}
+
+# About 10 years of weekly records
+ROW_GROUP_ROWS = 520
+
+TYPE_LABELS = {
+    TYPE_MEAN: "Mean",
+    TYPE_PAREA: "Parea"
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Parquet/Feather support requires pyarrow package")
+
+
+def _to_table(batch: WeekRecordBatch) -> "pa.Table":
+    columns = {
+        "year": pa.array(batch.year, pa.int16()),
+        "week": pa.array(batch.week, pa.int8())
+    }
+    for i, label in enumerate(batch.labels):
+        columns[label] = pa.array(batch.data[:, i])
+
+    return pa.table(columns)
+
+
+def _from_table(table: "pa.Table", province: int,
+                vhi_type: str) -> WeekRecordBatch:
+    data = np.column_stack([table.column(name).to_numpy()
+                            for name in table.column_names[2:]])
+
+    return WeekRecordBatch(np.full(table.num_rows, province),
+                           table.column("year").to_numpy(),
+                           table.column("week").to_numpy(),
+                           data, vhi_type)
+
+
+def _partition_dir(fp: str, vhi_type: str, province: int) -> str:
+    return os.path.join(fp, "type=" + TYPE_LABELS[vhi_type],
+                        "province=%d" % province)
+
+
+def _read_partition(path: str, fmt: str, province: int,
+                    vhi_type: str) -> Optional[WeekRecordBatch]:
+    if not os.path.isdir(path):
+        return None
+
+    table = ds.dataset(path, format=fmt).to_table()
+    if not table.num_rows:
+        return None
+    return _from_table(table, province, vhi_type)
+
+
+def write_dataset(fp: str, batches: Iterable[WeekRecordBatch],
+                  append: bool = False) -> None:
+    r"""
+    Write batches to partitioned dataset
+
+    In append mode stored partitions are merged with new records without
+    duplicates, otherwise dataset is replaced
+
+    :param fp: dataset directory with .parquet or .feather extension
+    :param batches: records to write
+    :param append: merge with existing dataset instead of replacing it
+    """
+
+    _require_pyarrow()
+
+    fmt = FORMATS[os.path.splitext(fp)[1]]
+
+    if not append and os.path.isdir(fp):
+        shutil.rmtree(fp)
+
+    for batch in batches:
+        for province in np.unique(batch.province).tolist():
+            part = batch[batch.province == province]
+            path = _partition_dir(fp, batch.vhi_type, province)
+
+            if append:
+                old = _read_partition(path, fmt, province, batch.vhi_type)
+                if old is not None:
+                    part = old.merge(part)
+
+            ds.write_dataset(
+                _to_table(part.sorted()), path, format=fmt,
+                basename_template="part-{i}." + fmt,
+                max_rows_per_group=ROW_GROUP_ROWS,
+                min_rows_per_group=min(ROW_GROUP_ROWS, len(part)),
+                existing_data_behavior="delete_matching")
+
+
+def read_dataset(fp: str, vhi_type: str,
+                 provinces: Optional[Iterable[int]] = None,
+                 years: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+    r"""
+    Read records of one type from partitioned dataset
+
+    Provinces filter prunes partition directories. Years filter skips
+    row groups by statistics for Parquet and is applied to read rows for
+    Feather, which has no statistics
+
+    :param fp: dataset directory with .parquet or .feather extension
+    :param vhi_type: type of VHI records (TYPE_MEAN or TYPE_PAREA)
+    :param provinces: ids of provinces to read, all if None
+    :param years: years range (from, to), all years if None
+    :returns: DataFrame with province, year, week and data columns
+    :rtype: pd.DataFrame
+    """
+
+    _require_pyarrow()
+
+    fmt = FORMATS[os.path.splitext(fp)[1]]
+
+    dataset = ds.dataset(os.path.join(fp, "type=" + TYPE_LABELS[vhi_type]),
+                         format=fmt, partitioning="hive")
+
+    cond: List["ds.Expression"] = []
+    if provinces is not None:
+        cond.append(ds.field("province").isin(list(provinces)))
+    if years is not None:
+        cond.append((ds.field("year") >= years[0]) &
+                    (ds.field("year") <= years[1]))
+
+    filt = None
+    for c in cond:
+        filt = c if filt is None else filt & c
+
+    table = dataset.to_table(filter=filt)
+
+    # Partition column goes last, move it to the front
+    df = table.to_pandas()
+    return df[["province"] + [c for c in df.columns if c != "province"]] \
+        .sort_values(["province", "year", "week"], ignore_index=True)
@@ -0,0 +1,294 @@
+r"""
+Checkpointed bulk crawl of VHI data
+
+Every completed unit of work (type, province, years range) is saved to
+storage and then appended to journal file, so interrupted crawl resumes
+with units which are not journaled yet.
+
+Usage:
+    $ python3 -m vhi.crawl dumps/vhi.sqlite
+    $ python3 -m vhi.crawl dumps/vhi.csv --years 2000 2020 --unit-years 5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+from concurrent.futures import as_completed
+from typing import List, Dict, Optional, Iterable, Tuple, NamedTuple
+
+from .parser import Parser
+from .storage import Storage
+from .records import WeekRecordBatch
+from .error import ParsingError, NetworkError, SavingError, StorageDbError
+from .util import merge_intervals, missing_intervals
+
+
+class CrawlUnit(NamedTuple):
+    r"""
+    Unit of crawl, which is fetched, saved and journaled at once
+    """
+
+    vhi_type: str
+    province: str
+    years: Tuple[int, int]
+
+
+class CrawlStats(NamedTuple):
+    r"""
+    Result of crawl: count of units completed by this run, count of
+    (type, province) pairs completed before and units failed after retries
+    """
+
+    done: int
+    skipped: int
+    failed: List[CrawlUnit]
+
+
+class Journal:
+    r"""
+    Append-only journal of completed units, one JSON object per line
+
+    Line which was cut by crash is ignored on load
+    """
+
+    def __init__(self, fp: str):
+        self.fp = fp
+
+        # "<type>:<province_id>" to merged year intervals
+        self.done: Dict[str, List[Tuple[int, int]]] = {}
+
+        if os.path.exists(fp):
+            with open(fp) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._add(entry["type"], entry["province"],
+                                  tuple(entry["years"]))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+    @staticmethod
+    def _key(vhi_type: str, province_id: int) -> str:
+        return "%s:%d" % (Storage._type_label(vhi_type), province_id)
+
+    def _add(self, vhi_type: str, province_id: int,
+             years: Tuple[int, int]) -> None:
+        key = self._key(vhi_type, province_id)
+        self.done[key] = merge_intervals(self.done.get(key, []) + [years])
+
+    def missing(self, vhi_type: str, province_id: int,
+                years: Tuple[int, int]) -> List[Tuple[int, int]]:
+        r"""
+        Get years ranges which are not journaled as completed
+        """
+
+        return missing_intervals(
+            self.done.get(self._key(vhi_type, province_id), []), years)
+
+    def commit(self, vhi_type: str, province_id: int,
+               years: Tuple[int, int]) -> None:
+        r"""
+        Journal completed unit, entry is flushed to disk before return
+        """
+
+        with open(self.fp, "a") as f:
+            f.write(json.dumps({"type": vhi_type, "province": province_id,
+                                "years": list(years)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._add(vhi_type, province_id, years)
+
+
+class Crawler:
+    r"""
+    Resumable crawl of many provinces, years and types into storage file
+
+    Units are fetched concurrently by parser executor. Failed units are
+    retried with exponential backoff, units failed after all retries are
+    left for the next run.
+
+    Usage:
+        crawler = Crawler("dumps/vhi.sqlite")
+        stats = crawler.run()
+    """
+
+    def __init__(self, fp: str, journal_fp: Optional[str] = None,
+                 parser: Optional[Parser] = None, unit_years: int = 10,
+                 retries: int = 5, backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        r"""
+        :param fp: storage file, see Storage.save_to()
+        :param journal_fp: path to journal, "<fp>.journal" by default
+        :param parser: Parser instance
+        :param unit_years: count of years fetched by one unit
+        :param retries: count of retries of failed unit
+        :param backoff: delay before the first retry in seconds, doubled
+                        with every next retry
+        :param max_backoff: max delay between retries in seconds
+        """
+
+        self.fp = fp
+        self.journal = Journal(journal_fp or fp + ".journal")
+
+        self.parser = parser or Parser()
+        self.storage = Storage(self.parser)
+
+        self.unit_years = unit_years
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._methods = {
+            Parser.TYPE_MEAN: self.parser.parse_mean,
+            Parser.TYPE_PAREA: self.parser.parse_parea
+        }
+
+    def units(self, provinces: Iterable[str], years: Tuple[int, int],
+              types: Iterable[str]) -> Tuple[List[CrawlUnit], int]:
+        r"""
+        Split work into units, which are not journaled as completed
+
+        :returns: units and count of completed (type, province) pairs
+        """
+
+        units = []
+        skipped = 0
+        for prov in provinces:
+            province_id = Parser._get_province_id(prov)
+
+            for vhi_type in types:
+                gaps = self.journal.missing(vhi_type, province_id, years)
+                if not gaps:
+                    skipped += 1
+
+                for start, end in gaps:
+                    for y in range(start, end + 1, self.unit_years):
+                        units.append(CrawlUnit(
+                            vhi_type, prov,
+                            (y, min(y + self.unit_years - 1, end))))
+        return (units, skipped)
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter spreads retries of units failed at once
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    def _fetch(self, unit: CrawlUnit) -> WeekRecordBatch:
+        method = self._methods[unit.vhi_type]
+
+        for attempt in range(self.retries + 1):
+            try:
+                return method(unit.province, unit.years)
+            except (ParsingError, NetworkError):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+
+    def run(self, provinces: Optional[Iterable[int]] = None,
+            years: Optional[Tuple[int, int]] = None,
+            types: Iterable[str] = (Parser.TYPE_MEAN, Parser.TYPE_PAREA)
+            ) -> CrawlStats:
+        r"""
+        Crawl units which are not completed yet
+
+        Storage or journal errors stop the crawl, completed units stay
+        journaled
+
+        :param provinces: ids of provinces, all provinces if None
+        :param years: years range (from, to), all available if None
+        :param types: types of VHI records (Parser.TYPE_MEAN/TYPE_PAREA)
+        :rtype: CrawlStats
+        """
+
+        if not self.parser.provinces:
+            self.parser.parse_selectors()
+
+        if years is None:
+            available = [int(y) for y in self.parser.years]
+            years = (min(available), max(available))
+
+        wanted = set(provinces) if provinces is not None else None
+        names = [prov for prov in self.parser.provinces
+                 if wanted is None or Parser._get_province_id(prov) in wanted]
+
+        units, skipped = self.units(names, years, types)
+
+        futures = {self.parser.executor.submit(self._fetch, unit): unit
+                   for unit in units}
+
+        done = 0
+        failed = []
+        try:
+            for fut in as_completed(futures):
+                unit = futures[fut]
+                try:
+                    batch = fut.result()
+                except (ParsingError, NetworkError):
+                    failed.append(unit)
+                    continue
+
+                # Saving is idempotent, so unit saved but not journaled
+                # because of crash is just saved again on resume
+                self.storage.save_to(self.fp, True, [batch])
+                self.journal.commit(unit.vhi_type,
+                                    Parser._get_province_id(unit.province),
+                                    unit.years)
+                done += 1
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+        return CrawlStats(done, skipped, failed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argp = argparse.ArgumentParser(
+        prog="python3 -m vhi.crawl",
+        description="Crawl VHI data to FILE, resuming interrupted crawl")
+
+    argp.add_argument("file", help="path to .sqlite or .csv dataset")
+    argp.add_argument("--journal", help="path to journal "
+                      "(default: FILE.journal)")
+    argp.add_argument("--provinces", type=int, nargs="+",
+                      help="ids of provinces to crawl (default: all)")
+    argp.add_argument("--years", type=int, nargs=2, metavar=("FROM", "TO"),
+                      help="years range (default: all available)")
+    argp.add_argument("--types", nargs="+",
+                      choices=(Parser.TYPE_MEAN, Parser.TYPE_PAREA),
+                      default=(Parser.TYPE_MEAN, Parser.TYPE_PAREA),
+                      help="types of VHI records (default: all)")
+    argp.add_argument("--unit-years", type=int, default=10,
+                      help="count of years fetched by one unit")
+    argp.add_argument("--retries", type=int, default=5,
+                      help="count of retries of failed unit")
+
+    args = argp.parse_args(argv)
+
+    crawler = Crawler(args.file, args.journal, unit_years=args.unit_years,
+                      retries=args.retries)
+    try:
+        stats = crawler.run(args.provinces,
+                            tuple(args.years) if args.years else None,
+                            args.types)
+    except (ParsingError, NetworkError, SavingError, StorageDbError) as e:
+        print("%s: %s" % (e.__class__.__name__, e), file=sys.stderr)
+        return 1
+    finally:
+        crawler.parser.close()
+
+    print("%d units saved to %s, %d province types already completed"
+          % (stats.done, args.file, stats.skipped))
+    for unit in stats.failed:
+        print("Failed: %s %s %d-%d" % (unit.vhi_type, unit.province,
+                                       *unit.years), file=sys.stderr)
+
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
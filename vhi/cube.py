@@ -0,0 +1,230 @@
+r"""
+Memory-mapped VHI data cube
+
+Fixed-layout binary file with float32 array of shape
+(types, provinces, weeks, channels), where weeks are consecutive ISO weeks
+starting from week_origin (see util.iso_week_index()) and channels are
+data columns of records. Missing records are NaN.
+
+File layout:
+    header       HEADER structure, little-endian
+    provinces    int32[n_provinces], sorted province ids
+    types        S16[n_types], types of VHI records
+    widths       int32[n_types], count of channels used by every type
+    data         float32[n_types, n_provinces, n_weeks, n_channels]
+                 at data_offset, aligned to 64 bytes
+
+Readers open data with numpy.memmap, so slices are zero-copy and several
+processes share one page-cached file.
+"""
+
+import os
+import numpy as np
+
+from typing import Iterable, List, Tuple
+
+from .records import WeekRecordBatch, TYPE_PAREA
+from .util import iso_week_index, iso_week_monday
+
+
+MAGIC = b"VHICUBE"
+VERSION = 1
+
+HEADER = np.dtype([
+    ("magic",       "S8"),
+    ("version",     "<u4"),
+    ("n_types",     "<u4"),
+    ("n_provinces", "<u4"),
+    ("n_weeks",     "<u4"),
+    ("n_channels",  "<u4"),
+    ("reserved",    "<u4"),
+    ("week_origin", "<i8"),
+    ("data_offset", "<u8")
+])
+
+ALIGN = 64
+
+
+class VhiCube:
+    r"""
+    Read-only view of cube file
+
+    Usage:
+        cube = VhiCube("dumps/vhi.cube")
+        arr = cube.window(5, (2000, 2010), Parser.TYPE_PAREA)
+    """
+
+    def __init__(self, fp: str):
+        r"""
+        :param fp: path to cube file
+        """
+
+        header = np.fromfile(fp, dtype=HEADER, count=1)
+        if not len(header) or header["magic"][0] != MAGIC:
+            raise ValueError("Not a VHI cube file: %s" % fp)
+
+        header = header[0]
+        if header["version"] != VERSION:
+            raise ValueError("Unsupported VHI cube version: %d"
+                             % header["version"])
+
+        n_types = int(header["n_types"])
+        n_provs = int(header["n_provinces"])
+
+        self.week_origin = int(header["week_origin"])
+
+        self.provinces = np.fromfile(fp, dtype="<i4", count=n_provs,
+                                     offset=HEADER.itemsize)
+        self.types: List[str] = [t.decode() for t in np.fromfile(
+            fp, dtype="S16", count=n_types,
+            offset=HEADER.itemsize + self.provinces.nbytes)]
+        self.widths: List[int] = np.fromfile(
+            fp, dtype="<i4", count=n_types,
+            offset=HEADER.itemsize + self.provinces.nbytes + n_types * 16
+        ).tolist()
+
+        shape = (n_types, n_provs, int(header["n_weeks"]),
+                 int(header["n_channels"]))
+
+        # Empty cube could not be mapped
+        if 0 in shape:
+            self.data = np.empty(shape, dtype="<f4")
+        else:
+            self.data = np.memmap(fp, dtype="<f4", mode="r",
+                                  offset=int(header["data_offset"]),
+                                  shape=shape)
+
+    def _index(self, province: int, vhi_type: str) -> Tuple[int, int]:
+        p = int(np.searchsorted(self.provinces, province))
+        if p == len(self.provinces) or self.provinces[p] != province:
+            raise KeyError("Province %d is not in cube" % province)
+
+        return (self.types.index(vhi_type), p)
+
+    def _weeks(self, years: Tuple[int, int]) -> Tuple[int, int]:
+        lo, hi = iso_week_index([years[0], years[1] + 1], [1, 1]).tolist()
+        n_weeks = self.data.shape[2]
+
+        return (min(max(lo - self.week_origin, 0), n_weeks),
+                min(max(hi - self.week_origin, 0), n_weeks))
+
+    def window(self, province: int, years: Tuple[int, int],
+               vhi_type: str = TYPE_PAREA) -> np.ndarray:
+        r"""
+        Get records of province in years range without copying
+
+        :param province: province id
+        :param years: years range (from, to)
+        :param vhi_type: type of VHI records
+        :returns: float32 array (weeks, channels), NaN for missing weeks
+        """
+
+        t, p = self._index(province, vhi_type)
+        lo, hi = self._weeks(years)
+
+        return self.data[t, p, lo:hi, :self.widths[t]]
+
+    def dates(self, years: Tuple[int, int]) -> np.ndarray:
+        r"""
+        Monday dates of weeks returned by window() for the same years
+
+        :returns: array of datetime64[D]
+        """
+
+        lo, hi = self._weeks(years)
+        idx = np.arange(lo, hi) + self.week_origin
+
+        # Week index 0 is the week of 1970-01-05
+        return (idx * 7 + 4).astype("datetime64[D]")
+
+    def to_batches(self) -> List[WeekRecordBatch]:
+        r"""
+        Convert cube back to batches, one per type and province
+        """
+
+        ret = []
+        for t, (vhi_type, width) in enumerate(zip(self.types, self.widths)):
+            for p, province in enumerate(self.provinces.tolist()):
+                data = np.asarray(self.data[t, p, :, :width])
+                weeks = np.flatnonzero(~np.isnan(data).all(axis=1))
+                if not weeks.size:
+                    continue
+
+                dates = (weeks + self.week_origin) * 7 + 4
+                year, week = _iso_calendar(dates)
+
+                ret.append(WeekRecordBatch(np.full(weeks.size, province),
+                                           year, week, data[weeks],
+                                           vhi_type))
+        return ret
+
+    @staticmethod
+    def build(fp: str, batches: Iterable[WeekRecordBatch]) -> None:
+        r"""
+        Write cube file from batches
+
+        :param fp: path to output file
+        :param batches: records of any types and provinces
+        """
+
+        batches = [b for b in batches if len(b)]
+
+        types = sorted({b.vhi_type for b in batches})
+        provinces = np.unique(np.concatenate(
+            [b.province for b in batches] or [np.empty(0, dtype="<i4")]))
+
+        weeks = [iso_week_index(b.year, b.week) for b in batches]
+        origin = min((int(w.min()) for w in weeks), default=0)
+        n_weeks = max((int(w.max()) for w in weeks), default=origin - 1) \
+            - origin + 1
+
+        widths = [max(b.width for b in batches if b.vhi_type == t)
+                  for t in types]
+        n_channels = max(widths, default=0)
+
+        offset = HEADER.itemsize + provinces.size * 4 + len(types) * 20
+        offset += -offset % ALIGN
+
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, VERSION, len(types), provinces.size, n_weeks,
+                     n_channels, 0, origin, offset)
+
+        shape = (len(types), provinces.size, n_weeks, n_channels)
+
+        tmp = fp + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(header.tobytes())
+            f.write(provinces.astype("<i4").tobytes())
+            f.write(np.array(types, dtype="S16").tobytes())
+            f.write(np.array(widths, dtype="<i4").tobytes())
+            f.truncate(offset + int(np.prod(shape)) * 4)
+
+        if 0 not in shape:
+            cube = np.memmap(tmp, dtype="<f4", mode="r+", offset=offset,
+                             shape=shape)
+            cube[:] = np.nan
+
+            for batch, w in zip(batches, weeks):
+                t = types.index(batch.vhi_type)
+                p = np.searchsorted(provinces, batch.province)
+
+                # Narrower records (e.g. Mean saved with VHI only) are
+                # right-aligned, so VHI stays in the last channel of type
+                width = widths[t]
+                cube[t, p, w - origin, width - batch.width:width] = batch.data
+
+            cube.flush()
+            del cube
+
+        os.replace(tmp, fp)
+
+
+def _iso_calendar(days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # ISO year of Monday is the year of its Thursday
+    thursday = np.asarray(days, dtype=np.int64) + 3
+    year = thursday.astype("datetime64[D]").astype("datetime64[Y]") \
+        .astype(np.int64) + 1970
+
+    week = (days - iso_week_monday(year, np.ones_like(year))
+            .astype(np.int64)) // 7 + 1
+    return (year, week)
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from .cache import MemoCache
+from .records import WeekRecordBatch
+from .util import iso_week_monday
+
+
+# Date indexes by weeks of records, see week_dates()
+_DATES_CACHE = MemoCache(max_entries=256, max_size=32 * 1024 * 1024)
+
+
+def week_dates(records: WeekRecordBatch) -> pd.DatetimeIndex:
+    r"""
+    Index of Monday dates of weeks of records, named "YW"
+
+    Indexes are cached by (province, year, week) keys of records, so
+    frames built from the same records, e.g. Mean and Parea frames of one
+    province and years, share one index object
+
+    :param records: batch of records
+    :returns: index with date per record
+    :rtype: pd.DatetimeIndex
+    """
+
+    return _DATES_CACHE.get_or_compute(
+        records.keys().tobytes(),
+        lambda: pd.DatetimeIndex(
+            iso_week_monday(records.year, records.week)
+            .astype("datetime64[ns]"), name="YW"))
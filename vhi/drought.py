@@ -0,0 +1,189 @@
+r"""
+Drought classification of Percentage of Area records
+
+Week is a moderate drought week when at least moderate_count of 20
+VHI buckets cover more than moderate_low and less than moderate_high
+share of area, and extreme drought week when at least extreme_count
+buckets cover no more than extreme_high share of area.
+"""
+
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from .cache import MemoCache
+from .records import WeekRecordBatch
+from .dates import week_dates
+
+
+class DroughtThresholds(NamedTuple):
+    """
+    NamedTuple for representation of drought classification thresholds
+    """
+
+    moderate_low: float = 0.1
+    moderate_high: float = 1.0
+    moderate_count: int = 3
+    extreme_high: float = 0.1
+    extreme_count: int = 10
+
+
+class DroughtResult(NamedTuple):
+    """
+    NamedTuple for representation of classified weeks of records
+    """
+
+    dates: pd.DatetimeIndex
+    moderate: np.ndarray
+    extreme: np.ndarray
+    digest: int
+
+    @property
+    def moderate_dates(self) -> pd.DatetimeIndex:
+        return self.dates[self.moderate]
+
+    @property
+    def extreme_dates(self) -> pd.DatetimeIndex:
+        return self.dates[self.extreme]
+
+
+def buckets(records: WeekRecordBatch) -> np.ndarray:
+    r"""
+    Matrix of 20 VHI buckets of Parea records without copying
+    """
+
+    return records.data[:, 1:21].reshape(len(records), -1)
+
+
+def classify(shares: np.ndarray,
+             thresholds: DroughtThresholds = DroughtThresholds()
+             ) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Classify weeks by buckets, reduces the last axis, so stacked arrays
+    of many provinces are classified at once
+
+    :param shares: array of shape (..., 20) with share of area per bucket
+    :param thresholds: classification thresholds
+    :returns: masks of moderate and extreme drought weeks
+    """
+
+    moderate = np.count_nonzero((shares > thresholds.moderate_low) &
+                                (shares < thresholds.moderate_high),
+                                axis=-1) >= thresholds.moderate_count
+    extreme = np.count_nonzero(shares <= thresholds.extreme_high,
+                               axis=-1) >= thresholds.extreme_count
+
+    return (moderate, extreme)
+
+
+class DroughtEngine:
+    r"""
+    Memoized drought classification of Parea records
+
+    Results are cached by (provinces, years, thresholds) and checked
+    against checksum of records (WeekRecordBatch.digest, computed once
+    per batch), so refreshed records are classified again. Inputs are
+    never modified.
+
+    Usage:
+        engine = DroughtEngine()
+        res = engine.analyze(parser.parse_parea(province, (2000, 2020)))
+        vhi[vhi.index.isin(res.moderate_dates)]
+    """
+
+    def __init__(self, thresholds: DroughtThresholds = DroughtThresholds(),
+                 max_entries: int = 256):
+        r"""
+        :param thresholds: default classification thresholds
+        :param max_entries: limit of cached results
+        """
+
+        self.thresholds = thresholds
+        self.cache = MemoCache(max_entries)
+
+    @staticmethod
+    def _key(records: WeekRecordBatch, years: Optional[Tuple[int, int]],
+             thresholds: DroughtThresholds) -> Tuple:
+        if years is None:
+            years = (int(records.year.min()), int(records.year.max())) \
+                if len(records) else (0, 0)
+
+        return (tuple(np.unique(records.province).tolist()), tuple(years),
+                thresholds)
+
+    def _lookup(self, key: Tuple, digest: int) -> Optional[DroughtResult]:
+        res = self.cache.get(key)
+        return res if res is not None and res.digest == digest else None
+
+    def analyze(self, records: WeekRecordBatch,
+                years: Optional[Tuple[int, int]] = None,
+                thresholds: Optional[DroughtThresholds] = None
+                ) -> DroughtResult:
+        r"""
+        Classify weeks of records
+
+        :param records: Parea records of one province
+        :param years: years range of records, used as part of cache key,
+                      range of records by default
+        :param thresholds: classification thresholds, default if None
+        :rtype: DroughtResult
+        """
+
+        thresholds = thresholds or self.thresholds
+
+        key = self._key(records, years, thresholds)
+        digest = records.digest
+
+        res = self._lookup(key, digest)
+        if res is None:
+            res = DroughtResult(week_dates(records),
+                                *classify(buckets(records), thresholds),
+                                digest)
+            self.cache.put(key, res)
+        return res
+
+    def analyze_many(self, batches: Iterable[WeekRecordBatch],
+                     years: Optional[Tuple[int, int]] = None,
+                     thresholds: Optional[DroughtThresholds] = None
+                     ) -> Dict[int, DroughtResult]:
+        r"""
+        Classify weeks of many provinces in one pass over stacked array
+
+        :param batches: Parea records, batch per province
+        :param years: years range of records, see analyze()
+        :param thresholds: classification thresholds, default if None
+        :returns: results by province id
+        """
+
+        thresholds = thresholds or self.thresholds
+
+        ret = {}
+        missed = []
+        for batch in batches:
+            if not len(batch):
+                continue
+
+            key = self._key(batch, years, thresholds)
+            digest = batch.digest
+
+            res = self._lookup(key, digest)
+            if res is None:
+                missed.append((key, digest, batch))
+            else:
+                ret[key[0][0]] = res
+
+        if missed:
+            moderate, extreme = classify(
+                np.concatenate([buckets(b) for _, _, b in missed]),
+                thresholds)
+
+            offsets = np.cumsum([0] + [len(b) for _, _, b in missed])
+            for (key, digest, batch), lo, hi in zip(missed, offsets[:-1],
+                                                     offsets[1:]):
+                res = DroughtResult(week_dates(batch), moderate[lo:hi],
+                                    extreme[lo:hi], digest)
+                self.cache.put(key, res)
+                ret[key[0][0]] = res
+
+        return ret
@@ -0,0 +1,231 @@
+r"""
+Range-query index over weekly values of one province
+
+Index is built once per loaded records. Window bounds are found in
+O(log n), then min/max are answered in O(1) with sparse tables and mean
+with prefix sums, without building DataFrames. Per-year min/max/mean are
+precomputed in summary.
+"""
+
+import numpy as np
+import pandas as pd
+
+from typing import List, NamedTuple, Optional, Tuple
+
+from .dates import week_dates
+from .records import WeekRecordBatch
+
+
+class WeekValue(NamedTuple):
+    """
+    NamedTuple for representation of value of one week
+    """
+
+    year: int
+    week: int
+    value: float
+
+
+class YearSummary(NamedTuple):
+    """
+    NamedTuple for representation of per-year summary arrays
+    """
+
+    year: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+
+
+def _sparse_table(values: np.ndarray, better: np.ufunc) -> List[np.ndarray]:
+    r"""
+    Build sparse table of indices of best values, level k holds best of
+    windows of 2^k values starting at every position. better is np.less
+    for min or np.greater for max, ties are resolved to earlier index
+    """
+
+    levels = [np.arange(len(values))]
+
+    width = 1
+    while width * 2 <= len(values):
+        prev = levels[-1]
+        left, right = prev[:-width], prev[width:]
+
+        levels.append(np.where(better(values[right], values[left]),
+                               right, left))
+        width *= 2
+
+    return levels
+
+
+class ExtremumIndex:
+    r"""
+    Index of one data column of records of one province
+
+    Usage:
+        index = ExtremumIndex(parser.parse_mean(province, (1982, 2022)))
+        index.min((2000, 2010)), index.worst(5, (2000, 2010))
+        index.summary.mean
+    """
+
+    def __init__(self, records: WeekRecordBatch, label: str = "VHI"):
+        r"""
+        :param records: records of one province
+        :param label: data column to index, see WeekRecordBatch.labels
+        """
+
+        records = records.sorted()
+
+        self.records = records
+        self.label = label
+        self.values = np.asarray(records.column(label), dtype=np.float64) \
+            if len(records) else np.empty(0)
+
+        # Missing values never win min/max queries and are skipped by mean
+        valid = ~np.isnan(self.values)
+        self._min_values = np.where(valid, self.values, np.inf)
+        self._max_values = np.where(valid, self.values, -np.inf)
+
+        self._min = _sparse_table(self._min_values, np.less)
+        self._max = _sparse_table(self._max_values, np.greater)
+
+        self._sum = np.concatenate(
+            [[0.0], np.cumsum(np.where(valid, self.values, 0.0))])
+        self._count = np.concatenate([[0], np.cumsum(valid)])
+
+        # Records of year i are in range [bounds[i], bounds[i + 1])
+        self.years, starts = np.unique(records.year, return_index=True)
+        self._bounds = np.append(starts, len(records))
+
+        self.summary = self._summarize()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _window(self, years: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+        if years is None:
+            return (0, len(self.values))
+
+        lo, hi = np.searchsorted(self.records.year, (years[0], years[1] + 1))
+        return (int(lo), int(hi))
+
+    def _query(self, table: List[np.ndarray], lo: int, hi: int) -> int:
+        k = (hi - lo).bit_length() - 1
+
+        left, right = table[k][lo], table[k][hi - (1 << k)]
+        if table is self._min:
+            return int(right if self._min_values[right] <
+                       self._min_values[left] else left)
+        return int(right if self._max_values[right] >
+                   self._max_values[left] else left)
+
+    def _week(self, idx: int) -> WeekValue:
+        return WeekValue(int(self.records.year[idx]),
+                         int(self.records.week[idx]),
+                         float(self.values[idx]))
+
+    def _arg(self, table: List[np.ndarray],
+             years: Optional[Tuple[int, int]]) -> Optional[int]:
+        lo, hi = self._window(years)
+        if lo >= hi or self._count[hi] == self._count[lo]:
+            return None
+        return self._query(table, lo, hi)
+
+    def min(self, years: Optional[Tuple[int, int]] = None
+            ) -> Optional[WeekValue]:
+        r"""
+        Week with min value in years window, the earliest one on ties
+
+        :param years: years range (from, to), all records if None
+        :returns: week and value, None if window is empty
+        """
+
+        idx = self._arg(self._min, years)
+        return self._week(idx) if idx is not None else None
+
+    def max(self, years: Optional[Tuple[int, int]] = None
+            ) -> Optional[WeekValue]:
+        r"""
+        Week with max value in years window, see min()
+        """
+
+        idx = self._arg(self._max, years)
+        return self._week(idx) if idx is not None else None
+
+    def mean(self, years: Optional[Tuple[int, int]] = None) -> float:
+        r"""
+        Mean value in years window, NaN if window is empty
+        """
+
+        lo, hi = self._window(years)
+        count = self._count[hi] - self._count[lo]
+        return float((self._sum[hi] - self._sum[lo]) / count) if count \
+            else float("nan")
+
+    def worst(self, n: int, years: Optional[Tuple[int, int]] = None
+              ) -> List[WeekValue]:
+        r"""
+        Weeks with the lowest values in years window
+
+        :param n: count of weeks
+        :param years: years range (from, to), all records if None
+        :returns: weeks sorted by value, then by date
+        """
+
+        lo, hi = self._window(years)
+        values = self.values[lo:hi]
+        idx = np.flatnonzero(~np.isnan(values))
+
+        if n < len(idx):
+            # Weeks tied with n-th value are taken by date, idx is sorted
+            kth = np.partition(values[idx], n - 1)[n - 1]
+            lower = idx[values[idx] < kth]
+            idx = np.concatenate(
+                [lower, idx[values[idx] == kth][:n - len(lower)]])
+        idx = idx[np.lexsort((idx, values[idx]))]
+
+        return [self._week(i) for i in (idx + lo).tolist()]
+
+    def extremums(self, years: Optional[Tuple[int, int]] = None
+                  ) -> Tuple[pd.Series, pd.Series]:
+        r"""
+        Min and max weeks as one-point series indexed by date, same as
+        MeanFrame.get_extremums() of frame of years window
+        """
+
+        dates = week_dates(self.records)
+
+        ret = []
+        for table in (self._min, self._max):
+            idx = self._arg(table, years)
+            if idx is None:
+                ret.append(pd.Series([], index=dates[:0], name=self.label,
+                                     dtype=np.float64))
+            else:
+                ret.append(pd.Series(self.values[idx:idx + 1],
+                                     index=dates[idx:idx + 1],
+                                     name=self.label))
+        return tuple(ret)
+
+    def _summarize(self) -> YearSummary:
+        r"""
+        Per-year min, max and mean values
+        """
+
+        if not len(self.values):
+            empty = np.empty(0)
+            return YearSummary(self.years, empty, empty, empty)
+
+        starts = self._bounds[:-1]
+        mins = np.minimum.reduceat(self._min_values, starts)
+        maxs = np.maximum.reduceat(self._max_values, starts)
+
+        counts = np.diff(self._count[self._bounds])
+        sums = np.diff(self._sum[self._bounds])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+        empty = counts == 0
+        mins[empty] = maxs[empty] = np.nan
+
+        return YearSummary(self.years, mins, maxs, means)
@@ -0,0 +1,273 @@
+import time
+import random
+import threading
+import requests
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from requests.adapters import HTTPAdapter
+
+from .error import NetworkError
+
+
+def make_session(pool_size: int) -> requests.Session:
+    r"""
+    Create requests.Session with connection pool shared between threads
+
+    :param pool_size: count of kept-alive connections per host
+    :returns: session object
+    :rtype: requests.Session
+    """
+
+    session = requests.Session()
+
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+class TokenBucket:
+    r"""
+    Limits rate of requests, allowing bursts of up to burst requests
+    """
+
+    def __init__(self, rate: float, burst: int):
+        r"""
+        :param rate: tokens added per second
+        :param burst: max count of accumulated tokens
+        """
+
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        r"""
+        Take one token, blocks until it is available
+
+        Token is reserved before waiting, so waiting threads are served
+        in order of arrival
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._stamp) * self.rate)
+            self._stamp = now
+
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AimdLimiter:
+    r"""
+    Concurrency limit with additive increase and multiplicative decrease
+
+    Every successful request adds 1 / limit, so limit grows by one per
+    window of limit requests. Congestion (429, 5xx, timeout) multiplies
+    limit by decrease, at most once per cooldown, since requests of one
+    window usually fail together.
+
+    Usage:
+        with limiter:
+            ...
+            limiter.success()
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1,
+                 max_limit: int = 16, decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        r"""
+        :param initial: initial limit of requests in flight
+        :param min_limit: lower bound of limit
+        :param max_limit: upper bound of limit
+        :param decrease: factor applied to limit on congestion
+        :param cooldown: min interval between decreases in seconds
+        """
+
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self._in_flight = 0
+        self._decreased = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "AimdLimiter":
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def success(self) -> None:
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def congestion(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._decreased < self.cooldown:
+                return
+
+            self._decreased = now
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+
+
+class RequestScheduler:
+    r"""
+    Schedules GET requests to every host through token bucket and AIMD
+    concurrency limit. Requests failed with 429, 5xx, timeout or
+    connection error are retried with exponential backoff, Retry-After
+    header is respected. Other failures raise NetworkError at once.
+    """
+
+    # Statuses which mean server is overloaded
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, rate: Optional[float] = 10.0, burst: int = 10,
+                 concurrency: int = 4, max_concurrency: int = 16,
+                 timeout: Union[float, Tuple[float, float]] = (10.0, 60.0),
+                 retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 30.0):
+        r"""
+        :param rate: requests per second to every host, None disables
+                     rate limit
+        :param burst: count of requests allowed at once after idle time
+        :param concurrency: initial limit of requests in flight per host
+        :param max_concurrency: upper bound of adaptive limit per host
+        :param timeout: timeout of request in seconds, or (connect, read)
+        :param retries: count of retries of failed request
+        :param backoff: delay before the first retry in seconds, doubled
+                        with every next retry
+        :param max_backoff: max delay between retries in seconds
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_concurrency = max(concurrency, max_concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Tuple[Optional[TokenBucket],
+                                     AimdLimiter]] = {}
+
+    def _host(self, url: str) -> Tuple[Optional[TokenBucket], AimdLimiter]:
+        host = urlsplit(url).netloc
+
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = (
+                    TokenBucket(self.rate, self.burst) if self.rate else None,
+                    AimdLimiter(self.concurrency,
+                                max_limit=self.max_concurrency))
+        return state
+
+    def limit(self, url: str) -> float:
+        r"""
+        Current concurrency limit of host of url
+        """
+
+        return self._host(url)[1].limit
+
+    def _delay(self, attempt: int,
+               resp: Optional[requests.Response]) -> float:
+        retry_after = resp.headers.get("Retry-After") if resp is not None \
+            else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+
+        # Full jitter spreads retries of requests failed at once
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    @contextmanager
+    def request(self, session: requests.Session, url: str,
+                headers: Optional[dict] = None,
+                stream: bool = False) -> Iterator[requests.Response]:
+        r"""
+        Send GET request, slot of host is held until context exits,
+        so streamed body is read within concurrency limit
+
+        :param session: session to send request with
+        :param url: requested URL
+        :param headers: request headers
+        :param stream: do not download body at once
+        :returns: context manager with response, which is closed on exit
+        :raises NetworkError: request failed after all retries
+        """
+
+        bucket, limiter = self._host(url)
+
+        for attempt in range(self.retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+
+            resp = None
+            with limiter:
+                try:
+                    resp = session.get(url, headers=headers, stream=stream,
+                                       timeout=self.timeout)
+                except (requests.Timeout, requests.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    limiter.congestion()
+                    error = NetworkError(e)
+                except requests.RequestException as e:
+                    raise NetworkError(e)
+                else:
+                    if resp.status_code in self.RETRY_STATUSES:
+                        limiter.congestion()
+                        error = NetworkError("HTTP %d: %s"
+                                             % (resp.status_code, url))
+                        resp.close()
+                    elif resp.status_code >= 400:
+                        resp.close()
+                        raise NetworkError("HTTP %d: %s"
+                                           % (resp.status_code, url))
+                    else:
+                        limiter.success()
+                        try:
+                            yield resp
+                        finally:
+                            resp.close()
+                        return
+
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, resp))
+
+        raise error
+
+    def get(self, session: requests.Session, url: str,
+            headers: Optional[dict] = None) -> requests.Response:
+        r"""
+        Send GET request and download body, see request()
+        """
+
+        with self.request(session, url, headers) as resp:
+            # Read body before connection is released
+            resp.content
+            return resp
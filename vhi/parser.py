@@ -1,37 +1,37 @@
-import re
+import functools
+import threading
 import requests
 import lxml.html
+import numpy as np
 
 from urllib.parse import urlencode
-from typing import Tuple, List, NamedTuple, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import (
+    Tuple, List, Dict, Callable, Optional, Iterator, Iterable, Union
+)
+
+from .error import ParsingError, NetworkError
+from .records import (
+    WeekRecord, WeekRecordBatch, TYPE_MEAN, TYPE_PAREA, MEAN_LABELS
+)
+from .net import make_session, RequestScheduler
+from .extremum import ExtremumIndex
+from .cache import (
+    ResponseCache, MemoCache, RangeCache, CacheStats, default_cache_dir
+)
 
-from .error import ParsingError
 
-
-class WeekRecord(NamedTuple):
-    """
-    NamedTuple for representation of weekly VHI records
+def cached(fn):
+    r"""
+    Memoizes parsing method in Parser.cache by (method, province, years)
     """
 
-    province: int
-    year: int
-    week: int
-    data: List[float]
-
-    def __str__(self):
-        return "{},{},{},{}".format(*self[:3],
-                                    ",".join([str(i) for i in self.data]))
-
-
-def cached(fn):
+    @functools.wraps(fn)
     def wrapper(self, province, years):
-        key = hash((fn.__name__, province, years))
+        key = (fn.__name__, province, tuple(years))
 
-        recs = self.cache.get(key)
-        if not recs:
-            recs = fn(self, province, years)
-            self.cache[key] = recs
-        return recs
+        return self.cache.get_or_compute(
+            key, lambda: fn(self, province, years))
     return wrapper
 
 
@@ -52,10 +52,38 @@ class Parser():
     COUNTRY_ID = "UKR"  # Ukraine
 
     # Types of VHI Data
-    TYPE_MEAN = "Mean"
-    TYPE_PAREA = "VHI_Parea"
+    TYPE_MEAN = TYPE_MEAN
+    TYPE_PAREA = TYPE_PAREA
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 cache_ttl: float = 24 * 60 * 60,
+                 cache_max_size: int = 256 * 1024 * 1024,
+                 memo_max_entries: int = 512,
+                 memo_max_size: int = 128 * 1024 * 1024,
+                 pool_size: int = 8,
+                 host_concurrency: int = 4,
+                 max_host_concurrency: int = 16,
+                 rate_limit: Optional[float] = 10.0,
+                 timeout: Union[float, Tuple[float, float]] = (10.0, 60.0),
+                 retries: int = 3):
+        r"""
+        :param cache_dir: directory for on-disk response cache,
+                          default_cache_dir() if None, empty string
+                          disables it
+        :param cache_ttl: seconds while cached response considered fresh
+        :param cache_max_size: limit of on-disk cache size in bytes
+        :param memo_max_entries: limit of in-memory cached record lists
+        :param memo_max_size: limit of in-memory cache size in bytes
+        :param pool_size: count of worker threads and pooled connections
+        :param host_concurrency: initial limit of simultaneous requests to
+                                 NOAA, adapted to server load
+        :param max_host_concurrency: upper bound of adapted limit
+        :param rate_limit: requests per second to NOAA, None disables it
+        :param timeout: timeout of request in seconds, or (connect, read)
+        :param retries: count of retries of requests failed with 429, 5xx,
+                        timeout or connection error
+        """
 
-    def __init__(self):
         # For storing provinces parsed from selectors on web page
         self.provinces: List[str] = []
 
@@ -69,7 +97,104 @@ class Parser():
             "Connection": "keep-alive"
         }
 
-        self.cache = {}
+        # Keep-alive connections shared by all requests
+        self.session = make_session(max(pool_size, max_host_concurrency))
+        self.scheduler = RequestScheduler(
+            rate=rate_limit, concurrency=host_concurrency,
+            max_concurrency=max_host_concurrency, timeout=timeout,
+            retries=retries)
+
+        self.pool_size = pool_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Parsed records shared between threads
+        self.cache = MemoCache(memo_max_entries, memo_max_size)
+
+        # Records by (type, province_id) with covered years
+        self.ranges = RangeCache(memo_max_entries, memo_max_size)
+
+        # Persistent cache of raw responses, survives application restarts
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.disk_cache = ResponseCache(cache_dir, cache_ttl,
+                                        cache_max_size) if cache_dir else None
+
+        # Years ranges of disk cache entries by (type, province_id), read
+        # from disk on first use
+        self._disk_ranges: Optional[Dict[Tuple[str, int],
+                                         List[Tuple[int, int]]]] = None
+        self._disk_lock = threading.Lock()
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        r"""
+        Hit/miss/eviction statistics of in-memory cache
+        """
+
+        return self.cache.stats
+
+    def batches(self) -> Iterator[WeekRecordBatch]:
+        r"""
+        Iterate over batches of all parsed records without duplicates,
+        one batch per type and province
+        """
+
+        return self.ranges.values()
+
+    def records(self) -> Iterator[WeekRecord]:
+        r"""
+        Iterate over all parsed records without duplicates
+        """
+
+        for batch in self.batches():
+            yield from batch
+
+    def invalidate(self, province: Optional[str] = None,
+                   vhi_type: Optional[str] = None) -> None:
+        r"""
+        Drop in-memory records, so they will be fetched again
+
+        :param province: province name, all provinces if None
+        :param vhi_type: type of VHI records, all types if None
+        """
+
+        province_id = self._get_province_id(province) if province else None
+
+        def match(key):
+            return ((vhi_type is None or key[0] == vhi_type) and
+                    (province_id is None or key[1] == province_id))
+
+        self.ranges.invalidate(match)
+        self.cache.clear()
+
+    def _get(self, url: str, headers: Optional[dict] = None
+             ) -> requests.Response:
+        return self.scheduler.get(self.session, url, headers or self.headers)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        r"""
+        Thread pool for concurrent fetching, created on first use
+        """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="vhi-fetch")
+        return self._executor
+
+    def close(self) -> None:
+        r"""
+        Shut down thread pool and close pooled connections
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    @staticmethod
+    def _get_province_id(province: str) -> int:
+        return int(province[:province.find(":")])
 
     def parse_selectors(self) -> None:
         """
@@ -78,17 +203,37 @@ class Parser():
         Stores result to provinces and years members
         """
 
-        resp = requests.get(self.BROWSER_URN + f"?country={self.COUNTRY_ID}",
-                            headers=self.headers)
+        resp = self._get(self.BROWSER_URN + f"?country={self.COUNTRY_ID}")
+
+        provinces, years = self._parse_selectors_html(resp.text)
 
-        dom_root = lxml.html.fromstring(resp.text)
+        self.provinces.extend(provinces)
+        self.years.extend(years)
 
-        self.provinces.extend(dom_root.xpath(
-            "//select[@id='Province']/option/text()"))
+    @staticmethod
+    def _parse_selectors_html(html: str) -> Tuple[List[str], List[str]]:
+        dom_root = lxml.html.fromstring(html)
 
-        # Skipping first 'cause it's Combobox name
-        self.years.extend(dom_root.xpath(
-            "//select[@id='Year1']/option/text()")[1:])
+        # Skipping first year 'cause it's Combobox name
+        return (dom_root.xpath("//select[@id='Province']/option/text()"),
+                dom_root.xpath("//select[@id='Year1']/option/text()")[1:])
+
+    @classmethod
+    def _raw_data_query(cls, province_id: int, years: Tuple[int, int],
+                        vhi_type: str) -> str:
+        return urlencode({
+            "country":    cls.COUNTRY_ID,
+            "provinceID": province_id,
+            "year1":      years[0],
+            "year2":      years[1],
+            "type":       vhi_type
+        })
+
+    @staticmethod
+    def _extract_pre(html: str) -> str:
+        # Get inner text of "pre" tag without trailing newline
+        start = html.index("<pre>") + 5
+        return html[start:html.index("</pre>", start) - 1]
 
     def _get_raw_vhi_data(self, province: str, years: Tuple[int, int],
                           vhi_type: str) -> Tuple[int, Optional[str]]:
@@ -98,73 +243,207 @@ class Parser():
         Returns string with rows separated by \n.
         Each row has columns separated by commas
 
+        Fresh responses are read from disk cache. Stale ones are revalidated
+        with ETag/Last-Modified when server sent them, otherwise they are
+        downloaded again and compared by content hash.
+
         :param province: province name, which was parsed from web page
         :param years: years range (from, to)
         :vhi_type: type of VHI records to get (Mean or Percentage of Area)
         :rtype: str
         """
 
-        province_id = int(province[:province.find(":")])
+        province_id = self._get_province_id(province)
 
-        query = urlencode({
-            "country":    self.COUNTRY_ID,
-            "provinceID": province_id,
-            "year1":      years[0],
-            "year2":      years[1],
-            "type":       vhi_type
-        })
+        key = (self.COUNTRY_ID, province_id, years[0], years[1], vhi_type)
+
+        entry = self.disk_cache.get(key) if self.disk_cache else None
+        if entry and self.disk_cache.is_fresh(entry):
+            return (province_id, entry.body)
+
+        query = self._raw_data_query(province_id, years, vhi_type)
+
+        headers = dict(self.headers)
+        if entry:
+            headers.update(entry.validators())
+
+        resp = self._get("%s?%s" % (self.RAW_DATA_URN, query), headers)
+
+        # Cached response is still valid
+        if entry and resp.status_code == 304:
+            self.disk_cache.touch(key)
+            return (province_id, entry.body)
+
+        body = self._extract_pre(resp.text)
+
+        if self.disk_cache:
+            self.disk_cache.put(key, body, resp.headers.get("ETag"),
+                                resp.headers.get("Last-Modified"))
+            with self._disk_lock:
+                self._add_disk_range(key)
+
+        return (province_id, body)
+
+    def _add_disk_range(self, key: Tuple) -> None:
+        # Must be called with _disk_lock held
+        if self._disk_ranges is not None:
+            self._disk_ranges.setdefault((key[4], key[1]), []).append(
+                (key[2], key[3]))
+
+    def _disk_ranges_of(self, vhi_type: str,
+                        province_id: int) -> List[Tuple[int, int]]:
+        r"""
+        Years ranges stored in disk cache for type and province
+        """
 
-        resp = requests.get("%s?%s" % (self.RAW_DATA_URN, query),
-                            headers=self.headers)
+        with self._disk_lock:
+            if self._disk_ranges is None:
+                self._disk_ranges = {}
+                for key in self.disk_cache.keys():
+                    if len(key) == 5 and key[0] == self.COUNTRY_ID:
+                        self._add_disk_range(key)
+
+            return list(self._disk_ranges.get((vhi_type, province_id), []))
+
+    def _load_disk_ranges(self, province: str, years: Tuple[int, int],
+                          vhi_type: str, filter: Callable) -> None:
+        r"""
+        Add fresh disk cache entries overlapping years to range cache,
+        so ranges fetched in pieces before restart are not requested
+        again. Stale entries are left for revalidation
+        """
+
+        province_id = self._get_province_id(province)
+        key = (vhi_type, province_id)
+
+        for y1, y2 in self._disk_ranges_of(vhi_type, province_id):
+            if y2 < years[0] or y1 > years[1] or \
+                    not self.ranges.missing(key, (y1, y2)):
+                continue
+
+            entry = self.disk_cache.get(
+                (self.COUNTRY_ID, province_id, y1, y2, vhi_type))
+            if entry is None or not self.disk_cache.is_fresh(entry):
+                continue
+
+            self.ranges.add(key, (y1, y2), self._parse_vhi(
+                (province_id, entry.body), filter, vhi_type))
+
+    @staticmethod
+    def _parse_vhi_array(raw: str) -> np.ndarray:
+
+        """
+        Parses raw VHI data into 2-D float array in one pass.
+
+        :param raw: inner text of <pre> tag, rows separated by \n
+        :returns: array with row per week, first columns are year and week
+        :rtype: np.ndarray
+        """
+
+        first = raw.lstrip().split("\n", 1)[0]
+        ncols = sum(1 for col in first.split(",") if col.strip())
+        if not ncols:
+            return np.empty((0, 0))
+
+        arr = np.fromstring(raw.replace(",", " "), sep=" ")
+        if arr.size % ncols:
+            raise ValueError("Malformed VHI data: %d values in rows of %d"
+                             % (arr.size, ncols))
 
-        # Get inner text of "pre" tag
-        return (province_id,
-                re.search(r"<pre>((?:.|\n|\r)*?)</pre>", resp.text)[0][5:-7])
+        return arr.reshape(-1, ncols)
 
-    def _parse_vhi(self, vhi_data: Tuple[int, str],
-                   filter: Callable) -> List[WeekRecord]:
+    @staticmethod
+    def _parse_vhi(vhi_data: Tuple[int, str], filter: Callable,
+                   vhi_type: Optional[str] = None) -> WeekRecordBatch:
 
         """
         Parses VHI records from raw data.
 
         :param vhi_data: result of _get_raw_vhi_data() method
+        :param filter: function which takes array of data columns and
+                       returns (mask of rows to keep, columns to keep)
+        :param vhi_type: type of VHI records (Mean or VHI_Parea)
+        :returns: batch of parsed records
+        :rtype: WeekRecordBatch
+        """
+
+        arr = Parser._parse_vhi_array(vhi_data[1])
+        if not arr.size:
+            return WeekRecordBatch.empty(vhi_type)
+
+        mask, data = filter(arr[:, 2:])
+
+        return WeekRecordBatch(np.full(np.count_nonzero(mask), vhi_data[0]),
+                               arr[mask, 0], arr[mask, 1], data[mask],
+                               vhi_type)
+
+    @staticmethod
+    def _mean_filter(dat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Ignore rows with negative VHI, keep all indices
+        # (SMN, SMT, VCI, TCI, VHI)
+        return (dat[:, -1] != -1.0, dat[:, -len(MEAN_LABELS):])
+
+    @staticmethod
+    def _parea_filter(dat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Ignore negative values
+        return (dat[:, 0] != -1.0, dat)
+
+    def _parse_range(self, province: str, years: Tuple[int, int],
+                     vhi_type: str, filter: Callable) -> WeekRecordBatch:
+
+        """
+        Parses VHI records for years range, fetching only years which are
+        not cached yet.
+
+        :param province: province name, which was parsed from web page
+        :param years: years range (from, to)
+        :param vhi_type: type of VHI records to get (Mean or Parea)
         :param filter: function to filter data in row
-        :returns: list of WeekRecord objects
-        :rtype: List[WeekRecord]
+        :returns: batch of records sorted by year and week
+        :rtype: WeekRecordBatch
         """
 
-        ret = []
-        for ln in vhi_data[1].replace(" ", "").split("\n"):
-            record_ln = ln[:-1].split(",")
+        key = (vhi_type, self._get_province_id(province))
+
+        # Records are sliced before concurrent fetches of other keys could
+        # evict them
+        with self.ranges.lock(key), self.ranges.pinned(key):
+            if self.disk_cache and self.ranges.missing(key, years):
+                self._load_disk_ranges(province, years, vhi_type, filter)
 
-            data = filter(list(map(float, record_ln[2:])))
-            if data:
-                ret.append(WeekRecord(vhi_data[0],
-                           int(record_ln[0]), int(record_ln[1]), data))
+            for gap in self.ranges.missing(key, years):
+                self.ranges.add(key, gap, self._parse_vhi(
+                    self._get_raw_vhi_data(province, gap, vhi_type), filter,
+                    vhi_type))
 
-        return ret
+            return self.ranges.slice(key, years)
 
     @cached
     def parse_mean(self, province: str,
-                   years: Tuple[int, int]) -> List[WeekRecord]:
+                   years: Tuple[int, int]) -> WeekRecordBatch:
 
         """
-        Parses Mean records by passing filter lambda.
+        Parses Mean records by passing filter function.
+
+        Filter function ignores weeks with negative VHI and keeps all
+        index columns (SMN, SMT, VCI, TCI, VHI), so switching between
+        indices does not need another request
 
-        Filter function ignores negative values and leaves only last column
+        :raises NetworkError: request failed after retries
+        :raises ParsingError: response could not be parsed
         """
 
         try:
-            return self._parse_vhi(
-                self._get_raw_vhi_data(province, years, self.TYPE_MEAN),
-
-                lambda dat: [dat[-1]] if dat[-1] != -1.0 else None)
+            return self._parse_range(
+                province, years, self.TYPE_MEAN, self._mean_filter)
+        except NetworkError:
+            raise
         except Exception as e:
             raise ParsingError(e)
 
     @cached
     def parse_parea(self, province: str,
-                    years: Tuple[int, int]) -> List[WeekRecord]:
+                    years: Tuple[int, int]) -> WeekRecordBatch:
 
         """
         Parses Percentage of Area records by passing filter.
@@ -173,9 +452,250 @@ class Parser():
         """
 
         try:
-            return self._parse_vhi(
-                self._get_raw_vhi_data(province, years, self.TYPE_PAREA),
+            return self._parse_range(
+                province, years, self.TYPE_PAREA, self._parea_filter)
+        except NetworkError:
+            raise
+        except Exception as e:
+            raise ParsingError(e)
+
+    def _stream_vhi(self, province: str, years: Tuple[int, int],
+                    vhi_type: str, filter: Callable, batch_rows: int,
+                    chunk_size: int, cache: bool
+                    ) -> Iterator[WeekRecordBatch]:
+
+        """
+        Reads response in chunks and yields parsed rows while body is
+        still downloading.
+
+        :param province: province name, which was parsed from web page
+        :param years: years range (from, to)
+        :param vhi_type: type of VHI records to get (Mean or Parea)
+        :param filter: function to filter data in rows
+        :param batch_rows: count of rows in yielded batches
+        :param chunk_size: size of chunks read from socket
+        :param cache: store streamed records to cache after completion
+        """
+
+        province_id = self._get_province_id(province)
+        key = (vhi_type, province_id)
+
+        # Serve from memory if whole range is already cached
+        with self.ranges.pinned(key):
+            batch = None if self.ranges.missing(key, years) \
+                else self.ranges.slice(key, years)
+
+        if batch is not None:
+            for i in range(0, len(batch), batch_rows):
+                yield batch[i:i + batch_rows]
+            return
+
+        url = "%s?%s" % (self.RAW_DATA_URN,
+                         self._raw_data_query(province_id, years, vhi_type))
+
+        streamed = []
+        lines = []
+        buf = ""
+        in_pre = False
+        done = False
+
+        def flush():
+            batch = self._parse_vhi((province_id, "\n".join(lines)), filter,
+                                    vhi_type)
+            lines.clear()
+            if cache:
+                streamed.append(batch)
+            return batch
+
+        with self.scheduler.request(self.session, url, self.headers,
+                                    stream=True) as resp:
+            resp.encoding = resp.encoding or "utf-8"
+            for chunk in resp.iter_content(chunk_size,
+                                           decode_unicode=True):
+                buf += chunk
+
+                if not in_pre:
+                    idx = buf.find("<pre>")
+                    if idx < 0:
+                        # Tag could be split between chunks
+                        buf = buf[-4:]
+                        continue
+                    buf = buf[idx + 5:]
+                    in_pre = True
+
+                end = buf.find("</pre>")
+                if end >= 0:
+                    buf = buf[:end]
+                    done = True
+
+                # Leave incomplete line for the next chunk
+                cut = len(buf) if done else buf.rfind("\n") + 1
+                lines.extend(ln for ln in buf[:cut].split("\n")
+                             if ln.strip())
+                buf = buf[cut:]
+
+                if len(lines) >= batch_rows or (done and lines):
+                    yield flush()
+
+                if done:
+                    break
+
+        if not done:
+            raise ValueError("Unexpected end of VHI data")
+
+        if cache:
+            self.ranges.add(key, years, WeekRecordBatch.concat(streamed))
+
+    def stream_mean(self, province: str, years: Tuple[int, int],
+                    batch_rows: int = 512, chunk_size: int = 16 * 1024,
+                    cache: bool = False) -> Iterator[WeekRecordBatch]:
 
-                lambda dat: dat if dat[0] != -1.0 else None)
+        """
+        Streams Mean records, see parse_mean().
+
+        Yields batches of about batch_rows records as soon as they are
+        received. Memory usage does not depend on years range unless
+        cache is True.
+        """
+
+        try:
+            yield from self._stream_vhi(province, years, self.TYPE_MEAN,
+                                        self._mean_filter, batch_rows,
+                                        chunk_size, cache)
+        except NetworkError:
+            raise
+        except requests.RequestException as e:
+            # Connection broken while body is streamed
+            raise NetworkError(e)
+        except Exception as e:
+            raise ParsingError(e)
+
+    def stream_parea(self, province: str, years: Tuple[int, int],
+                     batch_rows: int = 512, chunk_size: int = 16 * 1024,
+                     cache: bool = False) -> Iterator[WeekRecordBatch]:
+
+        """
+        Streams Percentage of Area records, see parse_parea() and
+        stream_mean()
+        """
+
+        try:
+            yield from self._stream_vhi(province, years, self.TYPE_PAREA,
+                                        self._parea_filter, batch_rows,
+                                        chunk_size, cache)
+        except NetworkError:
+            raise
+        except requests.RequestException as e:
+            # Connection broken while body is streamed
+            raise NetworkError(e)
         except Exception as e:
             raise ParsingError(e)
+
+    def extremum_index(self, province: str,
+                       label: str = "VHI") -> ExtremumIndex:
+        r"""
+        Range-query index over all loaded Mean records of province
+
+        Index is cached and rebuilt only when more years are loaded, so
+        queries for any years window inside loaded ones do not fetch or
+        scan records again
+
+        :param province: province name, which was parsed from web page
+        :param label: index column, one of MEAN_LABELS
+        :rtype: ExtremumIndex
+        """
+
+        key = (self.TYPE_MEAN, self._get_province_id(province))
+
+        with self.ranges.pinned(key):
+            coverage = tuple(self.ranges.coverage(key))
+
+            def build():
+                if not coverage:
+                    return ExtremumIndex(
+                        WeekRecordBatch.empty(self.TYPE_MEAN), label)
+                return ExtremumIndex(self.ranges.slice(
+                    key, (coverage[0][0], coverage[-1][1])), label)
+
+            return self.cache.get_or_compute(
+                ("extremum_index", key, label, coverage), build)
+
+    def prefetch(self, province: str, years: Tuple[int, int],
+                 types: Iterable[str] = (TYPE_MEAN, TYPE_PAREA)
+                 ) -> Dict[str, Future]:
+
+        """
+        Starts fetching records of every type concurrently on thread pool.
+
+        Fetches are shared with parse_mean()/parse_parea() calls for the
+        same arguments, so records could be requested speculatively and
+        awaited later by either futures or parse methods.
+
+        :param province: province name, which was parsed from web page
+        :param years: years range (from, to)
+        :param types: types of VHI records (TYPE_MEAN and/or TYPE_PAREA)
+        :returns: futures of records by type
+        """
+
+        methods = {
+            self.TYPE_MEAN: self.parse_mean,
+            self.TYPE_PAREA: self.parse_parea
+        }
+
+        return {vhi_type: self.executor.submit(methods[vhi_type],
+                                               province, years)
+                for vhi_type in types}
+
+    def fetch_many(self, provinces: Iterable[str], years: Tuple[int, int],
+                   types: Iterable[str] = (TYPE_MEAN, TYPE_PAREA)
+                   ) -> Iterator[Tuple[Tuple[str, str], WeekRecordBatch]]:
+
+        """
+        Fetches records for many provinces concurrently on thread pool.
+
+        Results are yielded in order of completion. If any fetch fails,
+        pending ones are cancelled and ParsingError or NetworkError is
+        raised.
+
+        :param provinces: province names, which were parsed from web page
+        :param years: years range (from, to)
+        :param types: types of VHI records (TYPE_MEAN and/or TYPE_PAREA)
+        :returns: iterator of ((province, type), records) pairs
+        """
+
+        methods = {
+            self.TYPE_MEAN: self.parse_mean,
+            self.TYPE_PAREA: self.parse_parea
+        }
+
+        futures = {
+            self.executor.submit(methods[vhi_type], prov, years):
+                (prov, vhi_type)
+            for prov in provinces for vhi_type in types
+        }
+
+        try:
+            for fut in as_completed(futures):
+                yield (futures[fut], fut.result())
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+    def parse_many(self, provinces: Iterable[str], years: Tuple[int, int],
+                   vhi_type: str = TYPE_MEAN) -> Dict[str, WeekRecordBatch]:
+
+        """
+        Fetches records of one type for many provinces concurrently and
+        waits for all of them, see fetch_many().
+
+        :param provinces: province names, which were parsed from web page
+        :param years: years range (from, to)
+        :param vhi_type: type of VHI records (TYPE_MEAN or TYPE_PAREA)
+        :returns: records by province, in order of provinces
+        """
+
+        provinces = list(provinces)
+        fetched = {prov: records for (prov, _), records in
+                   self.fetch_many(provinces, years, (vhi_type, ))}
+
+        return {prov: fetched[prov] for prov in provinces}
@@ -1,65 +1,127 @@
-import datetime
+import numpy as np
 import pandas as pd
 
-# GTK3 Backend (Toolbar)
-from matplotlib.backends.backend_gtk3 import (
-    NavigationToolbar2GTK3 as NavigationToolbar)
-# GTK3 Backend (Canvas)
-from matplotlib.backends.backend_gtk3agg import (
-    FigureCanvasGTK3Agg as FigureCanvas)
-
 from matplotlib.figure import Figure
 
-from typing import List, Optional
-from .parser import WeekRecord
-from .util import gen_columns_labels
+from typing import List, Mapping, Optional, Union
+from .dates import week_dates
+from .drought import DroughtThresholds, classify
+from .records import WeekRecord, WeekRecordBatch, MEAN_LABELS, pad_columns
+from .util import gen_columns_labels, iso_week_index
 
 
 class MeanFrame:
-    def __new__(cls, records: List[WeekRecord]):
-        return pd.DataFrame.from_records(
-            data={
-                "YW": [datetime.date.fromisocalendar(rec.year, rec.week, 1)
-                       for rec in records],
-                "Mean": [rec.data[0] for rec in records]
-            },
-            index="YW")
+    r"""
+    DataFrame of Mean records indexed by date of week, with column per
+    index: SMN, SMT, VCI, TCI and VHI. Accessors slice already fetched
+    data, so switching between indices does not hit the network
+    """
+
+    def __new__(cls, records: Union[WeekRecordBatch, List[WeekRecord]]):
+        if not isinstance(records, WeekRecordBatch):
+            records = WeekRecordBatch.from_records(records)
+
+        # Records saved by older versions have only VHI column
+        data = pad_columns(
+            records.data.reshape(len(records), records.width),
+            len(MEAN_LABELS))
+
+        return pd.DataFrame(data, index=week_dates(records),
+                            columns=MEAN_LABELS)
 
     @classmethod
-    def get_extremums(cls, meandf: pd.DataFrame):
-        return (meandf.loc[meandf.idxmin(), "Mean"],
-                meandf.loc[meandf.idxmax(), "Mean"])
+    def smn(cls, meandf: pd.DataFrame) -> pd.Series:
+        return meandf["SMN"]
 
+    @classmethod
+    def smt(cls, meandf: pd.DataFrame) -> pd.Series:
+        return meandf["SMT"]
 
-class PareaFrame:
-    def __new__(cls, records: List[WeekRecord]):
-        pareadf = pd.DataFrame.from_records(
-            [rec.data[1:21] for rec in records],
-            columns=gen_columns_labels()
-        )
+    @classmethod
+    def vci(cls, meandf: pd.DataFrame) -> pd.Series:
+        return meandf["VCI"]
+
+    @classmethod
+    def tci(cls, meandf: pd.DataFrame) -> pd.Series:
+        return meandf["TCI"]
 
-        pareadf["YW"] = [datetime.date.fromisocalendar(rec.year, rec.week, 1)
-                         for rec in records]
+    @classmethod
+    def vhi(cls, meandf: pd.DataFrame) -> pd.Series:
+        return meandf["VHI"]
 
-        return pareadf.set_index("YW")
+    @classmethod
+    def get_extremums(cls, meandf: pd.DataFrame, index: str = "VHI"):
+        return (meandf.loc[[meandf[index].idxmin()], index],
+                meandf.loc[[meandf[index].idxmax()], index])
 
     @classmethod
-    def get_drought_years(cls, pareadf: pd.DataFrame, meandf: pd.DataFrame):
-        pareadf['percentage'] = (
-            (pareadf > 0.1) & (pareadf < 1)).sum(1)
+    def compare(cls, records: Mapping[str, WeekRecordBatch],
+                index: str = "VHI") -> pd.DataFrame:
+        r"""
+        Wide DataFrame with column of one index per province, weeks
+        missing in some provinces are NaN
+
+        :param records: Mean records by province name, order of columns
+        :param index: one of MEAN_LABELS
+        :returns: frame indexed by union of dates of weeks of records
+        """
+
+        names = list(records)
+        weeks = [iso_week_index(records[n].year, records[n].week)
+                 for n in names]
+        union = np.unique(np.concatenate(weeks)) if weeks \
+            else np.empty(0, dtype=np.int64)
+
+        data = np.full((len(union), len(names)), np.nan, dtype=np.float32)
+        for col, (name, idx) in enumerate(zip(names, weeks)):
+            data[np.searchsorted(union, idx), col] = \
+                records[name].column(index)
 
-        pareadf = pareadf[pareadf['percentage'] >= 3]
+        # Index 0 is the week starting on 1970-01-05
+        dates = pd.DatetimeIndex((union * 7 + 4).astype("datetime64[D]")
+                                 .astype("datetime64[ns]"), name="YW")
 
-        return pd.merge(meandf, pareadf, on=['YW'], how='inner')
+        return pd.DataFrame(data, index=dates, columns=names)
+
+
+class PareaFrame:
+    def __new__(cls, records: Union[WeekRecordBatch, List[WeekRecord]]):
+        if not isinstance(records, WeekRecordBatch):
+            records = WeekRecordBatch.from_records(records)
+
+        return pd.DataFrame(records.data[:, 1:21].reshape(-1, 20),
+                            index=week_dates(records),
+                            columns=gen_columns_labels())
 
     @classmethod
-    def get_extreme_drought_years(cls, pareadf: pd.DataFrame,
-                                  meandf: MeanFrame):
+    def get_drought_years(cls, pareadf: pd.DataFrame, meandf: pd.DataFrame,
+                          thresholds: DroughtThresholds = DroughtThresholds()
+                          ) -> pd.DataFrame:
+        r"""
+        Mean records of moderate drought weeks joined with their buckets,
+        see vhi.drought. Frames are not modified
+        """
+
+        return cls._join(pareadf, meandf, classify(
+            pareadf[gen_columns_labels()].to_numpy(), thresholds)[0])
 
-        pareadf["percentage"] = (pareadf <= 0.1).sum(1)
-        pareadf = pareadf[pareadf["percentage"] >= 10]
+    @classmethod
+    def get_extreme_drought_years(
+            cls, pareadf: pd.DataFrame, meandf: pd.DataFrame,
+            thresholds: DroughtThresholds = DroughtThresholds()
+    ) -> pd.DataFrame:
+        r"""
+        Mean records of extreme drought weeks joined with their buckets,
+        see vhi.drought. Frames are not modified
+        """
 
-        return pd.merge(meandf, pareadf, on=["YW"], how="inner")
+        return cls._join(pareadf, meandf, classify(
+            pareadf[gen_columns_labels()].to_numpy(), thresholds)[1])
+
+    @staticmethod
+    def _join(pareadf: pd.DataFrame, meandf: pd.DataFrame,
+              mask: np.ndarray) -> pd.DataFrame:
+        return meandf.join(pareadf[gen_columns_labels()][mask], how="inner")
 
 
 class Plotter:
@@ -77,6 +139,10 @@ class Plotter:
     }
 
     def __init__(self):
+        # Dates passed to axes (e.g. limits as datetime.date) and indexes
+        # of frames are converted by the same pandas converter
+        pd.plotting.register_matplotlib_converters()
+
         self.fig = Figure()
 
         # Create an axis
@@ -86,6 +152,12 @@ class Plotter:
         self.ax.margins(0)
 
         self.has_ranges = True
+
+        # GTK3 Backend (Canvas), imported here, so frames and the rest of
+        # package could be used without GTK
+        from matplotlib.backends.backend_gtk3agg import (
+            FigureCanvasGTK3Agg as FigureCanvas)
+
         self.canvas = FigureCanvas(self.fig)
 
     def clear(self):
@@ -123,27 +195,90 @@ class Plotter:
         self.ax.xaxis.label.set_color(fg)
         self.ax.yaxis.label.set_color(fg)
 
-    def plot(self, series: pd.Series, marker: Optional[str] = '',
-             label: Optional[str] = '',
-             show_ranges: Optional[bool] = True, **kwargs):
-        """ Plot series of data """
+    def _set_ranges(self, show_ranges: bool):
+        """ Set color ranges once per cleared canvas """
 
-        self.ax.set_ylabel('Індекс VHI')
-
-        # Set color ranges
         if show_ranges and self.has_ranges:
             self.has_ranges = False
             for k, v in self.RANGES.items():
                 self.ax.axhspan(*v, facecolor=k, alpha=0.5)
 
+    def plot(self, series: pd.Series, marker: Optional[str] = '',
+             label: Optional[str] = '',
+             show_ranges: Optional[bool] = True, draw: bool = True,
+             **kwargs):
+        """
+        Plot series of data
+
+        :param draw: redraw canvas, pass False when plotting many series
+                     and call refresh() once after the last one
+        """
+
+        self.ax.set_ylabel('Індекс VHI')
+        self._set_ranges(show_ranges)
+
+        # Dates are converted by matplotlib, not by pandas period axis,
+        # so limits could be set with dates and series with different
+        # frequencies share the axis
+        kwargs.setdefault("x_compat", True)
+
         series.plot(marker=marker, label=label, ax=self.ax, **kwargs)
         if label:
             self.ax.legend(loc="upper right")
 
         # refresh canvas
+        if draw:
+            self.canvas.draw()
+
+    def plot_frame(self, frame: pd.DataFrame,
+                   show_ranges: Optional[bool] = True, **kwargs):
+        """
+        Plot every column of frame (see MeanFrame.compare()) as line
+        labeled by column name, canvas is redrawn once
+        """
+
+        self.ax.set_ylabel('Індекс VHI')
+        self._set_ranges(show_ranges)
+
+        kwargs.setdefault("x_compat", True)
+
+        # All lines are added by one call, without drawing in between
+        frame.plot(ax=self.ax, legend=False, **kwargs)
+        if len(frame.columns):
+            # Column of legend per 10 provinces
+            ncol = (len(frame.columns) + 9) // 10
+            self.ax.legend(loc="upper right", ncol=ncol, fontsize="small")
+
         self.canvas.draw()
 
+    def plot_anomaly(self, series: pd.Series, zscore: bool = False,
+                     marker: Optional[str] = '', label: Optional[str] = '',
+                     draw: bool = True, **kwargs):
+        """
+        Plot deviation from normal (see Climatology.anomaly_series()) with
+        zero line instead of value ranges
+
+        :param zscore: series is in standard deviations
+        :param draw: redraw canvas, see plot()
+        """
+
+        self.ax.set_ylabel('Z-оцінка VHI' if zscore else 'Аномалія VHI')
+        self.ax.axhline(0, color='gray', linewidth=1)
+
+        kwargs.setdefault("x_compat", True)
+
+        series.plot(marker=marker, label=label, ax=self.ax, **kwargs)
+        if label:
+            self.ax.legend(loc="upper right")
+
+        if draw:
+            self.canvas.draw()
+
     def get_toolbar(self, win):
         """ Get toolbar widget object from matplotlib plotting GUI """
 
+        # GTK3 Backend (Toolbar)
+        from matplotlib.backends.backend_gtk3 import (
+            NavigationToolbar2GTK3 as NavigationToolbar)
+
         return NavigationToolbar(self.canvas, win)
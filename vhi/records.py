@@ -0,0 +1,251 @@
+import zlib
+import numpy as np
+
+from typing import List, NamedTuple, Iterator, Iterable, Optional, Union
+
+from .util import gen_columns_labels
+
+
+# Types of VHI Data
+TYPE_MEAN = "Mean"
+TYPE_PAREA = "VHI_Parea"
+
+# Columns of Mean records
+MEAN_LABELS = ["SMN", "SMT", "VCI", "TCI", "VHI"]
+
+
+class WeekRecord(NamedTuple):
+    """
+    NamedTuple for representation of weekly VHI records
+    """
+
+    province: int
+    year: int
+    week: int
+    data: List[float]
+
+    def __str__(self):
+        return "{},{},{},{}".format(*self[:3],
+                                    ",".join([str(i) for i in self.data]))
+
+
+def pad_columns(data: np.ndarray, width: int) -> np.ndarray:
+    r"""
+    Pad 2-D data with NaN columns on the left up to width columns
+    """
+
+    if data.shape[1] >= width:
+        return data
+
+    pad = np.full((len(data), width - data.shape[1]), np.nan,
+                  dtype=data.dtype)
+    return np.hstack([pad, data])
+
+
+class WeekRecordBatch:
+    r"""
+    Columnar representation of weekly VHI records of one type
+
+    Keeps province, year and week as int arrays and data as contiguous
+    float32 matrix with row per week. Records are sorted by
+    (province, year, week). Iterating over batch yields WeekRecord objects
+    for backward compatibility.
+    """
+
+    __slots__ = ("province", "year", "week", "data", "vhi_type", "_digest")
+
+    # NOAA publishes values with at most 3 decimals, float32 keeps ~7
+    # significant digits, so values are rounded when converted back
+    DECIMALS = 4
+
+    def __init__(self, province: np.ndarray, year: np.ndarray,
+                 week: np.ndarray, data: np.ndarray,
+                 vhi_type: Optional[str] = None):
+        r"""
+        :param province: province ids
+        :param year: years of records
+        :param week: ISO weeks of records
+        :param data: matrix with values of records, row per record
+        :param vhi_type: type of VHI records (Mean or VHI_Parea)
+        """
+
+        self.province = np.asarray(province, dtype=np.int32)
+        self.year = np.asarray(year, dtype=np.int32)
+        self.week = np.asarray(week, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.vhi_type = vhi_type
+
+        self._digest: Optional[int] = None
+
+    @classmethod
+    def empty(cls, vhi_type: Optional[str] = None,
+              width: int = 0) -> "WeekRecordBatch":
+        return cls(np.empty(0), np.empty(0), np.empty(0),
+                   np.empty((0, width)), vhi_type)
+
+    @classmethod
+    def from_records(cls, records: Iterable[WeekRecord],
+                     vhi_type: Optional[str] = None) -> "WeekRecordBatch":
+        r"""
+        Build batch from WeekRecord objects
+        """
+
+        records = list(records)
+        if not records:
+            return cls.empty(vhi_type)
+
+        return cls([rec.province for rec in records],
+                   [rec.year for rec in records],
+                   [rec.week for rec in records],
+                   [rec.data for rec in records], vhi_type)
+
+    @classmethod
+    def concat(cls, batches: Iterable["WeekRecordBatch"]
+               ) -> "WeekRecordBatch":
+        r"""
+        Concatenate batches of the same type
+
+        Narrower data is padded with NaN on the left, since columns are
+        aligned to the right as in labels (Mean records saved by older
+        versions keep only VHI column)
+        """
+
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        width = max(b.width for b in batches)
+
+        return cls(np.concatenate([b.province for b in batches]),
+                   np.concatenate([b.year for b in batches]),
+                   np.concatenate([b.week for b in batches]),
+                   np.concatenate([pad_columns(b.data, width)
+                                   for b in batches]),
+                   batches[0].vhi_type)
+
+    def __len__(self) -> int:
+        return len(self.year)
+
+    def __getitem__(self, idx: Union[slice, np.ndarray]
+                    ) -> "WeekRecordBatch":
+        r"""
+        Select records by slice, index array or boolean mask.
+        Slices are views of the same arrays
+        """
+
+        return WeekRecordBatch(self.province[idx], self.year[idx],
+                               self.week[idx], self.data[idx],
+                               self.vhi_type)
+
+    def __iter__(self) -> Iterator[WeekRecord]:
+        data = self.data.astype(np.float64).round(self.DECIMALS).tolist()
+
+        return map(WeekRecord, self.province.tolist(), self.year.tolist(),
+                   self.week.tolist(), data)
+
+    def __repr__(self) -> str:
+        return "<WeekRecordBatch type=%s records=%d width=%d>" % (
+            self.vhi_type, len(self), self.width)
+
+    @property
+    def width(self) -> int:
+        return self.data.shape[1] if self.data.ndim == 2 else 0
+
+    @property
+    def labels(self) -> List[str]:
+        r"""
+        Names of data columns
+        """
+
+        if self.vhi_type == TYPE_PAREA:
+            # First column goes before percentage buckets
+            return ["0%"] + gen_columns_labels()[:self.width - 1]
+        return MEAN_LABELS[-self.width:] if self.width else []
+
+    def column(self, label: str) -> np.ndarray:
+        r"""
+        Get data column by label without copying
+
+        :param label: one of labels, e.g. "VHI" or "0-5%"
+        """
+
+        return self.data[:, self.labels.index(label)]
+
+    @property
+    def nbytes(self) -> int:
+        return (self.province.nbytes + self.year.nbytes +
+                self.week.nbytes + self.data.nbytes)
+
+    def format_data(self, sep: str = ",") -> List[str]:
+        r"""
+        Format data rows as text, values are separated by sep
+
+        "%g" keeps 6 significant digits, which is enough for NOAA values
+        and hides float32 representation error
+        """
+
+        if not len(self):
+            return []
+
+        fmt = sep.join(["%g"] * self.width)
+        return [fmt % tuple(row) for row in self.data.tolist()]
+
+    @property
+    def digest(self) -> int:
+        r"""
+        Checksum of keys and data, computed once per batch, since
+        batches are not modified after creation
+        """
+
+        if self._digest is None:
+            self._digest = zlib.crc32(self.data.tobytes(),
+                                      zlib.crc32(self.keys().tobytes()))
+        return self._digest
+
+    def keys(self) -> np.ndarray:
+        r"""
+        Sortable (province, year, week) keys packed into int64
+        """
+
+        return ((self.province.astype(np.int64) * 10000 + self.year) * 100
+                + self.week)
+
+    def sorted(self) -> "WeekRecordBatch":
+        r"""
+        Get batch sorted by (province, year, week)
+        """
+
+        keys = self.keys()
+        if np.all(keys[:-1] <= keys[1:]):
+            return self
+        return self[np.argsort(keys, kind="stable")]
+
+    def merge(self, other: "WeekRecordBatch") -> "WeekRecordBatch":
+        r"""
+        Merge two batches without duplicates, records of other batch
+        replace records with the same key
+
+        :returns: sorted batch
+        """
+
+        if not len(self):
+            return other.sorted()
+        if not len(other):
+            return self.sorted()
+
+        both = WeekRecordBatch.concat([other, self])
+
+        # np.unique keeps first occurrence, so other takes precedence
+        _, idx = np.unique(both.keys(), return_index=True)
+        return both[idx]
+
+    def between(self, year1: int, year2: int) -> "WeekRecordBatch":
+        r"""
+        Records of years range [year1, year2] of sorted single-province
+        batch. Returns view without copying
+        """
+
+        lo, hi = np.searchsorted(self.year, (year1, year2 + 1))
+        return self[lo:hi]
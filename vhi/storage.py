@@ -1,146 +1,1009 @@
 import os
+import gzip
+import json
+import shutil
 import sqlite3
+import pathlib
 import multiprocessing as mp
-
-from typing import List, Iterable, Optional
-from time import strftime
-
-from .error import SavingError
-from .parser import Parser, WeekRecord
-from .util import gen_columns_labels, mktree
+import numpy as np
+import pandas as pd
+
+from itertools import islice
+from typing import (
+    List, Iterable, Iterator, Optional, Tuple, Dict, Callable, TextIO
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import columnar
+from .climatology import Climatology
+from .cube import VhiCube
+from .error import SavingError, StorageDbError
+from .parser import Parser
+from .records import WeekRecordBatch, pad_columns
+from .util import (
+    mktree, chunkify, merge_intervals, covered_mask, to_intervals,
+    iso_week_index, iso_week_from_index
+)
 
 
 class Storage:
     r"""
     Class with methods for storing parsed data
 
-    Able to dump data to csv files and sqlite3 database
+    Able to dump data to csv files, sqlite3 database, Parquet/Feather
+    datasets and memory-mapped cube
     """
 
-    def __init__(self, parser: Parser):
+    SCHEMA = r"""
+CREATE TABLE IF NOT EXISTS "Provinces" (
+    "province_id"	INTEGER PRIMARY KEY,
+    "name"	TEXT
+);
+
+CREATE TABLE IF NOT EXISTS "WeekRecord" (
+    "province_id"	INTEGER NOT NULL,
+    "type"	TEXT NOT NULL CHECK("type" IN ('Mean', 'Parea')),
+    "year"	INTEGER NOT NULL,
+    "week"	INTEGER NOT NULL,
+    "data"	BLOB NOT NULL,
+    PRIMARY KEY("province_id", "type", "year", "week"),
+    FOREIGN KEY("province_id") REFERENCES "Provinces"("province_id")
+) WITHOUT ROWID;
+"""
+
+    # Primary key serves per-province year range queries, this index serves
+    # year range queries over all provinces. Created after bulk insert,
+    # which is faster than updating it row by row
+    INDEXES = r"""
+CREATE INDEX IF NOT EXISTS "WeekRecord_type_year"
+    ON "WeekRecord"("type", "year", "week");
+"""
+
+    # Version 2: data is stored as float32 little-endian BLOB instead of
+    # comma-joined TEXT
+    SCHEMA_VERSION = 2
+
+    DROP_SCHEMA = r"""
+DROP TABLE IF EXISTS "WeekRecord";
+DROP TABLE IF EXISTS "Provinces";
+"""
+
+    # Existing rows are rewritten only if data has changed
+    UPSERT_RECORD = r"""
+INSERT INTO "WeekRecord" VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT("province_id", "type", "year", "week") DO UPDATE
+    SET "data" = excluded."data" WHERE "data" != excluded."data";
+"""
+
+    # Merge of staging database written by worker, see dump_todb().
+    # "WHERE true" resolves ambiguity of SELECT followed by ON CONFLICT
+    UPSERT_STAGED = r"""
+INSERT INTO "WeekRecord" SELECT * FROM "stage"."WeekRecord" WHERE true
+    ON CONFLICT("province_id", "type", "year", "week") DO UPDATE
+    SET "data" = excluded."data" WHERE "data" != excluded."data";
+"""
+
+    LATEST_RECORDS = r"""
+SELECT "province_id", "type", "year" / 100, "year" % 100 FROM (
+    SELECT "province_id", "type", MAX("year" * 100 + "week") AS "year"
+    FROM "WeekRecord" GROUP BY "province_id", "type"
+);
+"""
+
+    PRAGMAS = (
+        "journal_mode = WAL",
+        "synchronous = NORMAL",
+        "temp_store = MEMORY",
+        "cache_size = -65536"
+    )
+
+    # Pragmas of read-only connections, which do not change database file
+    READ_PRAGMAS = (
+        "temp_store = MEMORY",
+        "cache_size = -65536"
+    )
+
+    # Count of rows inserted in one transaction
+    COMMIT_ROWS = 100000
+
+    # Compression of csv files by file extension
+    CSV_FORMATS = {
+        ".csv": None,
+        ".csv.gz": "gzip",
+        ".csv.zst": "zstd"
+    }
+
+    # Rows are formatted and written by chunks through large buffer
+    CSV_CHUNK_ROWS = 8192
+    CSV_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, parser: Parser, workers: int = 1):
         r"""
-        :param fp: file path to .sqlite database file
         :param parser: Parser instance
+        :param workers: count of processes for export, if more than 1
+                        records are split by province into shards, which
+                        are serialized concurrently (csv, sqlite3, Parquet
+                        and Feather)
         """
 
-        self.conn = None
-        self.cur = None
+        self.conn: Optional[sqlite3.Connection] = None
+        self.cur: Optional[sqlite3.Cursor] = None
 
         self.parser = parser
         self.records_cache = {}
+        self.workers = workers
+
+        # Batches passed to save_to(), parser records are saved if None
+        self.batches: Optional[Iterable[WeekRecordBatch]] = None
 
-        # self._create_tables()
+        # Called with count of processed and total records while saving
+        self.progress: Optional[Callable[[int, int], None]] = None
 
     def __del__(self) -> None:
-        self.cur.close()
-        self.conn.close()
+        self._close_db()
 
-    def _sql_get_error() -> None: ...
+    def _get_batches(self) -> Iterable[WeekRecordBatch]:
+        if self.batches is not None:
+            return self.batches
+        return self.parser.batches()
 
-    def _create_tables(self) -> None:
-        week_record_tbl = r"""
-DROP TABLE IF EXISTS "WeekRecord";
-CREATE TABLE "WeekRecord" (
-    "province_id"	INTEGER NOT NULL,
-    "type"	TEXT,
-    "year"	INTEGER,
-    "week"	INTEGER,
-    "data"	TEXT,
-    FOREIGN KEY("province_id") REFERENCES "Provinces"("province_id")
-);"""
+    def _shards(self, batches: Iterable[WeekRecordBatch]
+                ) -> List[List[WeekRecordBatch]]:
+        r"""
+        Split batches by province into shards, one per worker.
+        Records of one province are never split between shards
+        """
 
-        provinces_tbl = r"""
-DROP TABLE IF EXISTS "Provinces";
-CREATE TABLE "Provinces" (
-    "province_id"	INTEGER PRIMARY KEY AUTOINCREMENT,
-    "name"	TEXT
-);"""
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return []
+
+        provinces = np.unique(np.concatenate(
+            [b.province for b in batches])).tolist()
+        n_shards = min(self.workers, len(provinces))
+
+        shards = []
+        for step in range(1, n_shards + 1):
+            chunk = chunkify(provinces, n_shards, step)
+
+            shard = [b[np.isin(b.province, chunk)] for b in batches]
+            shards.append([b for b in shard if len(b)])
+
+        return shards
+
+    @staticmethod
+    def _type_label(vhi_type: str) -> str:
+        return "Mean" if vhi_type == Parser.TYPE_MEAN else "Parea"
+
+    def _open_db(self, fp: str, readonly: bool = False) -> None:
+        if readonly:
+            # Readers never change database, e.g. do not migrate it
+            self.conn = sqlite3.connect(
+                pathlib.Path(os.path.abspath(fp)).as_uri() + "?mode=ro",
+                timeout=10, uri=True)
+        else:
+            self.conn = sqlite3.connect(fp, timeout=10)
+        self.cur = self.conn.cursor()
 
-        self.cur.execute(week_record_tbl)
-        self.cur.execute(provinces_tbl)
+        for pragma in self.READ_PRAGMAS if readonly else self.PRAGMAS:
+            self.cur.execute("PRAGMA " + pragma)
 
+    def _close_db(self) -> None:
+        if self.cur is not None:
+            self.cur.close()
+            self.cur = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _create_tables(self) -> None:
+        if self.append_mode:
+            self._migrate()
+        else:
+            self.cur.executescript(self.DROP_SCHEMA)
+
+        self.cur.executescript(self.SCHEMA)
+        self.cur.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
         self.conn.commit()
 
-    def _insert_multi(self, tbl: str, values: List[str]) -> None:
-        query = r"INSERT INTO {tbl} VALUES {values_list};".format(
-            tbl=tbl, values_list=",".join(values))
+    @staticmethod
+    def _encode_data(data: np.ndarray) -> List[bytes]:
+        r"""
+        Encode data rows as fixed-width BLOBs of float32 little-endian
+        values, which could be decoded with np.frombuffer(blob, "<f4")
+        """
+
+        if not len(data):
+            return []
+
+        buf = np.ascontiguousarray(data, dtype="<f4").tobytes()
+        rowsz = len(buf) // len(data)
+
+        return [buf[i:i + rowsz] for i in range(0, len(buf), rowsz)]
+
+    @staticmethod
+    def _decode_text(text: str) -> Optional[bytes]:
+        r"""
+        Convert data of comma-joined TEXT layout to BLOB one
+
+        :returns: BLOB, None if text is empty or malformed
+        """
+
+        try:
+            return np.array(text.split(","), dtype="<f4").tobytes()
+        except (AttributeError, ValueError):
+            return None
+
+    def _text_layout(self) -> bool:
+        r"""
+        Check if records of open database are in TEXT layout of schema
+        version 1
+        """
+
+        version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+        exists = self.cur.execute(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'WeekRecord'").fetchone()
+
+        return bool(exists) and version < self.SCHEMA_VERSION
+
+    def _migrate(self) -> int:
+        r"""
+        Convert records from comma-joined TEXT layout to BLOB one,
+        records with malformed data are skipped
+
+        :returns: count of skipped records
+        """
+
+        if not self._text_layout():
+            return 0
+
+        self.cur.executescript(r"""
+DROP INDEX IF EXISTS "WeekRecord_type_year";
+ALTER TABLE "WeekRecord" RENAME TO "WeekRecord_text";
+""")
+        self.cur.executescript(self.SCHEMA)
 
-        self.cur.execute(query)
+        reader = self.conn.cursor()
+        reader.execute('SELECT "province_id", "type", "year", "week", '
+                       '"data" FROM "WeekRecord_text"')
+
+        skipped = 0
+        while True:
+            rows = reader.fetchmany(self.COMMIT_ROWS)
+            if not rows:
+                break
+
+            converted = [row[:4] + (self._decode_text(row[4]), )
+                         for row in rows]
+            valid = [row for row in converted if row[4] is not None]
+            skipped += len(converted) - len(valid)
+
+            # Layout before rebuild of schema could have duplicates
+            self.cur.executemany(
+                'INSERT OR REPLACE INTO "WeekRecord" VALUES (?, ?, ?, ?, ?)',
+                valid)
+
+        reader.close()
+
+        self.cur.execute('DROP TABLE "WeekRecord_text"')
+        self.cur.executescript(self.INDEXES)
+        self.cur.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
         self.conn.commit()
 
-    def _insert_provinces(self) -> None:
-        self._insert_multi(
-            "Provinces",
+        return skipped
+
+    def migrate(self, fp: str) -> int:
+        r"""
+        Convert database created by older versions to current layout.
+        Done automatically when appending to database, readers only
+        decode older layout without changing database
+
+        :param fp: path to sqlite3 database
+        :returns: count of records skipped because of malformed data
+        """
+
+        try:
+            self._open_db(fp)
+            try:
+                return self._migrate()
+            finally:
+                self._close_db()
+        except sqlite3.Error as e:
+            raise StorageDbError(e)
+
+    def load_records(self, fp: str, vhi_type: str,
+                     provinces: Optional[Iterable[int]] = None,
+                     years: Optional[Tuple[int, int]] = None
+                     ) -> WeekRecordBatch:
+        r"""
+        Load records of one type from sqlite3 database
+
+        :param fp: path to sqlite3 database
+        :param vhi_type: Parser.TYPE_MEAN or Parser.TYPE_PAREA
+        :param provinces: ids of provinces, all if None
+        :param years: years range (from, to), all if None
+        :returns: batch sorted by province, year and week
+        """
+
+        query = ('SELECT "province_id", "year", "week", "data" '
+                 'FROM "WeekRecord" WHERE "type" = ?')
+        params = [self._type_label(vhi_type)]
+
+        if provinces is not None:
+            provinces = list(provinces)
+            query += ' AND "province_id" IN (%s)' % ",".join(
+                "?" * len(provinces))
+            params += provinces
+        if years is not None:
+            query += ' AND "year" BETWEEN ? AND ?'
+            params += list(years)
+
+        query += ' ORDER BY "province_id", "year", "week"'
+
+        try:
+            self._open_db(fp, readonly=True)
+            try:
+                text = self._text_layout()
+                rows = self.cur.execute(query, params).fetchall()
+            finally:
+                self._close_db()
+        except sqlite3.Error as e:
+            raise StorageDbError(e)
+
+        # Database is not migrated yet, records with malformed data are
+        # skipped as by migrate()
+        if text:
+            rows = [row for row in (row[:3] + (self._decode_text(row[3]), )
+                                    for row in rows) if row[3] is not None]
+
+        if not rows:
+            return WeekRecordBatch.empty(vhi_type)
+
+        province, year, week, blobs = zip(*rows)
+
+        sizes = np.array([len(b) for b in blobs])
+        if (sizes == sizes[0]).all():
+            data = np.frombuffer(b"".join(blobs), dtype="<f4").reshape(
+                len(blobs), -1)
+        else:
+            # Mean records saved by older versions keep only VHI column,
+            # they are aligned to the right as in WeekRecordBatch.concat()
+            width = int(sizes.max()) // 4
+            data = np.empty((len(blobs), width), dtype="<f4")
+            for size in np.unique(sizes).tolist():
+                idx = np.flatnonzero(sizes == size)
+                data[idx] = pad_columns(np.frombuffer(
+                    b"".join([blobs[i] for i in idx.tolist()]),
+                    dtype="<f4").reshape(len(idx), -1), width)
+
+        return WeekRecordBatch(province, year, week, data, vhi_type)
 
-            ['(NULL, "{name}")'.format(
-                name=prov[:prov.find(":")]) for prov in self.parser.provinces]
-        )
+    def _insert_provinces(self) -> None:
+        # Provinces of saved records, names could be unknown if selectors
+        # were not parsed
+        ids = set()
+        for batch in self._get_batches():
+            ids.update(np.unique(batch.province).tolist())
+
+        self.cur.executemany(
+            'INSERT OR IGNORE INTO "Provinces" VALUES (?, NULL)',
+            [(i, ) for i in ids])
+
+        self.cur.executemany(
+            'UPDATE "Provinces" SET "name" = ? WHERE "province_id" = ?',
+            [(prov[prov.find(":") + 1:].strip(),
+              Parser._get_province_id(prov))
+             for prov in self.parser.provinces])
+
+    @classmethod
+    def _record_rows(cls, batches: Iterable[WeekRecordBatch]
+                     ) -> Iterator[Tuple[int, str, int, int, bytes]]:
+        # Rows ordered by primary key are appended to the end of B-tree
+        batches = sorted(batches, key=lambda b: (
+            b.province[0] if len(b) else 0, cls._type_label(b.vhi_type)))
+
+        for batch in batches:
+            type_label = cls._type_label(batch.vhi_type)
+
+            yield from zip(batch.province.tolist(),
+                           [type_label] * len(batch),
+                           batch.year.tolist(), batch.week.tolist(),
+                           cls._encode_data(batch.data))
 
     def insert_records(self) -> None:
         r"""
-        Insert VHI records to database
+        Insert or update VHI records in database
 
-        :param records: List of WeekRecord with Mean/Parea VHI data
+        Rows are upserted with executemany() in transactions of
+        COMMIT_ROWS rows, so saving the same records again adds nothing
         """
-        self._insert_multi(
-            "WeekRecords",
 
-            ['({province_id}, "{type}", {year}, {week}, "{data}")'.format(
-                province_id=rec.province,
-                type="Mean" if len(rec.data) == 1 else "Parea",
-                year=rec.year,
-                week=rec.week,
-                data=",".join([str(i) for i in rec.data])
-            ) for rec in records]
-        )
+        rows = self._record_rows(self._get_batches())
+        while True:
+            chunk = list(islice(rows, self.COMMIT_ROWS))
+            if not chunk:
+                break
 
-    def dump_tocsv(self, fp: str) -> None:
+            self.cur.executemany(self.UPSERT_RECORD, chunk)
+            self.conn.commit()
+
+    @staticmethod
+    def _csv_index_path(fp: str) -> str:
+        return fp + ".idx"
+
+    def _load_csv_index(self, fp: str
+                        ) -> Tuple[Optional[List[str]],
+                                   Dict[str, List[Tuple[int, int]]]]:
         r"""
-        Dump records to csv file
+        Load sidecar index of csv file
+
+        Index holds data column labels of header and maps
+        "<type>:<province_id>" to intervals of written weeks (see
+        iso_week_index()). Missing index means nothing is known to be
+        written, labels are None for index without them
+
+        :returns: (labels, weeks)
+        """
+
+        if not os.path.exists(fp):
+            return (None, {})
+
+        try:
+            with open(self._csv_index_path(fp)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return (None, {})
+
+        # Index saved without layout is plain mapping of weeks
+        labels = index.get("labels") if "weeks" in index else None
+        weeks = index["weeks"] if "weeks" in index else index
+
+        return (labels, {k: [tuple(i) for i in v] for k, v in weeks.items()})
+
+    def _save_csv_index(self, fp: str, labels: List[str],
+                        weeks: Dict[str, List[Tuple[int, int]]]) -> None:
+        idx_fp = self._csv_index_path(fp)
+        tmp = idx_fp + ".tmp"
+
+        with open(tmp, "w") as f:
+            json.dump({"labels": labels, "weeks": weeks}, f)
+        os.replace(tmp, idx_fp)
+
+    def _new_records(self, batch: WeekRecordBatch,
+                     index: Dict[str, List[Tuple[int, int]]]
+                     ) -> WeekRecordBatch:
+        r"""
+        Filter out records already present in index and add the rest to it
+        """
+
+        type_label = self._type_label(batch.vhi_type)
+        weeks = iso_week_index(batch.year, batch.week)
+
+        mask = np.ones(len(batch), dtype=bool)
+        for province in np.unique(batch.province).tolist():
+            key = "%s:%d" % (type_label, province)
+            prov_mask = batch.province == province
+
+            new = prov_mask & ~covered_mask(weeks, index.get(key, []))
+            mask &= ~prov_mask | new
+
+            index[key] = merge_intervals(
+                index.get(key, []) + to_intervals(weeks[new]))
+
+        return batch[mask]
+
+    @classmethod
+    def _csv_format(cls, fp: str) -> Optional[str]:
+        r"""
+        Get csv extension of fp (".csv", ".csv.gz" or ".csv.zst"),
+        None if fp is not csv file
+        """
+
+        for ext in cls.CSV_FORMATS:
+            if fp.endswith(ext):
+                return ext
+        return None
+
+    def _open_csv(self, fp: str, append: bool) -> TextIO:
+        mode = "at" if append else "wt"
+        compression = self.CSV_FORMATS[self._csv_format(fp)]
+
+        if compression == "gzip":
+            # Appending adds new gzip member, which is valid gzip stream
+            return gzip.open(fp, mode, compresslevel=6, newline="\n")
+        if compression == "zstd":
+            if zstandard is None:
+                raise SavingError("Zstandard compression requires "
+                                  "zstandard package")
+            return zstandard.open(fp, mode, newline="\n")
+
+        return open(fp, mode, newline="\n", buffering=self.CSV_BUFFER_SIZE)
+
+    def _read_csv(self, fp: str) -> TextIO:
+        compression = self.CSV_FORMATS[self._csv_format(fp)]
+
+        if compression == "gzip":
+            return gzip.open(fp, "rt", newline="\n")
+        if compression == "zstd":
+            if zstandard is None:
+                raise SavingError("Zstandard compression requires "
+                                  "zstandard package")
+            return zstandard.open(fp, "rt", newline="\n")
+
+        return open(fp, newline="\n")
+
+    def _read_csv_header(self, fp: str) -> str:
+        try:
+            with self._read_csv(fp) as f:
+                return f.readline()
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            raise SavingError("Can't read header of %s: %s" % (fp, e))
+
+    @classmethod
+    def _format_csv(cls, batch: WeekRecordBatch) -> str:
+        type_label = cls._type_label(batch.vhi_type)
+
+        return "".join(["%d,%d,%d,%s,%s\n" % (province, year, week,
+                                              type_label, data)
+                        for province, year, week, data in zip(
+                            batch.province.tolist(), batch.year.tolist(),
+                            batch.week.tolist(), batch.format_data())])
+
+    @classmethod
+    def csv_path(cls, fp: str, vhi_type: str) -> str:
+        r"""
+        Path of csv file with records of one type. Mean records are saved
+        to fp, Parea ones to file with type label inserted before
+        extension: "vhi.csv.gz" -> "vhi.Parea.csv.gz"
+
+        :param fp: csv path passed to save_to()
+        :param vhi_type: Parser.TYPE_MEAN or Parser.TYPE_PAREA
+        """
+
+        if vhi_type == Parser.TYPE_MEAN:
+            return fp
+
+        ext = cls._csv_format(fp)
+        return "%s.%s%s" % (fp[:-len(ext)], cls._type_label(vhi_type), ext)
+
+    def dump_tocsv(self, fp: str) -> List[str]:
+        r"""
+        Dump records to csv files, one per type (see csv_path()),
+        compressed on the fly if fp ends with .csv.gz or .csv.zst
+
+        Rows are "province,year,week,type,<data>", where type is Mean or
+        Parea. Header names data columns of that type, e.g. SMN, SMT,
+        VCI, TCI and VHI for Mean. In append mode only records which are
+        not written yet are appended. Written weeks are tracked in sidecar
+        "<file>.idx" files
 
         :param fp: output file path
+        :returns: paths of written files
         """
         # Create folders if they are not exist
-        location = fp[:fp.rfind(os.path.sep)]
-        mktree(location)
+        location = os.path.dirname(fp)
+        if location:
+            mktree(location)
+
+        by_type: Dict[str, List[WeekRecordBatch]] = {}
+        for batch in self._get_batches():
+            by_type.setdefault(batch.vhi_type, []).append(batch)
+
+        total = sum(len(b) for batches in by_type.values() for b in batches)
+        done = 0
+
+        for vhi_type, batches in by_type.items():
+            done = self._dump_tocsv_type(self.csv_path(fp, vhi_type),
+                                         vhi_type, batches, done, total)
+
+        return [self.csv_path(fp, vhi_type) for vhi_type in by_type]
+
+    def _dump_tocsv_type(self, fp: str, vhi_type: str,
+                         batches: List[WeekRecordBatch], done: int,
+                         total: int) -> int:
+        r"""
+        Dump records of one type to csv file
+
+        :returns: count of processed records including previous types
+        """
+
+        # Narrower records (e.g. Mean saved with VHI only) are padded, so
+        # every row matches header
+        width = max(b.width for b in batches)
+        batches = [WeekRecordBatch(b.province, b.year, b.week,
+                                   pad_columns(b.data, width), vhi_type)
+                   if b.width < width else b for b in batches]
+
+        labels = batches[0].labels
 
-        with open(fp, "a" if self.append_mode else "w", newline="\n") as csv:
-            if not self.append_mode:
-                csv.write(",".join(["province", "week", "year"] +
-                                   gen_columns_labels()) + "\n")
+        append = self.append_mode and os.path.exists(fp)
+        stored, index = self._load_csv_index(fp) if append else (None, {})
 
-            for rec_list in self.parser.cache.values():
-                for rec in rec_list:
-                    print(rec)
-                    csv.write(str(rec) + "\n")
+        # Rows of other width would not match header of existing file
+        if stored is not None and stored != labels:
+            raise SavingError("%s has columns %s, records have %s"
+                              % (fp, ",".join(stored), ",".join(labels)))
 
-    def dump_todb(self, fp):
+        header = ",".join(["province", "year", "week", "type"] +
+                          labels) + "\n"
+
+        # Older versions saved records of all types to one file with header
+        # of Parea columns and index without labels
+        if append and stored is None and self._read_csv_header(fp) != header:
+            raise SavingError("%s has other columns or records of all types "
+                              "saved by older version, save to another file"
+                              % fp)
+
+        if append:
+            header = ""
+
+        if self.workers > 1:
+            done = self._dump_tocsv_shards(fp, append, header, [
+                self._new_records(b, index) for b in batches], done, total)
+            self._save_csv_index(fp, labels, index)
+            return done
+
+        with self._open_csv(fp, append) as csv:
+            csv.write(header)
+
+            for batch in batches:
+                new = self._new_records(batch, index)
+
+                for i in range(0, len(new), self.CSV_CHUNK_ROWS):
+                    csv.write(self._format_csv(
+                        new[i:i + self.CSV_CHUNK_ROWS]))
+
+                done += len(batch)
+                if self.progress is not None:
+                    self.progress(done, total)
+
+        self._save_csv_index(fp, labels, index)
+        return done
+
+    def _dump_tocsv_shards(self, fp: str, append: bool, header: str,
+                           batches: List[WeekRecordBatch], done: int,
+                           total: int) -> int:
+        r"""
+        Format and compress shards of records in worker processes and
+        append them to fp in order. Concatenated gzip members and zstd
+        frames are valid compressed streams
+
+        :returns: count of processed records including previous ones
+        """
+
+        compression = self.CSV_FORMATS[self._csv_format(fp)]
+        if compression == "zstd" and zstandard is None:
+            raise SavingError("Zstandard compression requires "
+                              "zstandard package")
+
+        jobs = [(shard, compression) for shard in self._shards(batches)]
+
+        with open(fp, "ab" if append else "wb") as csv, \
+                mp.Pool(self.workers) as pool:
+            if header:
+                csv.write(_compress_csv(header, compression))
+
+            for (shard, _), data in zip(jobs, pool.imap(_csv_shard, jobs)):
+                csv.write(data)
+
+                done += sum(len(b) for b in shard)
+                if self.progress is not None:
+                    self.progress(done, total)
+
+        return done
+
+    def _insert_shards(self, fp: str) -> None:
+        r"""
+        Write shards of records to staging databases in worker processes
+        and merge them into opened database
+        """
+
+        jobs = [("%s.shard%d" % (fp, i), shard)
+                for i, shard in enumerate(self._shards(self._get_batches()))]
+
+        try:
+            with mp.Pool(self.workers) as pool:
+                for stage_fp in pool.imap_unordered(_db_shard, jobs):
+                    self.cur.execute('ATTACH DATABASE ? AS "stage"',
+                                     (stage_fp, ))
+                    self.cur.execute(self.UPSERT_STAGED)
+                    self.conn.commit()
+                    self.cur.execute('DETACH DATABASE "stage"')
+        finally:
+            for stage_fp, _ in jobs:
+                if os.path.exists(stage_fp):
+                    os.remove(stage_fp)
+
+    def dump_todb(self, fp: str) -> None:
         r"""
         Dump records to sqlite3 database
 
         :param fp: path to sqlite3 database
         """
-        self.conn = sqlite3.connect(fp, timeout=10)
-        self.cur = self.conn.cursor()
 
-        if not self.append_mode:
+        if self.workers > 1:
+            # Batches are read twice
+            self.batches = list(self._get_batches())
+
+        self._open_db(fp)
+        try:
             self._create_tables()
 
-        self._insert_provinces()
-        self.insert_records()
+            self._insert_provinces()
+            if self.workers > 1:
+                self._insert_shards(fp)
+            else:
+                self.insert_records()
+
+            self.cur.executescript(self.INDEXES)
+            self.conn.commit()
+        finally:
+            self._close_db()
+
+    def dump_tocolumnar(self, fp: str) -> None:
+        r"""
+        Dump records to Parquet/Feather dataset partitioned by type and
+        province, see vhi.columnar
+
+        :param fp: dataset directory with .parquet or .feather extension
+        """
+
+        try:
+            if self.workers > 1:
+                # Shards are written to distinct partitions
+                if not self.append_mode and os.path.isdir(fp):
+                    shutil.rmtree(fp)
+
+                with mp.Pool(self.workers) as pool:
+                    pool.map(_columnar_shard, [
+                        (fp, shard)
+                        for shard in self._shards(self._get_batches())])
+            else:
+                columnar.write_dataset(fp, self._get_batches(),
+                                       self.append_mode)
+        except ImportError as e:
+            raise SavingError(e)
+
+    def dump_tocube(self, fp: str) -> None:
+        r"""
+        Dump records to memory-mapped cube file, see vhi.cube
+
+        In append mode records of existing cube are kept unless replaced
+
+        :param fp: path to .cube file
+        """
+
+        batches = list(self._get_batches())
 
-    def save_to(self, fp: str, append: bool) -> None:
+        if self.append_mode and os.path.exists(fp):
+            stored = {(b.vhi_type, int(b.province[0])): b
+                      for b in VhiCube(fp).to_batches()}
+
+            for batch in batches:
+                for province in np.unique(batch.province).tolist():
+                    part = batch[batch.province == province]
+                    key = (batch.vhi_type, province)
+
+                    stored[key] = stored[key].merge(part) \
+                        if key in stored else part
+
+            batches = list(stored.values())
+
+        VhiCube.build(fp, batches)
+
+    def load_csv(self, fp: str, vhi_type: str) -> WeekRecordBatch:
+        r"""
+        Load records of one type from csv file saved by save_to()
+
+        :param fp: csv path passed to save_to(), see csv_path()
+        :param vhi_type: Parser.TYPE_MEAN or Parser.TYPE_PAREA
+        :returns: batch sorted by province, year and week
+        :raises SavingError: file can't be read
+        """
+
+        fp = self.csv_path(fp, vhi_type)
+
+        try:
+            with self._read_csv(fp) as f:
+                frame = pd.read_csv(f, header=0)
+        except (OSError, EOFError, UnicodeDecodeError, ValueError) as e:
+            raise SavingError("Can't read %s: %s" % (fp, e))
+
+        return WeekRecordBatch(frame.iloc[:, 0].to_numpy(),
+                               frame.iloc[:, 1].to_numpy(),
+                               frame.iloc[:, 2].to_numpy(),
+                               frame.iloc[:, 4:].to_numpy(dtype=np.float32),
+                               vhi_type).sorted()
+
+    def load_from(self, fp: str, vhi_type: str,
+                  provinces: Optional[Iterable[int]] = None,
+                  years: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+        r"""
+        Load records of one type from Parquet/Feather dataset, reading only
+        requested provinces and years
+
+        :param fp: dataset directory with .parquet or .feather extension
+        :param vhi_type: Parser.TYPE_MEAN or Parser.TYPE_PAREA
+        :param provinces: ids of provinces, all if None
+        :param years: years range (from, to), all if None
+        :returns: DataFrame with province, year, week and data columns
+        """
+
+        return columnar.read_dataset(fp, vhi_type, provinces, years)
+
+    def latest(self, fp: str) -> Dict[Tuple[str, int], Tuple[int, int]]:
+        r"""
+        Get the latest stored week for every type and province
+
+        :param fp: path to .sqlite database or csv path passed to
+                   save_to()
+        :returns: dict which maps (type, province_id) to (year, week),
+                  type is "Mean" or "Parea"
+        """
+
+        # Csv records are in files of every type, see csv_path()
+        if self._csv_format(fp):
+            ret = {}
+            for vhi_type in (Parser.TYPE_MEAN, Parser.TYPE_PAREA):
+                _, index = self._load_csv_index(self.csv_path(fp, vhi_type))
+                for key, intervals in index.items():
+                    if intervals:
+                        ret[(key[:key.find(":")],
+                             int(key[key.find(":") + 1:]))] = \
+                            iso_week_from_index(intervals[-1][1])
+            return ret
+
+        if not os.path.exists(fp):
+            return {}
+
+        ext = os.path.splitext(fp)[1]
+
+        if ext == '.sqlite':
+            try:
+                self._open_db(fp, readonly=True)
+                try:
+                    return {(type_label, province): (year, week)
+                            for province, type_label, year, week in
+                            self.cur.execute(self.LATEST_RECORDS)}
+                finally:
+                    self._close_db()
+            except sqlite3.Error as e:
+                raise StorageDbError(e)
+
+        raise SavingError("Unsupported file type: %s" % fp)
+
+    @staticmethod
+    def _climatology_path(fp: str) -> str:
+        return fp + ".clim.npz"
+
+    def load_climatology(self, fp: str) -> Climatology:
+        r"""
+        Load climatology saved next to storage file by update_climatology()
+
+        :param fp: storage file path
+        :raises SavingError: climatology of fp was never saved
+        """
+
+        clim_fp = self._climatology_path(fp)
+        if not os.path.exists(clim_fp):
+            raise SavingError("No climatology for %s" % fp)
+        return Climatology.load(clim_fp)
+
+    def update_climatology(self, fp: str,
+                           batches: Optional[Iterable[WeekRecordBatch]] = None
+                           ) -> Climatology:
+        r"""
+        Add Mean records to climatology next to storage file and save it
+
+        Missing climatology of sqlite database or csv files is built from
+        all stored Mean records first, so only new weeks have to be passed
+        later
+
+        :param fp: storage file path
+        :param batches: new records, all parsed records if None
+        :returns: updated climatology
+        :raises SavingError: climatology of existing file of other format
+                             is missing
+        """
+
+        clim_fp = self._climatology_path(fp)
+        clim = Climatology.open(clim_fp)
+
+        # Mean records of csv are saved to fp itself, see csv_path()
+        if not os.path.exists(clim_fp) and os.path.exists(fp):
+            if self._csv_format(fp):
+                clim.update([self.load_csv(fp, Parser.TYPE_MEAN)])
+            elif os.path.splitext(fp)[1] == '.sqlite':
+                clim.update([self.load_records(fp, Parser.TYPE_MEAN)])
+            else:
+                raise SavingError("Climatology can't be built from stored "
+                                  "records of %s" % fp)
+
+        clim.update(batches if batches is not None
+                    else self.parser.batches())
+        clim.save(clim_fp)
+        return clim
+
+    def save_to(self, fp: str, append: bool,
+                batches: Optional[Iterable[WeekRecordBatch]] = None,
+                progress: Optional[Callable[[int, int], None]] = None
+                ) -> List[str]:
         """
         Save current records to file
 
         :param fp: file path
+        :param append: append to existing file instead of rewriting it
+        :param batches: records to save, all parsed records if None
+        :param progress: callback, which is called with count of processed
+                         and total records (csv only)
+        :returns: paths of written files, Parea records are saved next to
+                  csv file, see csv_path()
         """
 
         ext = os.path.splitext(fp)[1]
 
         self.append_mode = append
+        self.batches = batches
+        self.progress = progress
 
-        if ext == '.csv':
-            self.dump_tocsv(fp)
+        if self._csv_format(fp):
+            return self.dump_tocsv(fp)
         elif ext == '.sqlite':
-            self.dump_todb(fp)
+            try:
+                self.dump_todb(fp)
+            except sqlite3.Error as e:
+                raise StorageDbError(e)
+        elif ext in columnar.FORMATS:
+            self.dump_tocolumnar(fp)
+        elif ext == '.cube':
+            self.dump_tocube(fp)
+
+        return [fp]
+
+
+# Workers of parallel export, defined at module level to be picklable
+
+def _compress_csv(text: str, compression: Optional[str]) -> bytes:
+    data = text.encode()
+
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _csv_shard(job: Tuple[List[WeekRecordBatch], Optional[str]]) -> bytes:
+    batches, compression = job
+    return _compress_csv("".join([Storage._format_csv(b) for b in batches]),
+                         compression)
+
+
+def _db_shard(job: Tuple[str, List[WeekRecordBatch]]) -> str:
+    fp, batches = job
+
+    conn = sqlite3.connect(fp)
+    try:
+        # Staging database is removed after merge, durability is useless
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+
+        conn.executescript(Storage.DROP_SCHEMA + Storage.SCHEMA)
+        conn.executemany(
+            'INSERT OR REPLACE INTO "WeekRecord" VALUES (?, ?, ?, ?, ?)',
+            Storage._record_rows(batches))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return fp
+
+
+def _columnar_shard(job: Tuple[str, List[WeekRecordBatch]]) -> None:
+    fp, batches = job
+    columnar.write_dataset(fp, batches, append=True)
@@ -0,0 +1,141 @@
+r"""
+Incremental synchronization of local VHI dataset with NOAA
+
+Usage:
+    $ python3 -m vhi.sync dumps/vhi.sqlite
+    $ python3 -m vhi.sync dumps/vhi.csv --provinces 5 6 --types Mean
+"""
+
+import sys
+import datetime
+import argparse
+
+from typing import List, Optional, Iterable, Tuple
+
+from .parser import Parser
+from .storage import Storage
+from .records import WeekRecordBatch
+from .error import ParsingError, NetworkError, SavingError, StorageDbError
+
+
+def _newer_than(batch: WeekRecordBatch,
+                latest: Optional[Tuple[int, int]]) -> WeekRecordBatch:
+    if latest is None:
+        return batch
+    return batch[batch.year * 100 + batch.week > latest[0] * 100 + latest[1]]
+
+
+def sync(fp: str, provinces: Optional[Iterable[int]] = None,
+         types: Iterable[str] = (Parser.TYPE_MEAN, Parser.TYPE_PAREA),
+         since: Optional[int] = None,
+         parser: Optional[Parser] = None,
+         climatology: bool = False) -> int:
+    r"""
+    Fetch weeks newer than the latest stored ones and save them to fp
+
+    For every province and type only years starting from the latest stored
+    one are requested. Provinces without stored records are fetched
+    starting from since year (first available year by default).
+
+    :param fp: path to .sqlite database or csv path (.csv, .csv.gz,
+               .csv.zst), see Storage.csv_path()
+    :param provinces: ids of provinces to sync, all provinces if None
+    :param types: types of VHI records (Parser.TYPE_MEAN/TYPE_PAREA)
+    :param since: first year for provinces without stored records
+    :param parser: Parser instance, by default cached responses are
+                   revalidated, since NOAA updates current year weekly
+    :param climatology: add new Mean weeks to climatology saved next to
+                        fp, see Storage.update_climatology()
+    :returns: count of saved records
+    :rtype: int
+    """
+
+    parser = parser or Parser(cache_ttl=0)
+    try:
+        storage = Storage(parser)
+
+        latest = storage.latest(fp)
+
+        parser.parse_selectors()
+        if since is None:
+            since = int(parser.years[0])
+
+        wanted = set(provinces) if provinces is not None else None
+        names = [prov for prov in parser.provinces
+                 if wanted is None or Parser._get_province_id(prov) in wanted]
+
+        methods = {
+            Parser.TYPE_MEAN: parser.parse_mean,
+            Parser.TYPE_PAREA: parser.parse_parea
+        }
+
+        this_year = datetime.date.today().year
+
+        futures = {}
+        for prov in names:
+            province_id = Parser._get_province_id(prov)
+
+            for vhi_type in types:
+                last = latest.get((Storage._type_label(vhi_type), province_id))
+                first_year = last[0] if last else since
+
+                fut = parser.executor.submit(methods[vhi_type], prov,
+                                             (first_year, this_year))
+                futures[fut] = last
+
+        try:
+            batches = [_newer_than(fut.result(), last)
+                       for fut, last in futures.items()]
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+        count = sum(len(b) for b in batches)
+        if count:
+            storage.save_to(fp, True, batches)
+            if climatology:
+                storage.update_climatology(fp, batches)
+
+        return count
+    finally:
+        # Session and worker threads are released even if sync failed
+        parser.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argp = argparse.ArgumentParser(
+        prog="python3 -m vhi.sync",
+        description="Fetch only VHI weeks newer than stored in FILE")
+
+    argp.add_argument("file", help="path to .sqlite or .csv[.gz|.zst] dataset")
+    argp.add_argument("--provinces", type=int, nargs="+",
+                      help="ids of provinces to sync (default: all)")
+    argp.add_argument("--types", nargs="+",
+                      choices=(Parser.TYPE_MEAN, Parser.TYPE_PAREA),
+                      default=(Parser.TYPE_MEAN, Parser.TYPE_PAREA),
+                      help="types of VHI records (default: all)")
+    argp.add_argument("--since", type=int,
+                      help="first year for provinces missing in FILE")
+    argp.add_argument("--climatology", action="store_true",
+                      help="update climatology saved as FILE.clim.npz")
+
+    args = argp.parse_args(argv)
+
+    try:
+        count = sync(args.file, args.provinces, args.types, args.since,
+                     climatology=args.climatology)
+    except (ParsingError, NetworkError, SavingError, StorageDbError) as e:
+        print("%s: %s" % (e.__class__.__name__, e), file=sys.stderr)
+        return 1
+
+    # Parea records of csv dataset are saved to separate file
+    paths = [args.file]
+    if Storage._csv_format(args.file):
+        paths = [Storage.csv_path(args.file, t) for t in args.types]
+
+    print("%d new records saved to %s" % (count, ", ".join(paths)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
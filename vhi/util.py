@@ -1,11 +1,8 @@
 import os
-import sqlite3
-import multiprocessing as mp
+import datetime
+import numpy as np
 
-from time import strftime
-from typing import List, Iterable, Any
-
-from vhi.parser import Parser, WeekRecord
+from typing import List, Iterable, Any, Tuple
 
 
 def mktree(path: str) -> int:
@@ -17,8 +14,11 @@ def mktree(path: str) -> int:
     :returns OSError.errno or 0 in case of success
     """
 
-    current = ""
+    current = os.path.sep if os.path.isabs(path) else ""
     for d in path.split(os.path.sep):
+        if not d:
+            continue
+
         current = os.path.join(current, d)
         if not os.path.exists(current):
             try:
@@ -50,6 +50,147 @@ def chunkify(lst: List[Any], n_chunks: int, step: int) -> List[Any]:
     return lst[start:start + chunksz + tail]
 
 
+def merge_intervals(intervals: Iterable[Tuple[int, int]]
+                    ) -> List[Tuple[int, int]]:
+    r"""
+    Merge overlapping and adjacent closed integer intervals
+    Example: [(2000, 2005), (2006, 2010), (2015, 2020)] ->
+             [(2000, 2010), (2015, 2020)]
+
+    :param intervals: iterable of (start, end) pairs, ends are inclusive
+    :returns: sorted list of disjoint intervals
+    :rtype: List[Tuple[int, int]]
+    """
+
+    ret = []
+    for start, end in sorted(intervals):
+        if ret and start <= ret[-1][1] + 1:
+            ret[-1] = (ret[-1][0], max(ret[-1][1], end))
+        else:
+            ret.append((start, end))
+    return ret
+
+
+def missing_intervals(intervals: List[Tuple[int, int]],
+                      rng: Tuple[int, int]) -> List[Tuple[int, int]]:
+    r"""
+    Get parts of range which are not covered by intervals
+    Example: ([(2000, 2010)], (1995, 2012)) -> [(1995, 1999), (2011, 2012)]
+
+    :param intervals: sorted disjoint intervals, result of merge_intervals()
+    :param rng: (start, end) range, ends are inclusive
+    :returns: list of uncovered intervals
+    :rtype: List[Tuple[int, int]]
+    """
+
+    ret = []
+    start, end = rng
+    for lo, hi in intervals:
+        if hi < start:
+            continue
+        if lo > end:
+            break
+        if lo > start:
+            ret.append((start, lo - 1))
+        start = hi + 1
+
+    if start <= end:
+        ret.append((start, end))
+    return ret
+
+
+def covered_mask(values: np.ndarray,
+                 intervals: List[Tuple[int, int]]) -> np.ndarray:
+    r"""
+    Get boolean mask of values which are covered by any of intervals
+
+    :param values: integer array
+    :param intervals: sorted disjoint intervals, result of merge_intervals()
+    :returns: boolean array of the same shape as values
+    :rtype: np.ndarray
+    """
+
+    if not intervals:
+        return np.zeros(np.shape(values), dtype=bool)
+
+    bounds = np.asarray(intervals)
+
+    # Index of the last interval starting at or before value
+    idx = np.searchsorted(bounds[:, 0], values, side="right") - 1
+    return (idx >= 0) & (values <= bounds[np.maximum(idx, 0), 1])
+
+
+def to_intervals(values: np.ndarray) -> List[Tuple[int, int]]:
+    r"""
+    Compress integers into closed intervals of consecutive values
+    Example: [1, 2, 3, 7, 8] -> [(1, 3), (7, 8)]
+
+    :param values: integer array
+    :returns: sorted list of disjoint intervals
+    :rtype: List[Tuple[int, int]]
+    """
+
+    values = np.unique(values)
+    if not values.size:
+        return []
+
+    breaks = np.flatnonzero(np.diff(values) != 1)
+    starts = np.concatenate(([values[0]], values[breaks + 1]))
+    ends = np.concatenate((values[breaks], [values[-1]]))
+
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def iso_week_monday(year: np.ndarray, week: np.ndarray) -> np.ndarray:
+    r"""
+    Vectorized datetime.date.fromisocalendar(year, week, 1)
+
+    :param year: array of years
+    :param week: array of ISO weeks
+    :returns: array of Monday dates of ISO weeks
+    :rtype: np.ndarray of datetime64[D]
+    """
+
+    year = np.asarray(year, dtype=np.int64)
+    week = np.asarray(week, dtype=np.int64)
+
+    # January 4th always belongs to the first ISO week
+    jan4 = (year - 1970).astype("datetime64[Y]").astype(
+        "datetime64[D]").astype(np.int64) + 3
+
+    # 1970-01-01 was Thursday, so weekday of day d (Monday is 0) is d+3 mod 7
+    monday = jan4 - (jan4 + 3) % 7 + (week - 1) * 7
+
+    return monday.astype("datetime64[D]")
+
+
+def iso_week_index(year: np.ndarray, week: np.ndarray) -> np.ndarray:
+    r"""
+    Continuous index of ISO weeks, consecutive weeks differ by one even
+    across years. Week starting on 1970-01-05 has index 0
+
+    :param year: array of years
+    :param week: array of ISO weeks
+    :returns: int64 array
+    :rtype: np.ndarray
+    """
+
+    return (iso_week_monday(year, week).astype(np.int64) - 4) // 7
+
+
+def iso_week_from_index(idx: int) -> Tuple[int, int]:
+    r"""
+    Inverse of iso_week_index() for single value
+
+    :param idx: ISO week index
+    :returns: (year, week)
+    :rtype: Tuple[int, int]
+    """
+
+    monday = datetime.date(1970, 1, 5) + datetime.timedelta(weeks=idx)
+    return tuple(monday.isocalendar()[:2])
+
+
 def gen_columns_labels() -> List[str]:
     r"""
     Generate csv table columnn names
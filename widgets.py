@@ -29,6 +29,27 @@ class ErrorDialog(Gtk.MessageDialog):
         self.destroy()
 
 
+class InfoDialog(Gtk.MessageDialog):
+    r"""
+    Wrapper around MessageDialog to make dialog window with info message
+    """
+
+    def __init__(self, parent: Gtk.Widget,
+                 text: str, secondary_text: str):
+
+        Gtk.MessageDialog.__init__(self,
+                                   transient_for=parent,
+                                   flags=0,
+                                   message_type=Gtk.MessageType.INFO,
+                                   buttons=Gtk.ButtonsType.OK,
+                                   text=text)
+        self.format_secondary_text(secondary_text)
+        self.run()
+
+    def __del__(self):
+        self.destroy()
+
+
 class ExceptionDialog:
     r"""
     Creates ErrorDialog with message from Exception
@@ -46,7 +67,12 @@ class SaveDialog(Gtk.FileChooserDialog):
 
     FILTERS = {
         "Text CSV":         "*.csv",
+        "CSV (gzip)":       "*.csv.gz",
+        "CSV (zstd)":       "*.csv.zst",
         "SQLite database":  "*.sqlite",
+        "Parquet dataset":  "*.parquet",
+        "Feather dataset":  "*.feather",
+        "VHI data cube":    "*.cube",
         "All files":        "*"
     }
 
@@ -183,6 +209,16 @@ class ParserWindow(Gtk.Window):
         self.show_drought_years_chkbtn = builder.get_object(
             "show-drought-years-chkbtn")
 
+        # * Compare provinces CheckButton
+        self.compare_provinces_chkbtn = builder.get_object(
+            "compare-provinces-chkbtn")
+
+        # * Provinces to compare ListBox, shown in comparison mode
+        self.compare_provinces_row = builder.get_object(
+            "compare-provinces-row")
+        self.compare_provinces_listbox = builder.get_object(
+            "compare-provinces-listbox")
+
     def _on_destroy(self, widget: Gtk.Widget) -> None:
         Gtk.main_quit()
 